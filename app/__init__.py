@@ -17,6 +17,7 @@ except ImportError:
 from .core.config import config
 from .core.extensions import init_extensions
 from .core.utils.database import close_db, init_db
+from .core.utils import question_payload
 
 
 def create_app(config_name=None):
@@ -58,15 +59,22 @@ def create_app(config_name=None):
     # 注册上下文处理器
     _register_context_processors(app)
     
+    # 静态资源指纹（url_for('static') 追加 ?v=，配合长缓存）
+    _register_static_assets(app)
+    
     # 注册请求钩子
     _register_before_request(app)
     
     # 注册错误处理器
     _register_error_handlers(app)
     
+    # 注册命令行命令
+    _register_cli(app)
+    
     # 初始化数据库
     with app.app_context():
         init_db()
+    question_payload.configure(app.config['QUESTION_PAYLOAD_CACHE_SIZE'])
     
     # 启动后台任务
     _start_background_tasks(app)
@@ -83,6 +91,7 @@ def _ensure_directories(app):
         app.config['UPLOAD_FOLDER'],
         os.path.join(app.config['UPLOAD_FOLDER'], 'avatars'),
         os.path.join(app.config['UPLOAD_FOLDER'], 'question_images'),
+        os.path.join(app.config['UPLOAD_FOLDER'], 'blobs'),
         os.path.dirname(app.config['DATABASE_PATH'])
     ]
     
@@ -141,6 +150,12 @@ def _register_context_processors(app):
         }
 
 
+def _register_static_assets(app):
+    """注册静态资源指纹与缓存头"""
+    from .core.utils.file_serving import init_static_fingerprint
+    init_static_fingerprint(app)
+
+
 def _register_before_request(app):
     """注册请求前钩子"""
     from flask import request, session, redirect, url_for, jsonify
@@ -261,12 +276,14 @@ def _register_before_request(app):
                 # 3. /admin/questions 及其子路径（包括 /admin/questions/import, /admin/questions/export 等）
                 # 4. /admin/api/questions 相关路径（通过路径包含判断）
                 # 5. /admin/download_template（Excel模板下载）
+                # 6. /admin/api/jobs 题库导入/导出作业
                 is_subject_admin_path = (
                     path.startswith('/admin/subjects') or
                     path.startswith('/admin/api/subjects') or
                     path.startswith('/admin/questions') or
                     path == '/admin/types' or  # 题型列表API
                     path == '/admin/download_template' or
+                    path.startswith('/admin/api/jobs') or  # 导入/导出后台作业（接口内按创建人校验）
                     '/api/subjects' in path or
                     '/api/questions' in path
                 )
@@ -375,7 +392,18 @@ def _register_error_handlers(app):
     register_error_handlers(app)
 
 
+def _register_cli(app):
+    """注册命令行命令"""
+    from .core.cli import register_cli
+    register_cli(app)
+
+
 def _start_background_tasks(app):
     """启动后台任务"""
+    if not app.config.get('BACKGROUND_TASKS_ENABLED', True):
+        return
     from .core.tasks import start_background_tasks
+    from .core.jobs import job_manager
     start_background_tasks(app)
+    # 后台作业：恢复中断/排队中的作业（工作线程池在首次提交时启动）
+    job_manager.init_app(app)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+命令行工具（flask <group> <command>）
+
+用法示例：
+    flask --app run.py uploads gc --dry-run
+    flask --app run.py perf startup --runs 3
+    flask --app run.py metrics rebuild
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from typing import Any, Dict, List
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+uploads_cli = AppGroup('uploads', help='上传文件存储维护')
+
+
+def _open_db() -> sqlite3.Connection:
+    """命令行中使用独立连接（不依赖请求上下文）"""
+    conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@uploads_cli.command('gc')
+@click.option('--grace-hours', default=24, show_default=True, type=int,
+              help='宽限期（小时），未超过宽限期的无引用文件不会删除')
+@click.option('--no-recount', is_flag=True, default=False,
+              help='不按业务表重算引用计数，直接使用 upload_blobs.ref_count')
+@click.option('--dry-run', is_flag=True, default=False, help='只统计，不删除')
+def uploads_gc(grace_hours, no_recount, dry_run):
+    """清理未被引用的上传文件（内容寻址 blob）"""
+    from app.core.utils import blob_store
+
+    conn = _open_db()
+    try:
+        result = blob_store.collect_garbage(
+            conn,
+            current_app.config['UPLOAD_FOLDER'],
+            grace_seconds=max(grace_hours, 0) * 3600,
+            recount=not no_recount,
+            dry_run=dry_run,
+            archive_db_path=current_app.config.get('CHAT_ARCHIVE_DB_PATH'),
+        )
+    finally:
+        conn.close()
+
+    prefix = '[DRY-RUN] ' if dry_run else ''
+    if result['referenced'] is not None:
+        click.echo(f"{prefix}仍被引用的文件: {result['referenced']}")
+    click.echo(
+        f"{prefix}可回收文件: {result['deleted']}，"
+        f"释放空间: {result['freed_bytes'] / 1024 / 1024:.2f} MB，"
+        f"残留临时文件: {result['stray_files']}"
+    )
+
+
+chat_cli = AppGroup('chat', help='聊天数据维护')
+
+
+@chat_cli.command('archive')
+@click.option('--no-pause', is_flag=True, default=False, help='批次之间不休眠（维护窗口内手动执行时使用）')
+def chat_archive(no_pause):
+    """按保留策略归档/清理聊天消息"""
+    from app.modules.chat.services.retention_service import ChatRetentionService
+
+    result = ChatRetentionService.run(
+        current_app.config['DATABASE_PATH'],
+        current_app.config['CHAT_ARCHIVE_DB_PATH'],
+        current_app.config.get('CHAT_RETENTION_POLICIES') or {},
+        upload_root=current_app.config.get('UPLOAD_FOLDER'),
+        batch_size=int(current_app.config.get('CHAT_RETENTION_BATCH_SIZE', 500)),
+        pause=0.0 if no_pause else float(current_app.config.get('CHAT_RETENTION_BATCH_PAUSE', 0.2)),
+    )
+    click.echo(
+        f"归档会话: {result['conversations']}，归档消息: {result['archived']}，"
+        f"清理归档消息: {result['purged']}"
+    )
+
+
+metrics_cli = AppGroup('metrics', help='管理后台统计汇总维护')
+
+
+@metrics_cli.command('rebuild')
+@click.option('--metric', 'metric_names', multiple=True, help='只重建指定指标（可重复），默认重建全部')
+def metrics_rebuild(metric_names):
+    """按源表全量重建统计汇总（metric_daily / metric_daily_distinct）"""
+    from app.core.utils.database import METRIC_SOURCES, METRIC_DISTINCT_SOURCES, rebuild_metric
+
+    names = list(metric_names) or [m[0] for m in METRIC_SOURCES + METRIC_DISTINCT_SOURCES]
+    conn = _open_db()
+    try:
+        for name in names:
+            try:
+                rebuild_metric(conn, name)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+            except sqlite3.OperationalError as e:
+                # 源表不存在（对应模块未启用）
+                click.echo(f'跳过 {name}: {e}')
+                continue
+            conn.commit()
+            click.echo(f'已重建 {name}')
+    finally:
+        conn.close()
+
+
+questions_cli = AppGroup('questions', help='题库数据维护')
+
+
+@questions_cli.command('warm-payloads')
+def questions_warm_payloads():
+    """为尚无载荷缓存的题目批量生成载荷（question_payloads）"""
+    from app.core.utils import question_payload
+
+    conn = _open_db()
+    try:
+        built = question_payload.warm(conn)
+    finally:
+        conn.close()
+    click.echo(f'已生成题目载荷: {built}')
+
+
+answers_cli = AppGroup('answers', help='答题记录维护')
+
+
+@answers_cli.command('archive')
+@click.option('--no-pause', is_flag=True, default=False, help='批次之间不休眠（维护窗口内手动执行时使用）')
+def answers_archive(no_pause):
+    """把超出热数据期的答题事件移入按月分表的归档库"""
+    from app.modules.quiz.services.answer_archive_service import AnswerEventArchiveService
+
+    result = AnswerEventArchiveService.run(
+        current_app.config['DATABASE_PATH'],
+        current_app.config['ANSWER_EVENTS_ARCHIVE_DB_PATH'],
+        int(current_app.config.get('ANSWER_EVENTS_HOT_MONTHS', 6)),
+        batch_size=int(current_app.config.get('ANSWER_EVENTS_ARCHIVE_BATCH_SIZE', 1000)),
+        pause=0.0 if no_pause else float(current_app.config.get('ANSWER_EVENTS_ARCHIVE_BATCH_PAUSE', 0.2)),
+    )
+    click.echo(
+        f"归档答题事件: {result['archived']}，清理已删除用户的归档事件: {result['purged']}，"
+        f"归档分表: {result['partitions']}"
+    )
+
+
+stats_cli = AppGroup('stats', help='用户学习统计维护')
+
+
+@stats_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='只重建指定用户，默认重建全部用户')
+def stats_rebuild(user_id):
+    """按源表重建用户学习统计（user_stats / 按科目、题型 / 每日作答次数）"""
+    from app.core.utils.database import rebuild_user_stats
+
+    conn = _open_db()
+    try:
+        rebuild_user_stats(conn, user_id)
+        conn.commit()
+    finally:
+        conn.close()
+    click.echo(f'已重建用户学习统计: {"用户 " + str(user_id) if user_id is not None else "全部用户"}')
+
+
+perf_cli = AppGroup('perf', help='性能检查')
+
+# 子进程中执行的启动测量脚本：创建应用后输出耗时、内存峰值与已加载的延迟导入模块
+# 数据库指向临时目录（不在配置的数据库上执行迁移），并关闭后台任务与作业恢复
+_STARTUP_PROBE = """
+import json, os, resource, sys, tempfile, time
+t0 = time.perf_counter()
+from app import create_app
+from app.core.config import config
+with tempfile.TemporaryDirectory() as tmp:
+    probe_config = config[sys.argv[1]]
+    probe_config.DATABASE_PATH = os.path.join(tmp, 'probe.db')
+    probe_config.CHAT_ARCHIVE_DB_PATH = os.path.join(tmp, 'chat_archive.db')
+    probe_config.ANSWER_EVENTS_ARCHIVE_DB_PATH = os.path.join(tmp, 'answer_events_archive.db')
+    probe_config.BACKGROUND_TASKS_ENABLED = False
+    create_app(sys.argv[1])
+    elapsed = time.perf_counter() - t0
+from app.core.utils.lazy_import import LAZY_MODULES
+print('__PERF__' + json.dumps({
+    'elapsed_ms': elapsed * 1000,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'eager_lazy_modules': sorted(m for m in LAZY_MODULES if m in sys.modules),
+}))
+"""
+
+
+def _parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """解析 -X importtime 输出，只保留顶层导入（按累计耗时排序）"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        head, cumulative_us, name = line.split('|', 2)
+        self_us = head.split(':', 1)[1]
+        # 缩进表示被其他模块间接导入
+        if name.startswith('  '):
+            continue
+        entries.append({
+            'name': name.strip(),
+            'self_ms': int(self_us.strip()) / 1000,
+            'cumulative_ms': int(cumulative_us.strip()) / 1000,
+        })
+    entries.sort(key=lambda e: e['cumulative_ms'], reverse=True)
+    return entries
+
+
+def _run_startup_probe(config_name: str) -> Dict[str, Any]:
+    """在新的解释器中创建一次应用，返回测量结果与导入耗时明细"""
+    project_root = os.path.dirname(current_app.root_path)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _STARTUP_PROBE, config_name],
+        cwd=project_root, capture_output=True, text=True, timeout=300,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    marker = next((line for line in proc.stdout.splitlines() if line.startswith('__PERF__')), None)
+    if proc.returncode != 0 or marker is None:
+        tail = '\n'.join(proc.stderr.splitlines()[-20:])
+        raise click.ClickException(f'启动测量失败（退出码 {proc.returncode}）：\n{tail}')
+    result = json.loads(marker[len('__PERF__'):])
+    result['imports'] = _parse_importtime(proc.stderr)
+    return result
+
+
+@perf_cli.command('startup')
+@click.option('--config', 'config_name', default=None,
+              help='应用配置名（默认取 FLASK_ENV，未设置时为 production）')
+@click.option('--runs', default=3, show_default=True, type=int, help='测量次数（取耗时最短的一次）')
+@click.option('--top', default=15, show_default=True, type=int, help='显示导入耗时最多的顶层模块数')
+@click.option('--budget-ms', default=None, type=float, help='启动耗时预算（毫秒），默认 PERF_STARTUP_BUDGET_MS')
+@click.option('--budget-rss-mb', default=None, type=float,
+              help='启动后内存峰值预算（MB），默认 PERF_STARTUP_RSS_BUDGET_MB')
+def perf_startup(config_name, runs, top, budget_ms, budget_rss_mb):
+    """测量 worker 冷启动（导入 + create_app）耗时与内存，超出预算时以非零状态退出"""
+    config_name = config_name or os.environ.get('FLASK_ENV') or 'production'
+    if budget_ms is None:
+        budget_ms = float(current_app.config.get('PERF_STARTUP_BUDGET_MS', 1500))
+    if budget_rss_mb is None:
+        budget_rss_mb = float(current_app.config.get('PERF_STARTUP_RSS_BUDGET_MB', 120))
+
+    results = [_run_startup_probe(config_name) for _ in range(max(runs, 1))]
+    best = min(results, key=lambda r: r['elapsed_ms'])
+    rss_mb = best['max_rss_kb'] / 1024
+
+    timings = ', '.join(f"{r['elapsed_ms']:.0f}" for r in results)
+    click.echo(f'配置: {config_name}，测量 {len(results)} 次，耗时 {timings} ms')
+    click.echo('导入耗时最多的顶层模块（-X importtime，累计）:')
+    for entry in best['imports'][:max(top, 0)]:
+        click.echo(f"  {entry['cumulative_ms']:8.1f} ms  {entry['name']}")
+    click.echo(f"已加载模块数: {best['modules']}")
+
+    failures = []
+    if best['elapsed_ms'] > budget_ms:
+        failures.append(f"启动耗时 {best['elapsed_ms']:.0f} ms 超出预算 {budget_ms:.0f} ms")
+    if rss_mb > budget_rss_mb:
+        failures.append(f'内存峰值 {rss_mb:.1f} MB 超出预算 {budget_rss_mb:.0f} MB')
+    if best['eager_lazy_modules']:
+        failures.append(f"延迟导入的依赖在启动时被导入: {', '.join(best['eager_lazy_modules'])}")
+
+    click.echo(f"启动耗时: {best['elapsed_ms']:.0f} ms（预算 {budget_ms:.0f} ms），"
+               f'内存峰值: {rss_mb:.1f} MB（预算 {budget_rss_mb:.0f} MB）')
+    if failures:
+        for failure in failures:
+            click.echo(f'[FAIL] {failure}', err=True)
+        sys.exit(1)
+    click.echo('[OK] 启动检查通过')
+
+
+def register_cli(app: Flask) -> None:
+    """
+    注册命令行命令
+
+    Args:
+        app: Flask应用实例
+    """
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(chat_cli)
+    app.cli.add_command(perf_cli)
+    app.cli.add_command(metrics_cli)
+    app.cli.add_command(questions_cli)
+    app.cli.add_command(answers_cli)
+    app.cli.add_command(stats_cli)
@@ -24,6 +24,68 @@ class Config:
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
+    # 上传文件分发配置
+    # 内容寻址文件（blobs/<sha256>.<ext>）永不变化，可长期强缓存
+    UPLOAD_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    # Nginx 内部 location 前缀（如 /_protected_uploads/），设置后使用 X-Accel-Redirect 交给 Nginx 发送文件
+    UPLOAD_ACCEL_REDIRECT_PREFIX = os.environ.get('UPLOAD_ACCEL_REDIRECT_PREFIX') or ''
+    # Apache/lighttpd 等支持 X-Sendfile 的前端（Flask 内置开关）
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() in ['true', 'on', '1']
+    # /static 资源指纹（?v=<hash>）命中时的缓存时长
+    STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    
+    # 聊天消息归档配置
+    # 超过保留期、且所有成员均已读的消息按批从 chat_messages 移入独立归档库；
+    # 每个会话始终保留最近 keep_recent 条在热表中（会话列表“最后一条消息”与已读游标依赖它）
+    CHAT_RETENTION_ENABLED = os.environ.get('CHAT_RETENTION_ENABLED', 'true').lower() in ['true', 'on', '1']
+    CHAT_ARCHIVE_DB_PATH = os.path.join(BASE_DIR, 'instance', 'chat_archive.db')
+    CHAT_RETENTION_POLICIES = {
+        # archive_after_days: 归档阈值（天）；None 表示不归档
+        # keep_recent: 每个会话热表至少保留的最近消息数（>=1）
+        # compress: 归档内容是否 gzip 压缩
+        # purge_after_days: 归档库中超过该天数的消息彻底删除（并清理其上传文件）；None 表示永久保留
+        'direct': {'archive_after_days': 180, 'keep_recent': 200, 'compress': True, 'purge_after_days': None},
+        'default': {'archive_after_days': 365, 'keep_recent': 500, 'compress': True, 'purge_after_days': None},
+    }
+    CHAT_RETENTION_BATCH_SIZE = 500
+    CHAT_RETENTION_BATCH_PAUSE = 0.2  # 每批之间休眠（秒），避免长时间占用写锁
+    CHAT_RETENTION_INTERVAL_HOURS = 24
+    
+    # 答题事件归档配置
+    # answer_events 只追加；早于最近 ANSWER_EVENTS_HOT_MONTHS 个自然月（含当月）的事件按批移入独立归档库，
+    # 按作答月份分表（answer_events_YYYYMM）。user_answers（每题最新作答）不受影响
+    ANSWER_EVENTS_ARCHIVE_ENABLED = os.environ.get('ANSWER_EVENTS_ARCHIVE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    ANSWER_EVENTS_ARCHIVE_DB_PATH = os.path.join(BASE_DIR, 'instance', 'answer_events_archive.db')
+    ANSWER_EVENTS_HOT_MONTHS = 6
+    ANSWER_EVENTS_ARCHIVE_BATCH_SIZE = 1000
+    ANSWER_EVENTS_ARCHIVE_BATCH_PAUSE = 0.2  # 每批之间休眠（秒），避免长时间占用写锁
+    ANSWER_EVENTS_ARCHIVE_INTERVAL_HOURS = 24
+    
+    # 是否在 create_app 时启动后台任务并恢复排队中的后台作业（一次性脚本/启动测量中关闭）
+    BACKGROUND_TASKS_ENABLED = os.environ.get('BACKGROUND_TASKS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    
+    # 后台作业配置（题库导入/导出）
+    # 上传文件与导出结果存放目录
+    JOB_STORAGE_DIR = os.path.join(BASE_DIR, 'instance', 'jobs')
+    # 每个进程的作业工作线程数
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    # 运行中作业超过该时间没有进度更新视为进程已中断（可重试并从断点继续）
+    JOB_STALE_SECONDS = 600
+    # 已结束作业的上传文件/导出结果保留天数
+    JOB_RETENTION_DAYS = 7
+    
+    # 题目载荷缓存：每个进程内 LRU 缓存的题目数（0 表示只使用数据库中的 question_payloads）
+    QUESTION_PAYLOAD_CACHE_SIZE = 5000
+    # 刷题限制配置（system_config）的进程内缓存秒数；本进程修改配置时立即失效，其它进程最多延迟该时间
+    QUIZ_LIMIT_CONFIG_TTL = 30
+    # 学习统计的日期按该时区划分（相对 UTC 的小时数；数据库时间均为 UTC）。
+    # 影响每日作答次数、学习日历与连续学习天数；修改后下次启动时按热表答题事件重算
+    STATS_UTC_OFFSET_HOURS = int(os.environ.get('STATS_UTC_OFFSET_HOURS') or 8)
+    
+    # 启动性能预算（flask perf startup 检查：导入 + create_app 耗时、进程内存峰值）
+    PERF_STARTUP_BUDGET_MS = 1000
+    PERF_STARTUP_RSS_BUDGET_MB = 80
+    
     # 日志配置
     LOG_DIR = os.path.join(BASE_DIR, 'logs')
     LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+后台作业模块
+耗时的导入/导出在工作线程池中执行，请求只负责落盘上传文件并创建作业记录（jobs 表）
+
+说明：
+- 作业状态：queued -> running -> succeeded / failed / cancelled
+- 认领作业使用条件 UPDATE（status='queued' 才能改为 running），多进程部署下同一作业只会执行一次
+- 处理函数通过 JobContext 上报进度/断点；取消为协作式（处理函数在块边界检查）
+- 失败或取消的作业可重试，导入类作业从上次提交的断点继续
+- 运行中但长时间没有进度更新的作业视为进程中断，标记为失败以便重试
+"""
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import Flask
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# jobs.errors 中最多保存的错误条数（完整数量见 error_count）
+MAX_STORED_ERRORS = 200
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class JobCancelled(Exception):
+    """处理函数在检查点发现作业已被请求取消"""
+
+
+class JobContext:
+    """传给作业处理函数的上下文（独立数据库连接 + 进度上报）"""
+
+    def __init__(self, manager: 'JobManager', conn: sqlite3.Connection, job: Dict[str, Any]):
+        self.manager = manager
+        self.conn = conn
+        self.job = job
+        self.job_id = job['id']
+        self.params: Dict[str, Any] = json.loads(job['params']) if job.get('params') else {}
+        self.file_path: Optional[str] = job.get('file_path')
+        self.checkpoint: int = int(job.get('checkpoint') or 0)
+
+    def should_stop(self) -> bool:
+        """是否已请求取消"""
+        row = self.conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def check_cancelled(self) -> None:
+        if self.should_stop():
+            raise JobCancelled()
+
+    def report(self, processed: Optional[int] = None, success_count: Optional[int] = None,
+               error_count: Optional[int] = None, errors: Optional[List[str]] = None,
+               total: Optional[int] = None, checkpoint: Optional[int] = None,
+               commit: bool = True) -> None:
+        """
+        上报进度（同时作为心跳刷新 updated_at）
+
+        commit=False 时不提交，用于与业务数据放在同一事务中原子记录断点
+        """
+        fields = {
+            'processed': processed,
+            'success_count': success_count,
+            'error_count': error_count,
+            'total': total,
+            'checkpoint': checkpoint,
+        }
+        sets = [f'{name} = ?' for name, value in fields.items() if value is not None]
+        params: List[Any] = [value for value in fields.values() if value is not None]
+        if errors is not None:
+            sets.append('errors = ?')
+            params.append(json.dumps(errors[:MAX_STORED_ERRORS], ensure_ascii=False))
+        sets.append('updated_at = CURRENT_TIMESTAMP')
+        self.conn.execute(f"UPDATE jobs SET {', '.join(sets)} WHERE id = ?", params + [self.job_id])
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+        if commit:
+            self.conn.commit()
+
+    def sidecar_path(self, suffix: str) -> Optional[str]:
+        """上传文件的附属文件路径（<file_path>.<suffix>，如续导清单），随上传文件一起过期清理"""
+        return f'{self.file_path}.{suffix}' if self.file_path else None
+
+    def result_path(self, ext: str) -> str:
+        """导出结果文件路径（<JOB_STORAGE_DIR>/results/<job_id>.<ext>）"""
+        return os.path.join(self.manager.storage_dir('results'), f'{self.job_id}.{ext}')
+
+
+JobHandler = Callable[[JobContext], Optional[Dict[str, Any]]]
+
+
+class JobManager:
+    """后台作业管理器（每个进程一个工作线程池，首次提交时启动）"""
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.app = app
+        self._handlers: Dict[str, JobHandler] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 创建线程池的进程ID：gunicorn preload_app 时在 master 中恢复作业，fork 出的 worker
+        # 继承的线程池没有工作线程，需按进程重建
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """
+        初始化应用，并恢复中断/排队中的作业
+
+        Args:
+            app: Flask应用实例
+        """
+        self.app = app
+        try:
+            self.recover()
+        except Exception as e:
+            app.logger.warning(f'恢复后台作业失败: {e}')
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """注册作业处理函数"""
+        self._handlers[kind] = handler
+
+    def storage_dir(self, sub: str) -> str:
+        path = os.path.join(self.app.config['JOB_STORAGE_DIR'], sub)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.app.config['DATABASE_PATH'], timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    # ---------- 请求侧：创建/查询/取消/重试 ----------
+
+    def store_upload(self, file_storage, ext: str) -> Tuple[str, str]:
+        """
+        将上传文件流式保存到作业目录（边写边算 sha256，文件以哈希命名）
+
+        Returns:
+            (文件路径, sha256)
+        """
+        upload_dir = self.storage_dir('uploads')
+        tmp_path = os.path.join(upload_dir, f'.{uuid.uuid4().hex}.tmp')
+        hasher = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as out:
+                for chunk in iter(lambda: file_storage.stream.read(_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    out.write(chunk)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        sha256 = hasher.hexdigest()
+        path = os.path.join(upload_dir, f'{sha256}.{ext}')
+        os.replace(tmp_path, path)
+        return path, sha256
+
+    def find_by_dedupe_key(self, conn, dedupe_key: str, created_by: Optional[int]) -> Optional[Dict[str, Any]]:
+        """
+        按去重键查找该用户最近的作业（同一用户重复提交同一文件时复用）
+
+        只复用本人创建的作业：其他人的作业既无权查看，重试时也会以原创建者身份执行
+        """
+        row = conn.execute(
+            'SELECT * FROM jobs WHERE dedupe_key = ? AND created_by IS ? ORDER BY id DESC LIMIT 1',
+            (dedupe_key, created_by)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def create(self, conn, kind: str, created_by: Optional[int], params: Optional[Dict[str, Any]] = None,
+               file_path: Optional[str] = None, file_name: Optional[str] = None,
+               dedupe_key: Optional[str] = None) -> int:
+        """
+        创建作业记录（调用方提交事务后再调用 submit）
+
+        Returns:
+            作业ID
+        """
+        if kind not in self._handlers:
+            raise ValueError(f'未知的作业类型: {kind}')
+        cursor = conn.execute(
+            '''
+            INSERT INTO jobs (kind, status, dedupe_key, params, file_path, file_name, created_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (kind, JOB_QUEUED, dedupe_key, json.dumps(params or {}, ensure_ascii=False),
+             file_path, file_name, created_by)
+        )
+        return cursor.lastrowid
+
+    def get(self, conn, job_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def cancel(self, conn, job_id: int) -> Optional[str]:
+        """
+        取消作业：排队中的直接取消；运行中的设置取消标记，由处理函数在检查点退出
+
+        Returns:
+            取消后的状态；作业不存在返回 None
+        """
+        conn.execute(
+            '''
+            UPDATE jobs SET status = ?, finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+            ''',
+            (JOB_CANCELLED, job_id, JOB_QUEUED)
+        )
+        conn.execute(
+            'UPDATE jobs SET cancel_requested = 1, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?',
+            (job_id, JOB_RUNNING)
+        )
+        conn.commit()
+        row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def retry(self, conn, job_id: int) -> bool:
+        """
+        重试失败/已取消的作业（保留断点，导入类作业从断点继续）
+
+        Returns:
+            是否已重新排队
+        """
+        cursor = conn.execute(
+            '''
+            UPDATE jobs
+            SET status = ?, cancel_requested = 0, message = NULL, finished_at = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN (?, ?)
+            ''',
+            (JOB_QUEUED, job_id, JOB_FAILED, JOB_CANCELLED)
+        )
+        conn.commit()
+        if cursor.rowcount != 1:
+            return False
+        self.submit(job_id)
+        return True
+
+    # ---------- 工作线程 ----------
+
+    def submit(self, job_id: int) -> None:
+        """把作业交给本进程的工作线程池"""
+        with self._lock:
+            pid = os.getpid()
+            if self._executor is None or self._executor_pid != pid:
+                workers = max(int(self.app.config.get('JOB_WORKERS', 2)), 1)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+                self._executor_pid = pid
+            self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: int) -> None:
+        with self.app.app_context():
+            conn = self._connect()
+            try:
+                self._execute(conn, job_id)
+            except Exception as e:
+                self.app.logger.error(f'后台作业 {job_id} 执行异常: {e}', exc_info=True)
+            finally:
+                conn.close()
+
+    def _execute(self, conn: sqlite3.Connection, job_id: int) -> None:
+        # 认领：只有 queued 状态的作业能被一个工作线程改为 running
+        cursor = conn.execute(
+            '''
+            UPDATE jobs
+            SET status = ?, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+            ''',
+            (JOB_RUNNING, job_id, JOB_QUEUED)
+        )
+        conn.commit()
+        if cursor.rowcount != 1:
+            return
+
+        job = dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+        handler = self._handlers.get(job['kind'])
+        ctx = JobContext(self, conn, job)
+        try:
+            if handler is None:
+                raise ValueError(f"未知的作业类型: {job['kind']}")
+            result = handler(ctx) or {}
+        except JobCancelled:
+            conn.rollback()
+            self._finish(conn, job_id, JOB_CANCELLED, message='作业已取消')
+            return
+        except ValueError as e:
+            # 业务校验失败（文件格式不符、没有可导出的数据等），不记录堆栈
+            conn.rollback()
+            self.app.logger.warning(f"后台作业 {job_id}（{job['kind']}）失败: {e}")
+            self._finish(conn, job_id, JOB_FAILED, message=str(e))
+            return
+        except Exception as e:
+            conn.rollback()
+            self.app.logger.error(f"后台作业 {job_id}（{job['kind']}）失败: {e}", exc_info=True)
+            self._finish(conn, job_id, JOB_FAILED, message=str(e))
+            return
+
+        self._finish(
+            conn, job_id, JOB_SUCCEEDED,
+            message=result.pop('message', None),
+            result_path=result.pop('result_path', None),
+            result=result
+        )
+
+    def _finish(self, conn: sqlite3.Connection, job_id: int, status: str, message: Optional[str] = None,
+                result_path: Optional[str] = None, result: Optional[Dict[str, Any]] = None) -> None:
+        conn.execute(
+            '''
+            UPDATE jobs
+            SET status = ?, message = ?, result_path = COALESCE(?, result_path),
+                result = COALESCE(?, result), cancel_requested = 0,
+                finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''',
+            (status, message, result_path,
+             json.dumps(result, ensure_ascii=False) if result is not None else None, job_id)
+        )
+        conn.commit()
+
+    # ---------- 维护 ----------
+
+    def recover(self) -> None:
+        """把心跳超时的运行中作业标记为失败，并重新提交排队中的作业"""
+        stale_seconds = int(self.app.config.get('JOB_STALE_SECONDS', 600))
+        conn = self._connect()
+        try:
+            conn.execute(
+                '''
+                UPDATE jobs
+                SET status = ?, message = '作业中断（进程退出或超时），可重试并从断点继续',
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE status = ? AND updated_at < datetime('now', ?)
+                ''',
+                (JOB_FAILED, JOB_RUNNING, f'-{stale_seconds} seconds')
+            )
+            conn.commit()
+            queued = [row[0] for row in conn.execute('SELECT id FROM jobs WHERE status = ? ORDER BY id', (JOB_QUEUED,))]
+        finally:
+            conn.close()
+        for job_id in queued:
+            self.submit(job_id)
+
+    def cleanup_expired(self) -> int:
+        """删除已结束且超过保留期的作业文件（上传文件/导出结果），作业记录保留
+
+        Returns:
+            删除的文件数
+        """
+        retention_days = int(self.app.config.get('JOB_RETENTION_DAYS', 7))
+        conn = self._connect()
+        removed = 0
+        try:
+            rows = conn.execute(
+                f'''
+                SELECT id, file_path, result_path FROM jobs
+                WHERE status IN ({','.join('?' * len(FINISHED_STATUSES))})
+                  AND finished_at < datetime('now', ?)
+                  AND (file_path IS NOT NULL OR result_path IS NOT NULL)
+                ''',
+                list(FINISHED_STATUSES) + [f'-{retention_days} days']
+            ).fetchall()
+            for row in rows:
+                for path in (row['file_path'], row['result_path']):
+                    if not path:
+                        continue
+                    # 同一上传文件可能被其他作业（重复提交/重试）引用
+                    in_use = conn.execute(
+                        f'''
+                        SELECT 1 FROM jobs WHERE id != ? AND file_path = ?
+                          AND (status IN ({','.join('?' * len(ACTIVE_STATUSES))}) OR finished_at >= datetime('now', ?))
+                        LIMIT 1
+                        ''',
+                        [row['id'], path] + list(ACTIVE_STATUSES) + [f'-{retention_days} days']
+                    ).fetchone()
+                    if in_use:
+                        continue
+                    for file_path in [path] + glob.glob(glob.escape(path) + '.*'):
+                        try:
+                            if os.path.exists(file_path):
+                                os.remove(file_path)
+                                removed += 1
+                        except OSError:
+                            pass
+                conn.execute('UPDATE jobs SET file_path = NULL, result_path = NULL WHERE id = ?', (row['id'],))
+            conn.commit()
+        finally:
+            conn.close()
+        return removed
+
+    @staticmethod
+    def to_dict(job: Dict[str, Any]) -> Dict[str, Any]:
+        """作业记录 -> 对外返回的进度信息"""
+        total = job.get('total')
+        processed = job.get('processed') or 0
+        return {
+            'id': job['id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'file_name': job.get('file_name'),
+            'total': total,
+            'processed': processed,
+            'percent': round(processed * 100.0 / total, 1) if total else None,
+            'success_count': job.get('success_count') or 0,
+            'error_count': job.get('error_count') or 0,
+            'errors': json.loads(job['errors']) if job.get('errors') else [],
+            'result': json.loads(job['result']) if job.get('result') else None,
+            'has_download': bool(job.get('result_path')) and job['status'] == JOB_SUCCEEDED,
+            'message': job.get('message'),
+            'cancel_requested': bool(job.get('cancel_requested')),
+            'attempts': job.get('attempts') or 0,
+            'created_at': job.get('created_at'),
+            'started_at': job.get('started_at'),
+            'updated_at': job.get('updated_at'),
+            'finished_at': job.get('finished_at'),
+        }
+
+
+# 全局作业管理器实例
+job_manager = JobManager()
@@ -2,9 +2,12 @@
 """
 题目模型
 """
-import json
+from ..utils import question_counts, question_payload
 from ..utils.database import get_db
 
+# 题目载荷之外的列（其余内容列取自题目载荷缓存）
+_EXTRA_COLUMNS = 'q.id, q.subject_id, q.difficulty, q.created_at'
+
 
 class Question:
     """题目模型"""
@@ -14,16 +17,12 @@ class Question:
         """通过ID获取题目"""
         conn = get_db()
         row = conn.execute(
-            'SELECT * FROM questions WHERE id = ?', (question_id,)
+            f'SELECT {_EXTRA_COLUMNS} FROM questions q WHERE q.id = ?', (question_id,)
         ).fetchone()
         if row:
-            q = dict(row)
-            if q.get('options'):
-                try:
-                    q['options'] = json.loads(q['options'])
-                except:
-                    q['options'] = []
-            return q
+            payload = question_payload.get_payload(conn, row['id'])
+            if payload:
+                return dict(payload, **dict(row))
         return None
     
     @staticmethod
@@ -34,8 +33,8 @@ class Question:
         conn = get_db()
         uid = user_id or -1
         
-        sql = """
-            SELECT q.*, s.name as subject,
+        sql = f"""
+            SELECT {_EXTRA_COLUMNS}, s.name as subject,
                    CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as is_fav,
                    CASE WHEN m.id IS NOT NULL THEN 1 ELSE 0 END as is_mistake
             FROM questions q
@@ -66,23 +65,19 @@ class Question:
         
         rows = conn.execute(sql, params).fetchall()
         
-        questions = []
+        rows_by_id = {}
         for row in rows:
-            q = dict(row)
-            
             # 权限检查：如果用户被限制访问该科目，跳过
-            if user_id and q.get('subject_id'):
-                if not can_user_access_subject(user_id, q['subject_id']):
+            if user_id and row['subject_id']:
+                if not can_user_access_subject(user_id, row['subject_id']):
                     continue
-            
-            if q.get('options'):
-                try:
-                    q['options'] = json.loads(q['options'])
-                except:
-                    q['options'] = []
-            questions.append(q)
-        
-        return questions
+            rows_by_id[row['id']] = row
+        
+        payloads = question_payload.get_payloads(conn, list(rows_by_id))
+        return [
+            dict(payloads[qid], **dict(row))
+            for qid, row in rows_by_id.items() if qid in payloads
+        ]
     
     @staticmethod
     def get_count(subject='all', q_type='all', mode='quiz', user_id=None):
@@ -100,21 +95,33 @@ class Question:
         else:
             accessible_subject_ids = None
         
+        if mode not in ('favorites', 'mistakes'):
+            # 全部题目：科目名/权限换算成科目ID后汇总 question_counts
+            if subject == 'all' and accessible_subject_ids is None:
+                return question_counts.total(conn, None, q_type)
+            sql = 'SELECT id FROM subjects WHERE 1=1'
+            params = []
+            if subject != 'all':
+                sql += ' AND name = ?'
+                params.append(subject)
+            if accessible_subject_ids is not None:
+                sql += f" AND id IN ({','.join(['?'] * len(accessible_subject_ids))})"
+                params.extend(accessible_subject_ids)
+            subject_ids = [row[0] for row in conn.execute(sql, params).fetchall()]
+            return question_counts.total(conn, subject_ids, q_type)
+        
         if mode == 'favorites':
             base_sql = """FROM questions q 
                       LEFT JOIN subjects s ON q.subject_id = s.id 
                       JOIN favorites f ON f.question_id = q.id AND f.user_id = ? 
                       WHERE 1=1"""
             params = [uid]
-        elif mode == 'mistakes':
+        else:
             base_sql = """FROM questions q 
                       LEFT JOIN subjects s ON q.subject_id = s.id 
                       JOIN mistakes m ON m.question_id = q.id AND m.user_id = ? 
                       WHERE 1=1"""
             params = [uid]
-        else:
-            base_sql = "FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id WHERE 1=1"
-            params = []
         
         if subject != 'all':
             base_sql += " AND s.name = ?"
@@ -160,7 +167,5 @@ class Question:
     @staticmethod
     def get_types():
         """获取所有题型"""
-        conn = get_db()
-        rows = conn.execute('SELECT DISTINCT q_type FROM questions').fetchall()
-        return [row[0] for row in rows]
+        return question_counts.q_types(get_db())
 
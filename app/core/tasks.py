@@ -24,6 +24,8 @@ class BackgroundTaskManager:
         self.app = app
         self.thread: Optional[threading.Thread] = None
         self.running = False
+        self._last_chat_retention: float = 0.0
+        self._last_answer_archive: float = 0.0
     
     def init_app(self, app: Flask) -> None:
         """
@@ -64,6 +66,18 @@ class BackgroundTaskManager:
                     # 清理过期验证码（每小时执行一次）
                     self._cleanup_expired_codes()
                     
+                    # 聊天消息归档（按 CHAT_RETENTION_INTERVAL_HOURS 节流）
+                    self._run_chat_retention()
+                    
+                    # 答题事件归档（按 ANSWER_EVENTS_ARCHIVE_INTERVAL_HOURS 节流）
+                    self._run_answer_archive()
+                    
+                    # 后台作业维护：恢复中断作业、清理过期的作业文件
+                    self._maintain_jobs()
+                    
+                    # 统计汇总维护：清理过期的去重统计行
+                    self._prune_metrics()
+                    
                     # 等待1小时
                     for _ in range(3600):  # 3600秒 = 1小时
                         if not self.running:
@@ -106,6 +120,107 @@ class BackgroundTaskManager:
         except Exception as e:
             current_app.logger.error(f'清理过期验证码失败: {str(e)}', exc_info=True)
 
+    
+    def _run_chat_retention(self) -> None:
+        """按保留策略归档聊天消息（分批短事务 + 批间休眠，不阻塞在线请求）"""
+        from flask import current_app
+        
+        if not current_app.config.get('CHAT_RETENTION_ENABLED'):
+            return
+        
+        interval = float(current_app.config.get('CHAT_RETENTION_INTERVAL_HOURS', 24)) * 3600
+        if time.time() - self._last_chat_retention < interval:
+            return
+        self._last_chat_retention = time.time()
+        
+        try:
+            from app.modules.chat.services.retention_service import ChatRetentionService
+            
+            result = ChatRetentionService.run(
+                current_app.config['DATABASE_PATH'],
+                current_app.config['CHAT_ARCHIVE_DB_PATH'],
+                current_app.config.get('CHAT_RETENTION_POLICIES') or {},
+                upload_root=current_app.config.get('UPLOAD_FOLDER'),
+                batch_size=int(current_app.config.get('CHAT_RETENTION_BATCH_SIZE', 500)),
+                pause=float(current_app.config.get('CHAT_RETENTION_BATCH_PAUSE', 0.2)),
+                should_stop=lambda: not self.running,
+            )
+            if result['archived'] or result['purged']:
+                current_app.logger.info(
+                    f"聊天消息归档: 会话 {result['conversations']} 个，归档 {result['archived']} 条，"
+                    f"清理 {result['purged']} 条"
+                )
+        except Exception as e:
+            current_app.logger.error(f'聊天消息归档失败: {str(e)}', exc_info=True)
+
+    
+    def _run_answer_archive(self) -> None:
+        """把超出热数据期的答题事件移入按月分表的归档库（分批短事务 + 批间休眠）"""
+        from flask import current_app
+        
+        if not current_app.config.get('ANSWER_EVENTS_ARCHIVE_ENABLED'):
+            return
+        
+        interval = float(current_app.config.get('ANSWER_EVENTS_ARCHIVE_INTERVAL_HOURS', 24)) * 3600
+        if time.time() - self._last_answer_archive < interval:
+            return
+        self._last_answer_archive = time.time()
+        
+        try:
+            from app.modules.quiz.services.answer_archive_service import AnswerEventArchiveService
+            
+            result = AnswerEventArchiveService.run(
+                current_app.config['DATABASE_PATH'],
+                current_app.config['ANSWER_EVENTS_ARCHIVE_DB_PATH'],
+                int(current_app.config.get('ANSWER_EVENTS_HOT_MONTHS', 6)),
+                batch_size=int(current_app.config.get('ANSWER_EVENTS_ARCHIVE_BATCH_SIZE', 1000)),
+                pause=float(current_app.config.get('ANSWER_EVENTS_ARCHIVE_BATCH_PAUSE', 0.2)),
+                should_stop=lambda: not self.running,
+            )
+            if result['archived'] or result['purged']:
+                current_app.logger.info(
+                    f"答题事件归档: 归档 {result['archived']} 条，清理 {result['purged']} 条，"
+                    f"归档分表 {result['partitions']} 个"
+                )
+        except Exception as e:
+            current_app.logger.error(f'答题事件归档失败: {str(e)}', exc_info=True)
+
+    
+    def _prune_metrics(self) -> None:
+        """清理超过保留天数的去重统计行（metric_daily_distinct 只需保留最近一个月）"""
+        try:
+            import sqlite3
+            from flask import current_app
+            from app.core.utils import metrics
+            
+            conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+            try:
+                deleted = metrics.prune_distinct(conn)
+                conn.commit()
+            finally:
+                conn.close()
+            
+            if deleted > 0:
+                current_app.logger.info(f'清理过期统计汇总: 删除了 {deleted} 条记录')
+        except Exception as e:
+            current_app.logger.error(f'清理统计汇总失败: {str(e)}', exc_info=True)
+
+    
+    def _maintain_jobs(self) -> None:
+        """恢复心跳超时的后台作业，并清理超过保留期的上传文件/导出结果"""
+        from flask import current_app
+        from app.core.jobs import job_manager
+        
+        if job_manager.app is None:
+            return
+        try:
+            job_manager.recover()
+            removed = job_manager.cleanup_expired()
+            if removed:
+                current_app.logger.info(f'清理过期作业文件 {removed} 个')
+        except Exception as e:
+            current_app.logger.error(f'后台作业维护失败: {str(e)}', exc_info=True)
+
 
 # 全局任务管理器实例
 task_manager = BackgroundTaskManager()
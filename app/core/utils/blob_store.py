@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+内容寻址上传存储（Blob Store）
+
+说明：
+- 上传文件按 SHA-256 命名，统一存放在 UPLOAD_FOLDER/blobs/<前两位>/<sha256>.<ext>
+- 写入时边读边算哈希（只读一遍上传流），相同内容只落盘一次
+- upload_blobs 表记录引用计数：上传/导入时 +1，替换/删除时 -1
+- 引用计数为 0 且超过宽限期的文件由 GC 命令（flask uploads gc）清理
+- stage_stream 只做文件 I/O（可在工作线程中执行），commit_staged 在持有连接的线程中登记
+"""
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import Counter
+from typing import Any, BinaryIO, Dict, Iterable, Optional
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+# 匹配 blobs/ab/<sha256>.<ext>（可出现在 URL、相对路径或 JSON 文本中）
+BLOB_PATH_RE = re.compile(r'blobs/([0-9a-f]{2})/([0-9a-f]{64})(?:\.([A-Za-z0-9]{1,10}))?')
+
+
+def _normalize_ext(ext: Optional[str]) -> str:
+    ext = (ext or '').strip().lstrip('.').lower()
+    return ext if re.fullmatch(r'[a-z0-9]{1,10}', ext or '') else 'bin'
+
+
+def blob_rel_path(sha256: str, ext: str) -> str:
+    """根据哈希与扩展名生成相对 UPLOAD_FOLDER 的路径"""
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}.{_normalize_ext(ext)}"
+
+
+def blob_url(rel_path: str) -> str:
+    """相对路径 -> 对外访问 URL（由 main.serve_upload 提供）"""
+    return f"/uploads/{rel_path}"
+
+
+def parse_blob_ref(value: Optional[str]) -> Optional[str]:
+    """从 URL/相对路径中解析出 sha256；非 blob 路径返回 None"""
+    if not value or not isinstance(value, str):
+        return None
+    m = BLOB_PATH_RE.search(value)
+    if not m or m.group(2)[:2] != m.group(1):
+        return None
+    return m.group(2)
+
+
+def iter_blob_refs(text: Optional[str]) -> Iterable[str]:
+    """从任意文本（如 JSON 内容）中提取全部 sha256 引用"""
+    if not text or not isinstance(text, str) or 'blobs/' not in text:
+        return []
+    return [m.group(2) for m in BLOB_PATH_RE.finditer(text) if m.group(2)[:2] == m.group(1)]
+
+
+def _tmp_dir(upload_root: str) -> str:
+    path = os.path.join(upload_root, BLOB_DIR, '.tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _commit_tmp(conn, upload_root: str, tmp_path: str, sha256: str, ext: str, size: int) -> Dict[str, Any]:
+    """将已算好哈希的临时文件落位并登记引用（+1）"""
+    # 同一内容以首次登记的扩展名为准（避免 .jpg/.jpeg 各存一份）
+    row = conn.execute('SELECT ext FROM upload_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+    if row:
+        ext = row[0]
+    rel_path = blob_rel_path(sha256, ext)
+    abs_path = os.path.join(upload_root, *rel_path.split('/'))
+
+    created = False
+    if os.path.exists(abs_path):
+        # 去重命中：内容已存在，丢弃临时文件
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    else:
+        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+        # 同卷 rename 为原子操作；并发写入同一内容时结果一致
+        os.replace(tmp_path, abs_path)
+        created = True
+
+    return _register(conn, sha256, ext, size, created)
+
+
+def _register(conn, sha256: str, ext: str, size: int, created: bool) -> Dict[str, Any]:
+    """登记 blob 并增加一次引用"""
+    conn.execute(
+        '''
+        INSERT INTO upload_blobs (sha256, ext, size, ref_count, last_ref_at)
+        VALUES (?, ?, ?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT(sha256) DO UPDATE SET
+            ref_count = upload_blobs.ref_count + 1,
+            last_ref_at = CURRENT_TIMESTAMP
+        ''',
+        (sha256, _normalize_ext(ext), size)
+    )
+
+    rel_path = blob_rel_path(sha256, ext)
+    return {
+        'sha256': sha256,
+        'path': rel_path,
+        'url': blob_url(rel_path),
+        'size': size,
+        'created': created,
+    }
+
+
+class _HashingWriter:
+    """写入文件的同时计算 SHA-256 与字节数（供 shutil.copyfileobj 使用）"""
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> int:
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+        return self.out.write(chunk)
+
+
+def stage_stream(upload_root: str, stream: BinaryIO) -> Dict[str, Any]:
+    """流式写入临时文件并计算哈希，不访问数据库（可在工作线程中并行执行）
+
+    Args:
+        upload_root: 上传根目录（UPLOAD_FOLDER）
+        stream: 可读的二进制流
+
+    Returns:
+        {'tmp_path', 'sha256', 'size'}，交给 commit_staged 落位登记或 discard_staged 丢弃
+    """
+    tmp_path = os.path.join(_tmp_dir(upload_root), uuid.uuid4().hex)
+    try:
+        with open(tmp_path, 'wb') as out:
+            writer = _HashingWriter(out)
+            shutil.copyfileobj(stream, writer, CHUNK_SIZE)
+    except Exception:
+        discard_staged({'tmp_path': tmp_path})
+        raise
+    return {'tmp_path': tmp_path, 'sha256': writer.hasher.hexdigest(), 'size': writer.size}
+
+
+def commit_staged(conn, upload_root: str, staged: Dict[str, Any], ext: str) -> Dict[str, Any]:
+    """将 stage_stream 的临时文件落位并登记引用（+1，调用方负责 commit）"""
+    return _commit_tmp(conn, upload_root, staged['tmp_path'], staged['sha256'], ext, staged['size'])
+
+
+def discard_staged(staged: Dict[str, Any]) -> None:
+    """丢弃未登记的临时文件"""
+    try:
+        os.remove(staged['tmp_path'])
+    except OSError:
+        pass
+
+
+def ref_existing(conn, upload_root: str, sha256: str, ext: str, size: int) -> Optional[Dict[str, Any]]:
+    """内容已在存储中时直接登记引用（+1），不再读写文件；文件不存在时返回 None
+
+    用于断点续导：清单中记录过哈希的文件无需重新解压
+    """
+    row = conn.execute('SELECT ext FROM upload_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+    if row:
+        ext = row[0]
+    rel_path = blob_rel_path(sha256, ext)
+    if not os.path.exists(os.path.join(upload_root, *rel_path.split('/'))):
+        return None
+    return _register(conn, sha256, ext, size, False)
+
+
+def save_stream(conn, upload_root: str, stream: BinaryIO, ext: str) -> Dict[str, Any]:
+    """流式保存：一边写临时文件一边计算 SHA-256，不做二次读取
+
+    Args:
+        conn: 数据库连接（调用方负责 commit）
+        upload_root: 上传根目录（UPLOAD_FOLDER）
+        stream: 可读的二进制流（FileStorage.stream / zipfile 成员等）
+        ext: 文件扩展名
+
+    Returns:
+        {'sha256', 'path', 'url', 'size', 'created'}
+    """
+    return commit_staged(conn, upload_root, stage_stream(upload_root, stream), ext)
+
+
+def save_upload(conn, upload_root: str, file_storage, ext: str) -> Dict[str, Any]:
+    """保存 werkzeug FileStorage 上传文件"""
+    return save_stream(conn, upload_root, file_storage.stream, ext)
+
+
+def save_local_file(conn, upload_root: str, src_path: str, ext: str, move: bool = False) -> Dict[str, Any]:
+    """将本地已有文件纳入 blob 存储（如 ffmpeg 转码产物）
+
+    move=True 时会删除源文件。
+    """
+    with open(src_path, 'rb') as f:
+        info = save_stream(conn, upload_root, f, ext)
+    if move:
+        try:
+            os.remove(src_path)
+        except OSError:
+            pass
+    return info
+
+
+def _adjust(conn, sha256: str, delta: int) -> None:
+    conn.execute(
+        '''
+        UPDATE upload_blobs
+        SET ref_count = MAX(ref_count + ?, 0), last_ref_at = CURRENT_TIMESTAMP
+        WHERE sha256 = ?
+        ''',
+        (delta, sha256)
+    )
+
+
+def incref(conn, value: Optional[str], delta: int = 1) -> bool:
+    """按 URL/路径调整引用计数；非 blob 路径直接忽略"""
+    sha256 = parse_blob_ref(value)
+    if not sha256:
+        return False
+    _adjust(conn, sha256, delta)
+    return True
+
+
+def decref(conn, value: Optional[str]) -> bool:
+    """引用计数 -1（文件由 GC 统一回收，这里不直接删除）"""
+    return incref(conn, value, delta=-1)
+
+
+def release_refs(conn, old: Optional[str], new: Optional[str] = None) -> int:
+    """
+    字段值由 old 改为 new 时释放不再使用的 blob（引用计数 -1，调用方负责 commit）
+
+    old/new 可以是单个路径或包含多个路径的文本（如题目 image_path 的 JSON 数组）；
+    new 中仍然引用的 blob 不释放，new 中新增的引用已在上传时计数。删除时 new 传 None。
+
+    Returns:
+        释放的引用数
+    """
+    kept = Counter(iter_blob_refs(new))
+    released = 0
+    for sha256 in iter_blob_refs(old):
+        if kept[sha256] > 0:
+            kept[sha256] -= 1
+            continue
+        _adjust(conn, sha256, -1)
+        released += 1
+    return released
+
+
+def release_question_images(conn, where_sql: str, params: Iterable[Any] = ()) -> int:
+    """删除题目前释放其图片引用（where_sql 为 questions 上的筛选条件，调用方负责 commit）"""
+    released = 0
+    for row in conn.execute(
+        f"SELECT image_path FROM questions WHERE ({where_sql}) AND image_path LIKE '%blobs/%'", list(params)
+    ).fetchall():
+        released += release_refs(conn, row[0])
+    return released
+
+
+def recount_references(conn, archive_db_path: Optional[str] = None) -> int:
+    """按业务表中的实际引用重算 ref_count（修正漏记的增减）
+
+    引用来源：users.avatar、questions.image_path、chat_messages.content，
+    以及聊天归档库中已归档消息的 blob_refs（传入 archive_db_path 时）
+
+    Returns:
+        被引用的 blob 数
+    """
+    counts: Dict[str, int] = {}
+
+    def _collect(sql):
+        cur = conn.execute(sql)
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                for sha256 in iter_blob_refs(row[0]):
+                    counts[sha256] = counts.get(sha256, 0) + 1
+
+    _collect("SELECT avatar FROM users WHERE avatar LIKE '%blobs/%'")
+    _collect("SELECT image_path FROM questions WHERE image_path LIKE '%blobs/%'")
+    _collect(
+        "SELECT content FROM chat_messages "
+        "WHERE content_type IN ('image', 'audio') AND content LIKE '%blobs/%'"
+    )
+    if archive_db_path and os.path.exists(archive_db_path):
+        conn.execute('ATTACH DATABASE ? AS blob_gc_archive', (archive_db_path,))
+        try:
+            has_table = conn.execute(
+                "SELECT 1 FROM blob_gc_archive.sqlite_master WHERE type='table' AND name='chat_messages_archive'"
+            ).fetchone()
+            if has_table:
+                _collect("SELECT blob_refs FROM blob_gc_archive.chat_messages_archive WHERE blob_refs != ''")
+        finally:
+            conn.execute('DETACH DATABASE blob_gc_archive')
+
+    conn.execute('UPDATE upload_blobs SET ref_count = 0')
+    conn.executemany(
+        'UPDATE upload_blobs SET ref_count = ? WHERE sha256 = ?',
+        [(n, sha256) for sha256, n in counts.items()]
+    )
+    return len(counts)
+
+
+def collect_garbage(conn, upload_root: str, grace_seconds: int = 24 * 3600,
+                    recount: bool = True, dry_run: bool = False,
+                    archive_db_path: Optional[str] = None) -> Dict[str, Any]:
+    """清理未被引用的 blob
+
+    Args:
+        conn: 独立的数据库连接
+        upload_root: 上传根目录
+        grace_seconds: 宽限期（刚上传、尚未挂到题目上的图片不会被误删）
+        recount: 清理前是否按实际引用重算 ref_count
+        dry_run: 仅统计，不删除
+        archive_db_path: 聊天归档库路径（归档消息中的引用同样计入）
+
+    Returns:
+        {'referenced', 'deleted', 'freed_bytes', 'stray_files'}
+    """
+    referenced = recount_references(conn, archive_db_path) if recount else None
+
+    rows = conn.execute(
+        '''
+        SELECT sha256, ext, size FROM upload_blobs
+        WHERE ref_count <= 0
+          AND last_ref_at < datetime('now', ?)
+        ''',
+        (f'-{int(grace_seconds)} seconds',)
+    ).fetchall()
+
+    deleted = 0
+    freed = 0
+    for row in rows:
+        sha256, ext, size = row[0], row[1], row[2]
+        abs_path = os.path.join(upload_root, *blob_rel_path(sha256, ext).split('/'))
+        if not dry_run:
+            try:
+                if os.path.exists(abs_path):
+                    os.remove(abs_path)
+            except OSError:
+                continue
+            conn.execute('DELETE FROM upload_blobs WHERE sha256 = ? AND ref_count <= 0', (sha256,))
+        deleted += 1
+        freed += int(size or 0)
+
+    # 清理中断写入遗留的临时文件
+    stray = 0
+    tmp_dir = os.path.join(upload_root, BLOB_DIR, '.tmp')
+    if os.path.isdir(tmp_dir):
+        cutoff = time.time() - grace_seconds
+        for name in os.listdir(tmp_dir):
+            p = os.path.join(tmp_dir, name)
+            try:
+                if os.path.getmtime(p) < cutoff:
+                    stray += 1
+                    if not dry_run:
+                        os.remove(p)
+            except OSError:
+                pass
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+
+    return {
+        'referenced': referenced,
+        'deleted': deleted,
+        'freed_bytes': freed,
+        'stray_files': stray,
+    }
+
@@ -2,9 +2,14 @@
 """
 数据库工具函数
 """
+import json
+import re
 import sqlite3
+from typing import Optional
 from flask import g, current_app
 
+from app.core.utils.progress_store import QUIZ_PROGRESS_PREFIX, pack_order
+
 
 def get_db():
     """获取数据库连接（使用Flask g对象实现连接池）"""
@@ -33,6 +38,18 @@ def init_db():
         _create_tables(conn)
         # 创建索引
         _create_indexes(conn)
+        # 全文检索索引（FTS5 trigram，可选）
+        _create_search_indexes(conn)
+        # 题库计数/标签汇总表（触发器维护）
+        _create_question_summaries(conn)
+        # 管理后台统计汇总（触发器维护的按日计数）
+        _create_metric_rollups(conn)
+        # 答题事件 -> 最新作答投影（user_answers）
+        _create_answer_projection(conn)
+        # 用户学习统计投影（触发器维护）
+        _create_user_stats(conn)
+        # 旧版进度中的题目顺序数组迁移到 user_progress_orders
+        _migrate_progress_orders(conn)
         conn.commit()
         print('[OK] 数据库初始化完成')
     except Exception as e:
@@ -180,6 +197,82 @@ def _create_tables(conn):
         )
     ''')
     
+    # 答题事件表（只追加）：每次作答一行，保留完整历史；user_answers 是由触发器维护的
+    # “每个用户每题最新一次作答”投影（见 _create_answer_projection）。超过热数据保留期的事件
+    # 按月移入归档库（answer_events_YYYYMM，见 AnswerEventArchiveService）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS answer_events (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            is_correct INTEGER NOT NULL,
+            answered_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(question_id) REFERENCES questions(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # 用户学习统计投影（个人中心/统计接口直接读取，不再按需聚合）：由 user_answers / favorites /
+    # mistakes / exams / answer_events 上的触发器在写入的同一事务内增减，见 _create_user_stats
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            answered INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            favorites INTEGER NOT NULL DEFAULT 0,
+            mistakes INTEGER NOT NULL DEFAULT 0,
+            exams INTEGER NOT NULL DEFAULT 0,
+            submitted_exams INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    # 按科目 / 题型的已答题数与答对数（subject_id 为 NULL 的题目记在 subject_id = 0 下）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_subject_stats (
+            user_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, subject_id),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_type_stats (
+            user_id INTEGER NOT NULL,
+            q_type TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, q_type),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    # 每日作答次数（按答题事件累加；事件归档后仍保留）。day 为用户所在时区的日期
+    # （UTC + STATS_UTC_OFFSET_HOURS），按 (user_id, day) 主键范围读取即得学习日历
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            answered INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    # 学习日历汇总：最近一个学习日、截至该日的连续天数、最长连续天数、累计学习天数，
+    # 由 user_daily_stats 新增日期时的触发器维护（连续天数读取只需一次主键查询）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INTEGER PRIMARY KEY,
+            first_day TEXT NOT NULL,
+            last_day TEXT NOT NULL,
+            current_streak INTEGER NOT NULL DEFAULT 0,
+            longest_streak INTEGER NOT NULL DEFAULT 0,
+            active_days INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    
     # 用户进度表
     conn.execute('''
         CREATE TABLE IF NOT EXISTS user_progress (
@@ -194,6 +287,20 @@ def _create_tables(conn):
         )
     ''')
 
+    # 打乱模式的题目顺序：种子顺序 seed + bank_version，或显式顺序 ids（见 progress_store）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress_orders (
+            user_id INTEGER NOT NULL,
+            p_key TEXT NOT NULL,
+            ids BLOB NOT NULL,
+            seed INTEGER,
+            bank_version INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(user_id, p_key),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+
     # 考试表
     conn.execute('''
         CREATE TABLE IF NOT EXISTS exams (
@@ -272,10 +379,21 @@ def _create_tables(conn):
             question_cols = [r['name'] for r in cur.execute("PRAGMA table_info(questions)").fetchall()]
             if 'image_path' not in question_cols:
                 cur.execute('ALTER TABLE questions ADD COLUMN image_path TEXT')
+            if 'tags' not in question_cols:
+                cur.execute('ALTER TABLE questions ADD COLUMN tags TEXT')
+            if 'created_by' not in question_cols:
+                cur.execute('ALTER TABLE questions ADD COLUMN created_by INTEGER')
+            if 'updated_at' not in question_cols:
+                cur.execute('ALTER TABLE questions ADD COLUMN updated_at DATETIME')
             
             # 不再添加编程题相关字段到 questions 表
             # 编程题应使用 coding_questions 表
         
+        # 添加 mistakes 表的错误次数字段（答题记录/交卷按 (user_id, question_id) UPSERT 累加）
+        mistake_cols = [r['name'] for r in cur.execute("PRAGMA table_info(mistakes)").fetchall()]
+        if mistake_cols and 'wrong_count' not in mistake_cols:
+            cur.execute('ALTER TABLE mistakes ADD COLUMN wrong_count INTEGER DEFAULT 1')
+        
         # 添加 subjects 表的字段（如果不存在）- 兼容旧数据库
         table_check = cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='subjects'").fetchone()
         if table_check:
@@ -301,6 +419,15 @@ def _create_tables(conn):
     except Exception:
         pass
 
+    # 添加 user_progress_orders 的种子顺序字段（如果不存在）
+    try:
+        order_cols = [r['name'] for r in conn.execute("PRAGMA table_info(user_progress_orders)").fetchall()]
+        for col in ('seed', 'bank_version'):
+            if col not in order_cols:
+                conn.execute(f'ALTER TABLE user_progress_orders ADD COLUMN {col} INTEGER')
+    except Exception as e:
+        print(f'[WARN] 添加字段失败: {e}')
+
     # 聊天：会话表
     # 说明：为从根源杜绝 direct 私聊重复会话，增加 direct_pair_key：
     # - direct 私聊：存 "min_uid:max_uid"（例如 "1:10"）
@@ -369,6 +496,75 @@ def _create_tables(conn):
         )
     ''')
 
+    # 聊天：归档统计表（消息归档到独立归档库后，按会话记录已归档条数，统计时无需扫描归档库）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_archive_stats (
+            conversation_id INTEGER PRIMARY KEY,
+            archived_count INTEGER NOT NULL DEFAULT 0,
+            last_archived_id INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(conversation_id) REFERENCES chat_conversations(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # 题库计数表：按 (科目, 题型) 维护题目数，由 questions 上的触发器更新
+    # subject_id 为 NULL 的题目记在 subject_id = 0 下
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_counts (
+            subject_id INTEGER NOT NULL,
+            q_type TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (subject_id, q_type)
+        ) WITHOUT ROWID
+    ''')
+
+    # 题目标签表：questions.tags（逗号分隔）拆分后的一题一行，用于按标签筛选，由触发器维护
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_tags (
+            tag TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            PRIMARY KEY (tag, question_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # 题目载荷缓存：题目内容派生数据（解析后的选项、完整答案、图片路径）序列化后的紧凑 JSON，按需写入；
+    # 题目内容变化/删除时由触发器删除对应行并递增 generation（进程内 LRU 据此失效，见 question_payload.py）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_payloads (
+            question_id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_payload_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO question_payload_generation (id, generation) VALUES (1, 0)')
+
+    # 统计汇总表：按 (指标, 维度, 日期) 记录当日新增条数，由源表上的触发器增减（见 METRIC_SOURCES）
+    # 总数 = 全部日期之和；时间范围统计只读对应日期的少量行。dim 为空串表示不分维度
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_daily (
+            metric TEXT NOT NULL,
+            dim TEXT NOT NULL DEFAULT '',
+            day TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, dim, day)
+        ) WITHOUT ROWID
+    ''')
+
+    # 去重统计表：按 (指标, 日期) 记录当日出现过的成员（如当日有消息的会话），用于“最近 N 天活跃数”
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_daily_distinct (
+            metric TEXT NOT NULL,
+            day TEXT NOT NULL,
+            member INTEGER NOT NULL,
+            PRIMARY KEY (metric, day, member)
+        ) WITHOUT ROWID
+    ''')
+
     # 通知表
     conn.execute('''
         CREATE TABLE IF NOT EXISTS notifications (
@@ -554,6 +750,58 @@ def _create_tables(conn):
         )
     ''')
     
+    # 上传文件 blob 表（内容寻址存储：sha256 命名 + 引用计数）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS upload_blobs (
+            sha256 TEXT PRIMARY KEY,
+            ext TEXT NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_ref_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 旧版（非内容寻址）上传文件的强 ETag：按 (大小, mtime) 校验，文件变化后重新计算
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS upload_etags (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    
+    # 后台作业表（题库导入/导出等耗时操作，由 app.core.jobs 的工作线程池执行）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            dedupe_key TEXT,
+            params TEXT,
+            file_path TEXT,
+            file_name TEXT,
+            total INTEGER,
+            processed INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            errors TEXT,
+            checkpoint INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            result_path TEXT,
+            message TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME,
+            FOREIGN KEY(created_by) REFERENCES users(id) ON DELETE SET NULL
+        )
+    ''')
+    
     # 初始化系统配置（如果不存在）
     default_configs = [
         ('quiz_limit_enabled', '0', '刷题数限制功能开关（0=关闭，1=开启）'),
@@ -582,16 +830,53 @@ def _create_indexes(conn):
     
     indexes = []
     
+    # 用户名大小写不敏感索引（聊天用户搜索的前缀范围扫描）
+    if 'users' in existing_tables:
+        indexes.append('CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)')
+        user_cols = {r[1] for r in cur.execute('PRAGMA table_info(users)').fetchall()}
+        # 管理后台用户列表：邮箱前缀搜索、按注册时间键集分页、在线/角色统计
+        if 'email' in user_cols:
+            indexes.append('CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)')
+        indexes.extend([
+            "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(IFNULL(created_at, ''))",
+            'CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active)',
+            # 统计卡片的角色/锁定计数：部分索引只包含少量目标行
+            'CREATE INDEX IF NOT EXISTS idx_users_admin ON users(is_admin) WHERE is_admin = 1',
+            'CREATE INDEX IF NOT EXISTS idx_users_subject_admin ON users(is_admin) WHERE is_subject_admin = 1',
+            'CREATE INDEX IF NOT EXISTS idx_users_locked ON users(is_locked) WHERE is_locked = 1',
+        ])
+    
     # 用户相关索引（只对存在的表创建）
     if 'favorites' in existing_tables:
         indexes.append('CREATE INDEX IF NOT EXISTS idx_favorites_user_question ON favorites(user_id, question_id)')
     if 'mistakes' in existing_tables:
         indexes.append('CREATE INDEX IF NOT EXISTS idx_mistakes_user_question ON mistakes(user_id, question_id)')
     if 'user_answers' in existing_tables:
+        # 每个用户每题只保留最新一条（记录答题结果按 (user_id, question_id) UPSERT）；
+        # 建唯一索引前清理旧版本遗留的重复行
+        if not cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_user_answers_user_question'"
+        ).fetchone():
+            cur.execute(
+                'DELETE FROM user_answers WHERE id NOT IN '
+                '(SELECT MAX(id) FROM user_answers GROUP BY user_id, question_id)'
+            )
         indexes.extend([
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_user_answers_user_question ON user_answers(user_id, question_id)',
             'CREATE INDEX IF NOT EXISTS idx_user_answers_user ON user_answers(user_id, created_at)',
             'CREATE INDEX IF NOT EXISTS idx_user_answers_question ON user_answers(question_id)',
         ])
+    if 'answer_events' in existing_tables:
+        indexes.extend([
+            'CREATE INDEX IF NOT EXISTS idx_answer_events_user ON answer_events(user_id, answered_at)',
+            # 外键级联删除题目、按时间归档
+            'CREATE INDEX IF NOT EXISTS idx_answer_events_question ON answer_events(question_id)',
+            'CREATE INDEX IF NOT EXISTS idx_answer_events_answered ON answer_events(answered_at)',
+        ])
+    
+    # 题目标签反查（删除/修改题目时按 question_id 清理标签行）
+    if 'question_tags' in existing_tables:
+        indexes.append('CREATE INDEX IF NOT EXISTS idx_question_tags_question ON question_tags(question_id)')
     
     # 题目相关索引（只对存在的表创建）
     if 'questions' in existing_tables:
@@ -599,6 +884,9 @@ def _create_indexes(conn):
             'CREATE INDEX IF NOT EXISTS idx_questions_subject ON questions(subject_id)',
             'CREATE INDEX IF NOT EXISTS idx_questions_type ON questions(q_type)',
             'CREATE INDEX IF NOT EXISTS idx_questions_subject_type ON questions(subject_id, q_type)',
+            # 管理后台题目列表：按难度/更新时间筛选与排序（表达式需与 QuestionListService 中一致）
+            'CREATE INDEX IF NOT EXISTS idx_questions_subject_difficulty ON questions(subject_id, IFNULL(difficulty, 1))',
+            'CREATE INDEX IF NOT EXISTS idx_questions_subject_updated ON questions(subject_id, IFNULL(updated_at, \'\'))',
         ])
     
     # 考试相关索引（只对存在的表创建）
@@ -621,7 +909,11 @@ def _create_indexes(conn):
     if 'chat_members' in existing_tables:
         indexes.append('CREATE INDEX IF NOT EXISTS idx_chat_members_user ON chat_members(user_id, conversation_id)')
     if 'chat_messages' in existing_tables:
-        indexes.append('CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation ON chat_messages(conversation_id, id DESC)')
+        indexes.extend([
+            'CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation ON chat_messages(conversation_id, id DESC)',
+            # 管理后台统计（今日/近7天消息）按时间范围扫描
+            'CREATE INDEX IF NOT EXISTS idx_chat_messages_created ON chat_messages(created_at)',
+        ])
     if 'chat_conversations' in existing_tables:
         # direct 私聊唯一键：从根源杜绝重复会话（仅当 c_type='direct' 时生效）
         indexes.append("CREATE UNIQUE INDEX IF NOT EXISTS ux_chat_direct_pair ON chat_conversations(direct_pair_key) WHERE c_type='direct' AND direct_pair_key IS NOT NULL")
@@ -684,6 +976,18 @@ def _create_indexes(conn):
             'CREATE INDEX IF NOT EXISTS idx_email_codes_user ON email_verification_codes(user_id)',
         ])
     
+    # 上传 blob 表索引（GC 按引用计数扫描）
+    if 'upload_blobs' in existing_tables:
+        indexes.append('CREATE INDEX IF NOT EXISTS idx_upload_blobs_gc ON upload_blobs(ref_count, last_ref_at)')
+    
+    # 后台作业索引（按文件哈希去重、按状态恢复、按用户列出）
+    if 'jobs' in existing_tables:
+        indexes.extend([
+            'CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key, status)',
+            'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, updated_at)',
+            'CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(created_by, id DESC)',
+        ])
+    
     for index_sql in indexes:
         conn.execute(index_sql)
 
@@ -745,3 +1049,745 @@ def _create_indexes(conn):
     for index_sql in indexes:
         conn.execute(index_sql)
 
+
+def tags_json_sql(ref: str) -> str:
+    """把 <ref>.tags（逗号分隔）转换为 JSON 数组字符串的 SQL 表达式（非法时为空数组）"""
+    quoted = (
+        f"'[\"' || REPLACE(REPLACE(REPLACE(IFNULL({ref}.tags, ''), '\\', '\\\\'), '\"', '\\\"'), ',', '\",\"') || '\"]'"
+    )
+    return f"CASE WHEN json_valid({quoted}) THEN {quoted} ELSE '[]' END"
+
+
+# 题目载荷的来源列：这些列变化时载荷失效（见 question_payload.py）
+QUESTION_PAYLOAD_COLUMNS = ('q_type', 'content', 'options', 'answer', 'explanation', 'image_path')
+
+
+def _create_question_summaries(conn):
+    """创建 question_counts / question_tags / question_payloads 的维护触发器；表为空而题库非空时全量重建
+
+    - question_counts：插入/删除/修改科目或题型时增减计数，计数接口只需汇总少量行
+    - question_tags：tags 变化时重写该题的标签行，按标签筛选走 (tag, question_id) 主键
+    - question_payloads：载荷来源列变化时删除该题载荷并递增 generation，删除题目时删除载荷
+    """
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    if 'questions' not in existing_tables:
+        return
+    question_cols = {r[1] for r in conn.execute('PRAGMA table_info(questions)').fetchall()}
+
+    try:
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_question_counts_ai AFTER INSERT ON questions BEGIN
+                INSERT INTO question_counts (subject_id, q_type, n)
+                VALUES (IFNULL(new.subject_id, 0), new.q_type, 1)
+                ON CONFLICT(subject_id, q_type) DO UPDATE SET n = n + 1;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_question_counts_ad AFTER DELETE ON questions BEGIN
+                UPDATE question_counts SET n = n - 1
+                WHERE subject_id = IFNULL(old.subject_id, 0) AND q_type = old.q_type;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_question_counts_au AFTER UPDATE OF subject_id, q_type ON questions
+            WHEN IFNULL(old.subject_id, 0) != IFNULL(new.subject_id, 0) OR old.q_type != new.q_type BEGIN
+                UPDATE question_counts SET n = n - 1
+                WHERE subject_id = IFNULL(old.subject_id, 0) AND q_type = old.q_type;
+                INSERT INTO question_counts (subject_id, q_type, n)
+                VALUES (IFNULL(new.subject_id, 0), new.q_type, 1)
+                ON CONFLICT(subject_id, q_type) DO UPDATE SET n = n + 1;
+            END
+        ''')
+
+        if 'tags' in question_cols:
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_question_tags_ai AFTER INSERT ON questions
+                WHEN new.tags IS NOT NULL AND new.tags != '' BEGIN
+                    INSERT OR IGNORE INTO question_tags (tag, question_id)
+                    SELECT TRIM(value), new.id FROM json_each({tags_json_sql('new')})
+                    WHERE TRIM(value) != '';
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_question_tags_ad AFTER DELETE ON questions
+                WHEN old.tags IS NOT NULL AND old.tags != '' BEGIN
+                    DELETE FROM question_tags WHERE question_id = old.id;
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_question_tags_au AFTER UPDATE OF tags ON questions
+                WHEN IFNULL(old.tags, '') != IFNULL(new.tags, '') BEGIN
+                    DELETE FROM question_tags WHERE question_id = old.id;
+                    INSERT OR IGNORE INTO question_tags (tag, question_id)
+                    SELECT TRIM(value), new.id FROM json_each({tags_json_sql('new')})
+                    WHERE TRIM(value) != '';
+                END
+            ''')
+
+        if set(QUESTION_PAYLOAD_COLUMNS) <= question_cols:
+            changed = ' OR '.join(f'old.{c} IS NOT new.{c}' for c in QUESTION_PAYLOAD_COLUMNS)
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_question_payloads_au
+                AFTER UPDATE OF {', '.join(QUESTION_PAYLOAD_COLUMNS)} ON questions
+                WHEN {changed} BEGIN
+                    DELETE FROM question_payloads WHERE question_id = old.id;
+                    UPDATE question_payload_generation SET generation = generation + 1 WHERE id = 1;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_question_payloads_ad AFTER DELETE ON questions BEGIN
+                    DELETE FROM question_payloads WHERE question_id = old.id;
+                END
+            ''')
+    except Exception as e:
+        print(f'[WARN] 创建题库汇总触发器失败: {e}')
+        return
+
+    # 首次创建（或被清空）时按现有题库重建
+    has_counts = conn.execute('SELECT 1 FROM question_counts LIMIT 1').fetchone()
+    if not has_counts and conn.execute('SELECT 1 FROM questions LIMIT 1').fetchone():
+        rebuild_question_summaries(conn)
+
+
+def rebuild_question_summaries(conn):
+    """按 questions 全量重建 question_counts 与 question_tags（调用方负责 commit）"""
+    conn.execute('DELETE FROM question_counts')
+    conn.execute('''
+        INSERT INTO question_counts (subject_id, q_type, n)
+        SELECT IFNULL(subject_id, 0), q_type, COUNT(*) FROM questions GROUP BY 1, 2
+    ''')
+    question_cols = {r[1] for r in conn.execute('PRAGMA table_info(questions)').fetchall()}
+    conn.execute('DELETE FROM question_tags')
+    if 'tags' in question_cols:
+        conn.execute(f'''
+            INSERT OR IGNORE INTO question_tags (tag, question_id)
+            SELECT TRIM(j.value), q.id
+            FROM questions q, json_each({tags_json_sql('q')}) j
+            WHERE q.tags IS NOT NULL AND q.tags != '' AND TRIM(j.value) != ''
+        ''')
+
+
+# 汇总指标定义：(指标名, 源表, 时间列, 维度列, 条件 (列, 值))
+METRIC_SOURCES = (
+    ('users', 'users', 'created_at', None, None),
+    ('chat.conversations', 'chat_conversations', 'created_at', None, None),
+    ('chat.conversations.direct', 'chat_conversations', 'created_at', None, ('c_type', 'direct')),
+    ('chat.messages', 'chat_messages', 'created_at', None, None),
+    ('popup.views', 'popup_views', 'viewed_at', 'popup_id', None),
+    ('popup.dismissals', 'popup_dismissals', 'dismissed_at', 'popup_id', None),
+    ('coding.submissions', 'code_submissions', 'submitted_at', 'question_id', None),
+    ('coding.accepted', 'code_submissions', 'submitted_at', 'question_id', ('status', 'accepted')),
+)
+
+# 去重指标定义：(指标名, 源表, 时间列, 成员列)；只随插入累积，超过保留天数的日期由后台任务清理
+METRIC_DISTINCT_SOURCES = (
+    ('chat.active_conversations', 'chat_messages', 'created_at', 'conversation_id'),
+)
+METRIC_DISTINCT_RETENTION_DAYS = 31
+
+# 时间列为 NULL 的行记在该日期下（增减使用同一个桶，保证删除时能正确抵消）
+METRIC_NULL_DAY = '0000-00-00'
+
+
+def _metric_day_sql(ref: str, time_col: str) -> str:
+    return f"IFNULL(DATE({ref}.{time_col}), '{METRIC_NULL_DAY}')"
+
+
+def _metric_dim_sql(ref: str, dim_col: Optional[str]) -> str:
+    return f"IFNULL(CAST({ref}.{dim_col} AS TEXT), '')" if dim_col else "''"
+
+
+def _metric_cond_sql(ref: str, cond) -> str:
+    column, value = cond
+    return f"{ref}.{column} = '{value}'"
+
+
+def _create_metric_rollups(conn):
+    """创建统计汇总触发器；某个指标还没有任何汇总行而源表非空时按源表重建该指标
+
+    - 插入：当日桶 +1（UPSERT）；删除：原日期桶 -1；修改时间/维度/条件列：旧桶 -1、新桶 +1
+    - 外键级联删除同样会触发，归档/清理消息后计数自动同步
+    """
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    try:
+        for metric, table, time_col, dim_col, cond in METRIC_SOURCES:
+            if table not in existing_tables:
+                continue
+            name = 'trg_metric_' + metric.replace('.', '_')
+            columns = [c for c in (time_col, dim_col, cond[0] if cond else None) if c]
+            when_new = f'WHEN {_metric_cond_sql("new", cond)} ' if cond else ''
+            when_old = f'WHEN {_metric_cond_sql("old", cond)} ' if cond else ''
+            inc = f"""
+                INSERT INTO metric_daily (metric, dim, day, n)
+                VALUES ('{metric}', {_metric_dim_sql('new', dim_col)}, {_metric_day_sql('new', time_col)}, 1)
+                ON CONFLICT(metric, dim, day) DO UPDATE SET n = n + 1;"""
+            dec = f"""
+                UPDATE metric_daily SET n = n - 1
+                WHERE metric = '{metric}' AND dim = {_metric_dim_sql('old', dim_col)}
+                  AND day = {_metric_day_sql('old', time_col)};"""
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} {when_new}BEGIN{inc}\nEND')
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} {when_old}BEGIN{dec}\nEND')
+            # 修改：旧行满足条件则 -1，新行满足条件则 +1（拆成两个触发器，各自带 WHEN）
+            conn.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {name}_au_old AFTER UPDATE OF {", ".join(columns)} ON {table} '
+                f'{when_old}BEGIN{dec}\nEND'
+            )
+            conn.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {name}_au_new AFTER UPDATE OF {", ".join(columns)} ON {table} '
+                f'{when_new}BEGIN{inc}\nEND'
+            )
+
+        for metric, table, time_col, member_col in METRIC_DISTINCT_SOURCES:
+            if table not in existing_tables:
+                continue
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_metric_{metric.replace('.', '_')}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT OR IGNORE INTO metric_daily_distinct (metric, day, member)
+                    VALUES ('{metric}', {_metric_day_sql('new', time_col)}, new.{member_col});
+                END
+            """)
+    except Exception as e:
+        print(f'[WARN] 创建统计汇总触发器失败: {e}')
+        return
+
+    # 首次创建（或新增指标）时按源表重建
+    for metric, table, *_ in METRIC_SOURCES + METRIC_DISTINCT_SOURCES:
+        if table not in existing_tables:
+            continue
+        summary = 'metric_daily_distinct' if any(metric == d[0] for d in METRIC_DISTINCT_SOURCES) else 'metric_daily'
+        if conn.execute(f'SELECT 1 FROM {summary} WHERE metric = ? LIMIT 1', (metric,)).fetchone():
+            continue
+        if conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+            rebuild_metric(conn, metric)
+
+
+def rebuild_metric(conn, metric: str) -> None:
+    """按源表全量重建一个汇总指标（调用方负责 commit）
+
+    Raises:
+        ValueError: 未定义的指标
+    """
+    for name, table, time_col, dim_col, cond in METRIC_SOURCES:
+        if name == metric:
+            conn.execute('DELETE FROM metric_daily WHERE metric = ?', (metric,))
+            conn.execute(f'''
+                INSERT INTO metric_daily (metric, dim, day, n)
+                SELECT ?, {_metric_dim_sql(table, dim_col)}, {_metric_day_sql(table, time_col)}, COUNT(*)
+                FROM {table}
+                {'WHERE ' + _metric_cond_sql(table, cond) if cond else ''}
+                GROUP BY 2, 3
+            ''', (metric,))
+            return
+    for name, table, time_col, member_col in METRIC_DISTINCT_SOURCES:
+        if name == metric:
+            conn.execute('DELETE FROM metric_daily_distinct WHERE metric = ?', (metric,))
+            conn.execute(f'''
+                INSERT OR IGNORE INTO metric_daily_distinct (metric, day, member)
+                SELECT ?, {_metric_day_sql(table, time_col)}, {member_col} FROM {table}
+                WHERE {time_col} >= DATE('now', ?)
+            ''', (metric, f'-{METRIC_DISTINCT_RETENTION_DAYS} days'))
+            return
+    raise ValueError(f'未定义的统计指标: {metric}')
+
+
+def _create_answer_projection(conn):
+    """创建 answer_events -> user_answers 的投影触发器；首次创建时用已有 user_answers 补一条历史事件
+
+    每插入一条事件，按 (user_id, question_id) UPSERT user_answers；离线补交的较早事件不覆盖更新的记录，
+    与现有记录完全相同的事件（答题队列重复提交）不改写该行，也不触发下游统计触发器
+    """
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    if not {'answer_events', 'user_answers'} <= existing_tables:
+        return
+    changed_only = 'user_answers.is_correct IS NOT excluded.is_correct'
+    trigger = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='trigger' AND name='trg_answer_events_latest'"
+    ).fetchone()
+    if trigger and changed_only in trigger[0]:
+        return
+    try:
+        if trigger:
+            # 旧版触发器：重建（历史事件已补过，不再重复）
+            conn.execute('DROP TRIGGER trg_answer_events_latest')
+        else:
+            # 旧版本只保留了最新一次作答，把它作为历史的第一条事件（先于触发器写入，不改动 user_answers）
+            conn.execute('''
+                INSERT INTO answer_events (user_id, question_id, is_correct, answered_at)
+                SELECT user_id, question_id, IFNULL(is_correct, 0), IFNULL(created_at, CURRENT_TIMESTAMP)
+                FROM user_answers ua
+                WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = ua.user_id)
+                  AND EXISTS (SELECT 1 FROM questions q WHERE q.id = ua.question_id)
+                ORDER BY ua.id
+            ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_answer_events_latest AFTER INSERT ON answer_events BEGIN
+                INSERT INTO user_answers (user_id, question_id, is_correct, created_at)
+                VALUES (new.user_id, new.question_id, new.is_correct, new.answered_at)
+                ON CONFLICT(user_id, question_id) DO UPDATE SET
+                    user_answer = NULL,
+                    is_correct = excluded.is_correct,
+                    created_at = excluded.created_at
+                WHERE (user_answers.created_at IS NULL OR excluded.created_at >= user_answers.created_at)
+                  AND ({changed_only}
+                       OR user_answers.created_at IS NOT excluded.created_at
+                       OR user_answers.user_answer IS NOT NULL);
+            END
+        ''')
+    except Exception as e:
+        print(f'[WARN] 创建答题投影触发器失败: {e}')
+
+
+def _migrate_progress_orders(conn):
+    """把旧版刷题进度 data 中的 order 数组打包写入 user_progress_orders，并从 data 中移除"""
+    try:
+        rows = conn.execute(
+            "SELECT user_id, p_key, data FROM user_progress "
+            "WHERE p_key LIKE ? AND json_valid(data) AND json_type(data, '$.order') IS NOT NULL",
+            (QUIZ_PROGRESS_PREFIX + '%',)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return
+    for row in rows:
+        try:
+            order = [int(v) for v in (json.loads(row['data']).get('order') or [])]
+        except (TypeError, ValueError, AttributeError):
+            order = []
+        if order:
+            conn.execute(
+                'INSERT OR IGNORE INTO user_progress_orders (user_id, p_key, ids) VALUES (?, ?, ?)',
+                (row['user_id'], row['p_key'], pack_order(order))
+            )
+        conn.execute(
+            "UPDATE user_progress SET data = json_remove(data, '$.order') WHERE user_id = ? AND p_key = ?",
+            (row['user_id'], row['p_key'])
+        )
+    if rows:
+        print(f'[OK] 已迁移 {len(rows)} 条进度的题目顺序')
+
+
+def stats_day_modifier() -> str:
+    """UTC 时间 -> 统计日期的 SQLite 日期修饰符（如 '+8 hours'，按 STATS_UTC_OFFSET_HOURS）"""
+    return f"{int(current_app.config.get('STATS_UTC_OFFSET_HOURS', 8)):+d} hours"
+
+
+def _streak_runs_sql(user_sql: str) -> str:
+    """某用户的连续学习区间（列：n 天数, last 区间最后一天），按日期差与行号之差分组"""
+    return f'''
+        SELECT COUNT(*) AS n, MAX(day) AS last FROM (
+            SELECT day, julianday(day) - ROW_NUMBER() OVER (ORDER BY day) AS grp
+            FROM user_daily_stats WHERE user_id = {user_sql}
+        ) GROUP BY grp'''
+
+
+def _answer_correct_sql(ref: str) -> str:
+    """作答是否答对（0/1；旧数据 is_correct 可能为 NULL，按答错计）"""
+    return f'(IFNULL({ref}.is_correct, 0) = 1)'
+
+
+# 用户学习统计的按题目维度：(汇总表, 维度列, questions 上的取值表达式（{ref} 为题目行别名）)
+USER_STATS_DIMENSIONS = (
+    ('user_subject_stats', 'subject_id', 'IFNULL({ref}.subject_id, 0)'),
+    ('user_type_stats', 'q_type', "IFNULL({ref}.q_type, '')"),
+)
+
+
+def _create_user_stats(conn):
+    """创建用户学习统计投影的维护触发器；首次创建时全量重建
+
+    - user_answers（每题最新作答）：插入/删除增减已答、答对数与所在科目/题型的计数，is_correct 变化时调整答对数
+    - questions：删除前扣减答过该题的用户在其科目/题型下的计数（级联删除作答行时题目行已不可见）；
+      修改科目/题型时把这些计数移到新的科目/题型下
+    - favorites / mistakes / exams：插入、删除（含外键级联）增减对应计数，考试状态变化时调整已交卷数
+    - answer_events：每次作答累加当日作答次数（日期按 STATS_UTC_OFFSET_HOURS 换算到用户时区）；归档删除事件不扣减
+    - user_daily_stats：新增日期时更新 user_activity。晚于最近学习日：连续天数 +1 或重新计为 1；
+      早于最近学习日（离线补交的较早作答）：按该用户全部日期重算连续区间
+    - 时区偏移变化时重建触发器并按热表事件重算每日次数与学习日历
+    """
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    sources = {'user_answers', 'answer_events', 'questions', 'favorites', 'mistakes', 'exams'}
+    if not ({'user_stats', 'user_daily_stats', 'user_activity'} | sources) <= existing_tables:
+        return
+    first_time = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_user_stats_answers_ai'"
+    ).fetchone()
+    day_modifier = stats_day_modifier()
+    local_day = f"DATE(new.answered_at, '{day_modifier}')"
+    events_trigger = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='trigger' AND name='trg_user_stats_events_ai'"
+    ).fetchone()
+    day_changed = bool(events_trigger) and local_day not in events_trigger[0]
+    if day_changed:
+        # 现有每日作答次数按旧偏移分桶，重建时据此扣减热表事件原先计入的次数
+        bucket_modifier = _events_trigger_day_modifier(events_trigger[0])
+        conn.execute('DROP TRIGGER trg_user_stats_events_ai')
+    activity_missing = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_user_activity_next'"
+    ).fetchone()
+
+    c_new, c_old = _answer_correct_sql('new'), _answer_correct_sql('old')
+
+    def dim_inc(source_sql: str) -> str:
+        """按 source_sql（列：user_id, 维度值, total, correct）累加到各维度汇总表"""
+        return ''.join(f'''
+                INSERT INTO {table} (user_id, {column}, total, correct)
+                {source_sql.format(value=value.format(ref='q'))}
+                ON CONFLICT(user_id, {column}) DO UPDATE SET
+                    total = total + excluded.total, correct = correct + excluded.correct;'''
+            for table, column, value in USER_STATS_DIMENSIONS)
+
+    def dim_add(user_sql: str, question_sql: str, total: str, correct: str) -> str:
+        """给某个用户在某道题所属的科目/题型下加上 total / correct（题目不存在时不变）"""
+        return ''.join(f'''
+                UPDATE {table} SET total = total + {total}, correct = correct + {correct}
+                WHERE user_id = {user_sql}
+                  AND {column} = (SELECT {value.format(ref='q')} FROM questions q WHERE q.id = {question_sql});'''
+            for table, column, value in USER_STATS_DIMENSIONS)
+
+    def dim_move_out(ref: str, table: str, column: str, value: str) -> str:
+        """从题目 ref 所在的维度桶中扣除所有答过该题的用户的计数"""
+        return f'''
+                UPDATE {table} SET
+                    total = total - 1,
+                    correct = correct - (SELECT {_answer_correct_sql('ua')} FROM user_answers ua
+                                         WHERE ua.user_id = {table}.user_id AND ua.question_id = {ref}.id)
+                WHERE {column} = {value.format(ref=ref)}
+                  AND user_id IN (SELECT user_id FROM user_answers WHERE question_id = {ref}.id);'''
+
+    def counter(table: str, column: str) -> None:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_{table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO user_stats (user_id, {column}) VALUES (new.user_id, 1)
+                ON CONFLICT(user_id) DO UPDATE SET {column} = {column} + 1;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_{table}_ad AFTER DELETE ON {table} BEGIN
+                UPDATE user_stats SET {column} = {column} - 1 WHERE user_id = old.user_id;
+            END
+        ''')
+
+    try:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_answers_ai AFTER INSERT ON user_answers BEGIN
+                INSERT INTO user_stats (user_id, answered, correct) VALUES (new.user_id, 1, {c_new})
+                ON CONFLICT(user_id) DO UPDATE SET answered = answered + 1, correct = correct + excluded.correct;
+                {dim_inc(f"SELECT new.user_id, {{value}}, 1, {c_new} FROM questions q WHERE q.id = new.question_id")}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_answers_ad AFTER DELETE ON user_answers BEGIN
+                UPDATE user_stats SET answered = answered - 1, correct = correct - {c_old}
+                WHERE user_id = old.user_id;
+                {dim_add('old.user_id', 'old.question_id', '-1', f'-{c_old}')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_answers_au AFTER UPDATE OF is_correct ON user_answers
+            WHEN {c_old} != {c_new} BEGIN
+                UPDATE user_stats SET correct = correct + {c_new} - {c_old} WHERE user_id = new.user_id;
+                {dim_add('new.user_id', 'new.question_id', '0', f'{c_new} - {c_old}')}
+            END
+        ''')
+
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_questions_bd BEFORE DELETE ON questions BEGIN
+                {''.join(dim_move_out('old', *dim) for dim in USER_STATS_DIMENSIONS)}
+            END
+        ''')
+        for table, column, value in USER_STATS_DIMENSIONS:
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_questions_au AFTER UPDATE OF {column} ON questions
+                WHEN {value.format(ref='old')} != {value.format(ref='new')} BEGIN
+                    {dim_move_out('old', table, column, value)}
+                    INSERT INTO {table} (user_id, {column}, total, correct)
+                    SELECT ua.user_id, {value.format(ref='new')}, 1, {_answer_correct_sql('ua')}
+                    FROM user_answers ua WHERE ua.question_id = new.id
+                    ON CONFLICT(user_id, {column}) DO UPDATE SET
+                        total = total + 1, correct = correct + excluded.correct;
+                END
+            ''')
+
+        counter('favorites', 'favorites')
+        counter('mistakes', 'mistakes')
+
+        submitted_new, submitted_old = "IFNULL(new.status = 'submitted', 0)", "IFNULL(old.status = 'submitted', 0)"
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_exams_ai AFTER INSERT ON exams BEGIN
+                INSERT INTO user_stats (user_id, exams, submitted_exams) VALUES (new.user_id, 1, {submitted_new})
+                ON CONFLICT(user_id) DO UPDATE SET
+                    exams = exams + 1, submitted_exams = submitted_exams + excluded.submitted_exams;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_exams_ad AFTER DELETE ON exams BEGIN
+                UPDATE user_stats SET exams = exams - 1, submitted_exams = submitted_exams - {submitted_old}
+                WHERE user_id = old.user_id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_exams_au AFTER UPDATE OF status ON exams
+            WHEN {submitted_old} != {submitted_new} BEGIN
+                UPDATE user_stats SET submitted_exams = submitted_exams + {submitted_new} - {submitted_old}
+                WHERE user_id = new.user_id;
+            END
+        ''')
+
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_events_ai AFTER INSERT ON answer_events BEGIN
+                INSERT INTO user_daily_stats (user_id, day, answered, correct)
+                VALUES (new.user_id, {local_day}, 1, {c_new})
+                ON CONFLICT(user_id, day) DO UPDATE SET answered = answered + 1, correct = correct + excluded.correct;
+            END
+        ''')
+
+        later_than_last = (
+            'NOT EXISTS (SELECT 1 FROM user_activity a WHERE a.user_id = new.user_id AND a.last_day > new.day)'
+        )
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_activity_next AFTER INSERT ON user_daily_stats
+            WHEN {later_than_last} BEGIN
+                INSERT INTO user_activity (user_id, first_day, last_day, current_streak, longest_streak, active_days)
+                VALUES (new.user_id, new.day, new.day, 1, 1, 1)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    current_streak = CASE WHEN last_day = DATE(excluded.last_day, '-1 day')
+                                          THEN current_streak + 1 ELSE 1 END,
+                    longest_streak = MAX(longest_streak, CASE WHEN last_day = DATE(excluded.last_day, '-1 day')
+                                                              THEN current_streak + 1 ELSE 1 END),
+                    last_day = excluded.last_day,
+                    active_days = active_days + 1;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_activity_past AFTER INSERT ON user_daily_stats
+            WHEN NOT {later_than_last} BEGIN
+                UPDATE user_activity SET
+                    first_day = MIN(first_day, new.day),
+                    active_days = active_days + 1,
+                    current_streak = (SELECT n FROM ({_streak_runs_sql('new.user_id')}) ORDER BY last DESC LIMIT 1),
+                    longest_streak = (SELECT MAX(n) FROM ({_streak_runs_sql('new.user_id')}))
+                WHERE user_id = new.user_id;
+            END
+        ''')
+    except Exception as e:
+        print(f'[WARN] 创建用户学习统计触发器失败: {e}')
+        return
+
+    if first_time:
+        rebuild_user_stats(conn)
+    elif day_changed:
+        rebuild_user_stats(conn, daily_only=True, bucket_modifier=bucket_modifier)
+    elif activity_missing:
+        _rebuild_user_activity(conn)
+
+
+# 每日作答次数触发器中的分桶日期表达式（旧版本按 UTC 日期分桶，没有修饰符）
+_EVENTS_DAY_PATTERN = re.compile(r"DATE\(new\.answered_at(?:,\s*'([^']*)')?\)")
+
+
+def _events_trigger_day_modifier(trigger_sql: str) -> str:
+    """trg_user_stats_events_ai 的 SQL -> 建触发器时使用的日期修饰符"""
+    match = _EVENTS_DAY_PATTERN.search(trigger_sql)
+    return (match.group(1) if match else None) or '+0 hours'
+
+
+def rebuild_user_stats(conn, user_id: Optional[int] = None, daily_only: bool = False,
+                       bucket_modifier: Optional[str] = None) -> None:
+    """按源表全量重建用户学习统计（user_id 为空时重建全部用户；调用方负责 commit）
+
+    每日作答次数只能按热表中的答题事件重建。按现有分桶，热表最早事件所在日（分界日）之后的日期只含热表事件，
+    整体删除后重新汇总；分界日可能还含已归档的作答，只扣减热表事件原先计入的次数；更早的日期保留原值。
+    增量维护时删除题目/用户不扣减已发生的作答次数，重建后分界日之后的这部分次数不再计入
+
+    Args:
+        daily_only: 只重建每日作答次数与学习日历（时区偏移变化时）
+        bucket_modifier: 现有 user_daily_stats 分桶时使用的日期修饰符（时区偏移变化时为旧偏移；默认为当前偏移）
+    """
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    and_user = 'AND user_id = ?' if user_id is not None else ''
+    only_user = 'AND ua.user_id = ?' if user_id is not None else ''
+    live_user = 'EXISTS (SELECT 1 FROM users u WHERE u.id = ua.user_id)'
+
+    if not daily_only:
+        _rebuild_user_counters(conn, user_id)
+
+    day_modifier = stats_day_modifier()
+    bucket_modifier = bucket_modifier or day_modifier
+    boundary = conn.execute(
+        'SELECT DATE(MIN(answered_at), ?) FROM answer_events', (bucket_modifier,)
+    ).fetchone()[0]
+    if boundary:
+        conn.execute(f'DELETE FROM user_daily_stats WHERE day > ? {and_user}', (boundary, *params))
+        hot_on_boundary = '''
+            FROM answer_events ua
+            WHERE ua.user_id = user_daily_stats.user_id AND DATE(ua.answered_at, ?) = user_daily_stats.day
+        '''
+        conn.execute(f'''
+            UPDATE user_daily_stats SET
+                answered = answered - (SELECT COUNT(*) {hot_on_boundary}),
+                correct = correct - (SELECT IFNULL(SUM({_answer_correct_sql('ua')}), 0) {hot_on_boundary})
+            WHERE day = ? {and_user}
+        ''', (bucket_modifier, bucket_modifier, boundary, *params))
+        conn.execute(f'DELETE FROM user_daily_stats WHERE day = ? AND answered <= 0 {and_user}', (boundary, *params))
+        # 先清空学习日历汇总，按日期顺序插入时触发器只走“晚于最近学习日”的分支，最后再整体重算
+        conn.execute(f'DELETE FROM user_activity {where}', params)
+        conn.execute(f'''
+            INSERT INTO user_daily_stats (user_id, day, answered, correct)
+            SELECT ua.user_id, DATE(ua.answered_at, ?), COUNT(*), SUM({_answer_correct_sql('ua')})
+            FROM answer_events ua
+            WHERE {live_user} {only_user}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+            ON CONFLICT(user_id, day) DO UPDATE SET
+                answered = answered + excluded.answered, correct = correct + excluded.correct
+        ''', (day_modifier, *params))
+    _rebuild_user_activity(conn, user_id)
+
+
+def _rebuild_user_activity(conn, user_id: Optional[int] = None) -> None:
+    """按 user_daily_stats 重算学习日历汇总（user_activity）"""
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    conn.execute(f'DELETE FROM user_activity {where}', params)
+    conn.execute(f'''
+        WITH runs AS (
+            SELECT user_id, COUNT(*) AS n, MIN(day) AS first, MAX(day) AS last FROM (
+                SELECT user_id, day, julianday(day) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day) AS grp
+                FROM user_daily_stats {where}
+            ) GROUP BY user_id, grp
+        )
+        INSERT INTO user_activity (user_id, first_day, last_day, current_streak, longest_streak, active_days)
+        SELECT r.user_id, MIN(r.first), MAX(r.last),
+               (SELECT r2.n FROM runs r2 WHERE r2.user_id = r.user_id ORDER BY r2.last DESC LIMIT 1),
+               MAX(r.n), SUM(r.n)
+        FROM runs r
+        GROUP BY r.user_id
+    ''', params)
+
+
+def _rebuild_user_counters(conn, user_id: Optional[int] = None) -> None:
+    """按源表重建 user_stats 与按科目/题型的计数"""
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    only_user = 'AND ua.user_id = ?' if user_id is not None else ''
+    live_user = 'EXISTS (SELECT 1 FROM users u WHERE u.id = ua.user_id)'
+
+    conn.execute(f'DELETE FROM user_stats {where}', params)
+    conn.execute(f'''
+        INSERT INTO user_stats (user_id, answered, correct, favorites, mistakes, exams, submitted_exams)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM user_answers ua WHERE ua.user_id = u.id),
+               (SELECT COUNT(*) FROM user_answers ua WHERE ua.user_id = u.id AND ua.is_correct = 1),
+               (SELECT COUNT(*) FROM favorites f WHERE f.user_id = u.id),
+               (SELECT COUNT(*) FROM mistakes m WHERE m.user_id = u.id),
+               (SELECT COUNT(*) FROM exams e WHERE e.user_id = u.id),
+               (SELECT COUNT(*) FROM exams e WHERE e.user_id = u.id AND e.status = 'submitted')
+        FROM users u
+        {'WHERE u.id = ?' if user_id is not None else ''}
+    ''', params)
+
+    for table, column, value in USER_STATS_DIMENSIONS:
+        conn.execute(f'DELETE FROM {table} {where}', params)
+        conn.execute(f'''
+            INSERT INTO {table} (user_id, {column}, total, correct)
+            SELECT ua.user_id, {value.format(ref='q')}, COUNT(*), SUM({_answer_correct_sql('ua')})
+            FROM user_answers ua JOIN questions q ON q.id = ua.question_id
+            WHERE {live_user} {only_user}
+            GROUP BY 1, 2
+        ''', params)
+
+
+def _create_search_indexes(conn):
+    """创建聊天用户搜索索引（FTS5 trigram：支持任意子串匹配，大小写不敏感）
+
+    - user_search_fts：外部内容表，内容来自 users.username
+    - user_remark_fts：外部内容表，内容来自 user_remarks.remark（按 owner_user_id 过滤）
+    - user_admin_search_fts：外部内容表，内容来自 users.username / users.email（仅管理后台用户列表使用，
+      聊天搜索不能按邮箱查到用户，因此与 user_search_fts 分开）
+    - 通过触发器随 users/user_remarks 的增删改自动同步
+
+    SQLite 未编译 FTS5 或版本低于 3.34（无 trigram）时跳过，搜索接口自动回退到 LIKE。
+    """
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+
+    try:
+        if 'user_search_fts' not in existing_tables:
+            conn.execute('''
+                CREATE VIRTUAL TABLE user_search_fts USING fts5(
+                    username,
+                    content='users', content_rowid='id',
+                    tokenize='trigram'
+                )
+            ''')
+            conn.execute("INSERT INTO user_search_fts(user_search_fts) VALUES('rebuild')")
+
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_ai AFTER INSERT ON users BEGIN
+                INSERT INTO user_search_fts(rowid, username) VALUES (new.id, new.username);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_ad AFTER DELETE ON users BEGIN
+                INSERT INTO user_search_fts(user_search_fts, rowid, username) VALUES ('delete', old.id, old.username);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_au AFTER UPDATE OF username ON users BEGIN
+                INSERT INTO user_search_fts(user_search_fts, rowid, username) VALUES ('delete', old.id, old.username);
+                INSERT INTO user_search_fts(rowid, username) VALUES (new.id, new.username);
+            END
+        ''')
+
+        if 'user_remark_fts' not in existing_tables:
+            conn.execute('''
+                CREATE VIRTUAL TABLE user_remark_fts USING fts5(
+                    remark,
+                    owner_user_id UNINDEXED,
+                    content='user_remarks', content_rowid='id',
+                    tokenize='trigram'
+                )
+            ''')
+            conn.execute("INSERT INTO user_remark_fts(user_remark_fts) VALUES('rebuild')")
+
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_user_remarks_fts_ai AFTER INSERT ON user_remarks BEGIN
+                INSERT INTO user_remark_fts(rowid, remark, owner_user_id) VALUES (new.id, new.remark, new.owner_user_id);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_user_remarks_fts_ad AFTER DELETE ON user_remarks BEGIN
+                INSERT INTO user_remark_fts(user_remark_fts, rowid, remark, owner_user_id) VALUES ('delete', old.id, old.remark, old.owner_user_id);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_user_remarks_fts_au AFTER UPDATE ON user_remarks BEGIN
+                INSERT INTO user_remark_fts(user_remark_fts, rowid, remark, owner_user_id) VALUES ('delete', old.id, old.remark, old.owner_user_id);
+                INSERT INTO user_remark_fts(rowid, remark, owner_user_id) VALUES (new.id, new.remark, new.owner_user_id);
+            END
+        ''')
+
+        if 'user_admin_search_fts' not in existing_tables:
+            conn.execute('''
+                CREATE VIRTUAL TABLE user_admin_search_fts USING fts5(
+                    username, email,
+                    content='users', content_rowid='id',
+                    tokenize='trigram'
+                )
+            ''')
+            conn.execute("INSERT INTO user_admin_search_fts(user_admin_search_fts) VALUES('rebuild')")
+
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_admin_fts_ai AFTER INSERT ON users BEGIN
+                INSERT INTO user_admin_search_fts(rowid, username, email) VALUES (new.id, new.username, new.email);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_admin_fts_ad AFTER DELETE ON users BEGIN
+                INSERT INTO user_admin_search_fts(user_admin_search_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_admin_fts_au AFTER UPDATE OF username, email ON users BEGIN
+                INSERT INTO user_admin_search_fts(user_admin_search_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email);
+                INSERT INTO user_admin_search_fts(rowid, username, email) VALUES (new.id, new.username, new.email);
+            END
+        ''')
+    except Exception as e:
+        print(f'[WARN] 用户搜索索引（FTS5 trigram）不可用，回退到 LIKE 搜索: {e}')
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件与静态资源分发
+
+说明：
+- 内容寻址文件（blobs/<sha256>.<ext>）：文件名即强 ETag，返回 immutable 长缓存
+- 旧版 uuid/时间戳命名文件：首次访问计算 sha256 作为强 ETag，与文件大小/mtime 一起存入 upload_etags 表
+  （进程重启、多个 worker 之间共享，不再重复读文件），进程内再缓存一层；之后只做 304 校验
+- 配置 UPLOAD_ACCEL_REDIRECT_PREFIX 时通过 X-Accel-Redirect 交给 Nginx 发送文件；
+  配置 USE_X_SENDFILE 时由 Flask send_file 输出 X-Sendfile；否则由 Python 直接发送（支持 Range）
+- /static 资源：url_for('static', ...) 自动追加 ?v=<内容指纹>，命中指纹的请求返回 immutable 长缓存
+"""
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+from flask import Flask, abort, current_app, request, send_file
+from werkzeug.security import safe_join
+from . import blob_store
+from .database import get_db
+
+# (abs_path, size, mtime_ns) -> 指纹；文件变化后 key 随之变化，旧条目自然失效
+_FingerprintKey = Tuple[str, int, int]
+_etag_cache: Dict[_FingerprintKey, str] = {}
+_static_cache: Dict[_FingerprintKey, str] = {}
+_cache_lock = threading.Lock()
+_CACHE_MAX_ENTRIES = 8192
+
+
+def _file_key(abs_path: str) -> Optional[_FingerprintKey]:
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return None
+    return (abs_path, st.st_size, st.st_mtime_ns)
+
+
+def _hash_file(abs_path: str, algo: str = 'sha256') -> str:
+    h = hashlib.new(algo)
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(blob_store.CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cached_digest(cache: Dict[_FingerprintKey, str], key: _FingerprintKey, algo: str) -> str:
+    with _cache_lock:
+        digest = cache.get(key)
+    if digest:
+        return digest
+    digest = _hash_file(key[0], algo)
+    with _cache_lock:
+        if len(cache) >= _CACHE_MAX_ENTRIES:
+            cache.clear()
+        cache[key] = digest
+    return digest
+
+
+def _stored_etag(filename: str, key: _FingerprintKey) -> str:
+    """旧版上传文件的 sha256：优先读 upload_etags，缺失或文件已变化时计算并写回"""
+    path = filename.replace('\\', '/')
+    conn = get_db()
+    try:
+        row = conn.execute(
+            'SELECT sha256 FROM upload_etags WHERE path = ? AND size = ? AND mtime_ns = ?',
+            (path, key[1], key[2])
+        ).fetchone()
+    except sqlite3.Error:
+        row = None
+    if row:
+        return row[0]
+    digest = _hash_file(key[0], 'sha256')
+    try:
+        conn.execute(
+            'INSERT OR REPLACE INTO upload_etags (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)',
+            (path, key[1], key[2], digest)
+        )
+        conn.commit()
+    except sqlite3.Error:
+        # 写入失败（如数据库繁忙）不影响本次响应，下次访问再写
+        conn.rollback()
+    return digest
+
+
+def upload_etag(filename: str, abs_path: str) -> Optional[str]:
+    """获取上传文件的强 ETag（blob 直接取文件名中的哈希，不读文件）"""
+    sha256 = blob_store.parse_blob_ref(filename)
+    if sha256:
+        return sha256
+    key = _file_key(abs_path)
+    if key is None:
+        return None
+    with _cache_lock:
+        digest = _etag_cache.get(key)
+    if digest:
+        return digest
+    digest = _stored_etag(filename, key)
+    with _cache_lock:
+        if len(_etag_cache) >= _CACHE_MAX_ENTRIES:
+            _etag_cache.clear()
+        _etag_cache[key] = digest
+    return digest
+
+
+def send_upload(filename: str, upload_root: Optional[str] = None):
+    """分发 UPLOAD_FOLDER 下的文件
+
+    Args:
+        filename: 相对上传根目录的路径（如 blobs/ab/<sha256>.png、avatars/x.png）
+        upload_root: 上传根目录，默认取 UPLOAD_FOLDER
+
+    Returns:
+        Response
+    """
+    upload_root = upload_root or current_app.config['UPLOAD_FOLDER']
+    abs_path = safe_join(upload_root, filename)
+    if abs_path is None or not os.path.isfile(abs_path):
+        abort(404)
+
+    is_immutable = blob_store.parse_blob_ref(filename) is not None
+    if is_immutable:
+        max_age = int(current_app.config.get('UPLOAD_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+        cache_control = f'public, max-age={max_age}, immutable'
+    else:
+        # 非内容寻址文件可能被覆盖，只允许缓存后校验（ETag 命中返回 304，无需传输内容）
+        cache_control = 'public, no-cache'
+
+    etag = upload_etag(filename, abs_path)
+
+    # 快速 304：不打开文件、不进入 send_file
+    if etag and request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = cache_control
+        return resp
+
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT_PREFIX') or ''
+    if accel_prefix:
+        # 由 Nginx internal location 发送文件体（Range/sendfile 由 Nginx 处理）
+        resp = current_app.response_class(status=200)
+        resp.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(filename.replace('\\', '/'))
+        resp.headers['Content-Type'] = mimetypes.guess_type(abs_path)[0] or 'application/octet-stream'
+    else:
+        # USE_X_SENDFILE 开启时 send_file 会自动输出 X-Sendfile；否则纯 Python 发送
+        resp = send_file(abs_path, conditional=True, etag=etag or True)
+
+    if etag:
+        resp.set_etag(etag)
+    resp.headers['Cache-Control'] = cache_control
+    # 让浏览器/音频组件更愿意做断点/Range 拉取（部分移动端对流式更敏感）
+    resp.headers.setdefault('Accept-Ranges', 'bytes')
+    return resp
+
+
+def static_fingerprint(app: Flask, filename: str) -> Optional[str]:
+    """计算 /static 文件的内容指纹（按 mtime/size 缓存，只计算一次）"""
+    if not app.static_folder:
+        return None
+    abs_path = safe_join(app.static_folder, filename)
+    if abs_path is None:
+        return None
+    key = _file_key(abs_path)
+    if key is None:
+        return None
+    return _cached_digest(_static_cache, key, 'md5')[:12]
+
+
+def init_static_fingerprint(app: Flask) -> None:
+    """启用 /static 资源指纹
+
+    - url_for('static', filename=...) 自动追加 v=<指纹>
+    - 请求携带的 v 与当前文件指纹一致时，返回 immutable 长缓存；
+      不一致（旧页面引用旧版本）时仅短缓存，避免把新内容长期缓存在旧 URL 下
+    """
+
+    @app.url_defaults
+    def _add_static_version(endpoint, values):
+        if endpoint != 'static' or 'v' in values:
+            return
+        filename = values.get('filename')
+        if not filename:
+            return
+        version = static_fingerprint(app, filename)
+        if version:
+            values['v'] = version
+
+    @app.after_request
+    def _static_cache_headers(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        version = request.args.get('v')
+        filename = (request.view_args or {}).get('filename')
+        if version and filename and version == static_fingerprint(app, filename):
+            max_age = int(app.config.get('STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+            response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'public, no-cache'
+        return response
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+重量级可选依赖的延迟导入
+
+openpyxl 等依赖只在管理后台的导入/导出等少数路径使用，模块级导入会让每个
+worker 启动时都付出导入耗时与常驻内存。lazy_import 返回一个模块代理，
+首次访问属性时才真正导入；依赖缺失时在使用处抛出带安装提示的 ImportError。
+
+用法：
+    openpyxl = lazy_import('openpyxl')
+    wb = openpyxl.Workbook(write_only=True)   # 此时才导入 openpyxl
+"""
+import importlib
+import threading
+from types import ModuleType
+from typing import Dict, Optional
+
+# 通过 lazy_import 声明的模块（启动检查要求它们不在启动阶段被导入）
+LAZY_MODULES: Dict[str, Optional[str]] = {}
+
+
+class LazyModule(ModuleType):
+    """模块代理：第一次访问属性时导入真实模块"""
+
+    def __init__(self, name: str, install_hint: Optional[str] = None):
+        super().__init__(name)
+        self.__dict__['_lazy_hint'] = install_hint
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_lock'] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with self.__dict__['_lazy_lock']:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    try:
+                        module = importlib.import_module(self.__name__)
+                    except ImportError as e:
+                        hint = self.__dict__['_lazy_hint'] or f'pip install {self.__name__}'
+                        raise ImportError(f'缺少可选依赖 {self.__name__}，请先安装：{hint}') from e
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f'<lazy module {self.__name__!r} ({state})>'
+
+
+def lazy_import(name: str, install_hint: Optional[str] = None) -> LazyModule:
+    """
+    声明一个延迟导入的模块
+
+    Args:
+        name: 模块名（如 'openpyxl'）
+        install_hint: 依赖缺失时的安装提示
+
+    Returns:
+        模块代理（首次访问属性时导入）
+    """
+    LAZY_MODULES.setdefault(name, install_hint)
+    return LazyModule(name, install_hint)
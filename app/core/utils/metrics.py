@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+统计汇总读取
+
+metric_daily / metric_daily_distinct 由源表上的触发器维护（指标定义见 database.METRIC_SOURCES），
+这里的函数只读取汇总行：总数是某指标全部日期之和，时间范围统计只读对应日期的桶，
+耗时与源表大小无关。日期为 UTC（与 SQLite DATE('now') 一致）。
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core.utils.database import METRIC_DISTINCT_RETENTION_DAYS
+
+
+def total(conn, metric: str, dim: Optional[Any] = None) -> int:
+    """指标总数（dim 为 None 时汇总全部维度）"""
+    if dim is None:
+        row = conn.execute('SELECT SUM(n) FROM metric_daily WHERE metric = ?', (metric,)).fetchone()
+    else:
+        row = conn.execute(
+            'SELECT SUM(n) FROM metric_daily WHERE metric = ? AND dim = ?', (metric, str(dim))
+        ).fetchone()
+    return row[0] or 0
+
+
+def totals_by_dim(conn, metric: str, dims: Optional[Iterable[Any]] = None) -> Dict[str, int]:
+    """按维度汇总的指标总数 {dim: n}（dims 为空时返回全部维度）"""
+    if dims is None:
+        rows = conn.execute(
+            'SELECT dim, SUM(n) FROM metric_daily WHERE metric = ? GROUP BY dim', (metric,)
+        ).fetchall()
+    else:
+        dims = [str(d) for d in dims]
+        if not dims:
+            return {}
+        placeholders = ','.join('?' * len(dims))
+        rows = conn.execute(
+            f'SELECT dim, SUM(n) FROM metric_daily WHERE metric = ? AND dim IN ({placeholders}) GROUP BY dim',
+            [metric, *dims]
+        ).fetchall()
+    return {row[0]: row[1] or 0 for row in rows}
+
+
+def recent(conn, metric: str, days: int = 1) -> int:
+    """最近 days 个自然日（含今天）的新增数"""
+    row = conn.execute(
+        'SELECT SUM(n) FROM metric_daily WHERE metric = ? AND day >= DATE(\'now\', ?)',
+        (metric, f'-{max(days, 1) - 1} days')
+    ).fetchone()
+    return row[0] or 0
+
+
+def daily_series(conn, metric: str, start: date, end: date, dim: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """
+    按日序列（缺失的日期补 0）
+
+    Args:
+        conn: 数据库连接
+        metric: 指标名
+        start / end: 日期范围（含两端）
+        dim: 维度（None 表示汇总全部维度）
+
+    Returns:
+        [{'day': 'YYYY-MM-DD', 'n': int}, ...]
+    """
+    sql = 'SELECT day, SUM(n) FROM metric_daily WHERE metric = ? AND day >= ? AND day <= ?'
+    params: List[Any] = [metric, start.isoformat(), end.isoformat()]
+    if dim is not None:
+        sql += ' AND dim = ?'
+        params.append(str(dim))
+    counts = {row[0]: row[1] or 0 for row in conn.execute(sql + ' GROUP BY day', params).fetchall()}
+    return [
+        {'day': (start + timedelta(days=i)).isoformat(), 'n': counts.get((start + timedelta(days=i)).isoformat(), 0)}
+        for i in range((end - start).days + 1)
+    ]
+
+
+def distinct_recent(conn, metric: str, days: int) -> int:
+    """最近 days 个自然日（含今天）出现过的不同成员数（如活跃会话数）"""
+    row = conn.execute(
+        'SELECT COUNT(DISTINCT member) FROM metric_daily_distinct WHERE metric = ? AND day >= DATE(\'now\', ?)',
+        (metric, f'-{max(days, 1) - 1} days')
+    ).fetchone()
+    return row[0] or 0
+
+
+def prune_distinct(conn, retention_days: int = METRIC_DISTINCT_RETENTION_DAYS) -> int:
+    """删除超过保留天数的去重统计行（后台任务定期调用；调用方负责 commit）"""
+    cur = conn.execute(
+        'DELETE FROM metric_daily_distinct WHERE day < DATE(\'now\', ?)', (f'-{retention_days} days',)
+    )
+    return cur.rowcount
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+键集分页游标
+
+游标是 (排序键, id) 的 base64url JSON 编码，列表接口据此从上一页末尾继续读取，
+深翻页不需要 OFFSET 扫描。游标对客户端是不透明的字符串。
+"""
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    raw = json.dumps([sort_value, row_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    """解析游标；格式不合法时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
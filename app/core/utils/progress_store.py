@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+答题进度存储
+
+user_progress.data 只保存小字段（当前题号、作答状态、作答内容、时间戳），题目顺序单独存放在
+user_progress_orders，只在首次打乱或重新打乱时写入，日常进度同步不再重写顺序：
+- seed + bank_version：种子顺序（见 seeded_order），按需重算，每行只有两个整数
+- ids：小端 uint32 打包的题目ID数组（约 4 字节/题），旧版进度迁移而来或旧页面提交的显式顺序；
+  使用种子顺序时为空
+
+进度同步接受 JSON Merge Patch（RFC 7396）形式的增量：只包含变化的字段，值为 null 表示删除该键，
+由 SQLite json_patch 在一条 UPSERT 内合并，无需先读后写。
+
+/api/progress 也用于保存设置、组卷模板等任意 JSON，题目顺序的拆分只针对刷题进度（QUIZ_PROGRESS_PREFIX 开头的 key）。
+"""
+import base64
+import json
+import sys
+from array import array
+from typing import Any, Dict, List, Optional
+
+# 刷题进度 key 前缀（与 question_delivery_service.progress_key 一致）
+QUIZ_PROGRESS_PREFIX = 'quiz_progress_'
+
+
+def pack_order(ids: List[int]) -> bytes:
+    """题目ID列表 -> 小端 uint32 字节串"""
+    packed = array('I', ids)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_order(blob: Optional[bytes]) -> List[int]:
+    """小端 uint32 字节串 -> 题目ID列表（空值或长度不合法时返回空列表）"""
+    if not blob or len(blob) % 4:
+        return []
+    packed = array('I')
+    packed.frombytes(bytes(blob))
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tolist()
+
+
+def parse_order(value: Any) -> Optional[List[int]]:
+    """
+    请求中的题目顺序 -> 题目ID列表
+
+    支持 base64 编码的打包数组（前端 Uint32Array）与旧版的 JSON 整数列表；无法解析时返回 None
+    """
+    if isinstance(value, str):
+        try:
+            raw = base64.b64decode(value, validate=True)
+        except ValueError:
+            return None
+        return unpack_order(raw) if len(raw) % 4 == 0 else None
+    if isinstance(value, list):
+        try:
+            return [int(v) for v in value]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def get(conn, user_id: int, p_key: str) -> Any:
+    """读取进度（刷题进度不含题目顺序）；没有进度时返回 None"""
+    row = conn.execute(
+        'SELECT data FROM user_progress WHERE user_id = ? AND p_key = ?', (user_id, p_key)
+    ).fetchone()
+    if not row:
+        return None
+    data = json.loads(row['data'])
+    if isinstance(data, dict) and p_key.startswith(QUIZ_PROGRESS_PREFIX):
+        data.pop('order', None)
+    return data
+
+
+def get_order(conn, user_id: int, p_key: str) -> Optional[Dict[str, Any]]:
+    """
+    读取保存的题目顺序
+
+    Returns:
+        {'seed', 'bank_version'}（种子顺序）或 {'ids': [题目ID, ...]}（显式顺序）；没有保存时返回 None
+    """
+    row = conn.execute(
+        'SELECT ids, seed, bank_version FROM user_progress_orders WHERE user_id = ? AND p_key = ?',
+        (user_id, p_key)
+    ).fetchone()
+    if not row:
+        return None
+    if row['seed'] is not None:
+        return {'seed': row['seed'], 'bank_version': row['bank_version'] or 0}
+    ids = unpack_order(row['ids'])
+    return {'ids': ids} if ids else None
+
+
+def set_order(conn, user_id: int, p_key: str, ids: List[int]) -> None:
+    """保存显式题目顺序（不提交）"""
+    conn.execute(
+        '''
+        INSERT INTO user_progress_orders (user_id, p_key, ids) VALUES (?, ?, ?)
+        ON CONFLICT(user_id, p_key) DO UPDATE SET
+            ids = excluded.ids, seed = NULL, bank_version = NULL, updated_at = CURRENT_TIMESTAMP
+        ''',
+        (user_id, p_key, pack_order(ids))
+    )
+
+
+def set_seed(conn, user_id: int, p_key: str, seed: int, bank_version: int) -> None:
+    """保存种子顺序（不提交）"""
+    conn.execute(
+        '''
+        INSERT INTO user_progress_orders (user_id, p_key, ids, seed, bank_version) VALUES (?, ?, X'', ?, ?)
+        ON CONFLICT(user_id, p_key) DO UPDATE SET
+            ids = X'', seed = excluded.seed, bank_version = excluded.bank_version, updated_at = CURRENT_TIMESTAMP
+        ''',
+        (user_id, p_key, seed, bank_version)
+    )
+
+
+def replace(conn, user_id: int, p_key: str, data: Any) -> None:
+    """整体覆盖进度（不提交；刷题进度 data 中的 order 列表转存到 user_progress_orders）"""
+    order = None
+    if isinstance(data, dict) and p_key.startswith(QUIZ_PROGRESS_PREFIX) and 'order' in data:
+        data = dict(data)
+        order = parse_order(data.pop('order'))
+    conn.execute(
+        '''
+        INSERT INTO user_progress (user_id, p_key, data, updated_at, created_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id, p_key) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+        ''',
+        (user_id, p_key, json.dumps(data, ensure_ascii=False))
+    )
+    if order:
+        set_order(conn, user_id, p_key, order)
+
+
+def merge(conn, user_id: int, p_key: str, patch: Dict[str, Any]) -> None:
+    """
+    按 JSON Merge Patch 合并进度增量（不提交；一条 UPSERT）
+
+    patch 示例：{"index": 12, "timestamp": 1700000000000, "status": {"11": "correct"}, "answers": {"11": ["A"], "3": null}}
+    """
+    patch_json = json.dumps(patch, ensure_ascii=False)
+    conn.execute(
+        '''
+        INSERT INTO user_progress (user_id, p_key, data, updated_at, created_at)
+        VALUES (?, ?, json_patch('{}', ?), CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id, p_key) DO UPDATE SET
+            data = json_patch(user_progress.data, ?),
+            updated_at = CURRENT_TIMESTAMP
+        ''',
+        (user_id, p_key, patch_json, patch_json)
+    )
+
+
+def delete(conn, user_id: int, p_key: str) -> None:
+    """删除进度与题目顺序（不提交）"""
+    conn.execute('DELETE FROM user_progress WHERE user_id = ? AND p_key = ?', (user_id, p_key))
+    conn.execute('DELETE FROM user_progress_orders WHERE user_id = ? AND p_key = ?', (user_id, p_key))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+题库计数读取
+
+question_counts 按 (科目, 题型) 记录题目数，由 questions 上的触发器维护
+（见 database._create_question_summaries；subject_id 为 NULL 的题目记在 0 下）。
+这里的函数只汇总计数表中的少量行，耗时与题库大小无关；科目名称、锁定状态、
+用户权限等筛选先在 subjects 上换算成科目ID。
+"""
+from typing import Dict, Iterable, List, Optional
+
+
+def _subject_filter(subject_ids: Optional[Iterable[int]]):
+    if subject_ids is None:
+        return '', []
+    ids = list(subject_ids)
+    return f" AND subject_id IN ({','.join('?' * len(ids)) or 'NULL'})", ids
+
+
+def total(conn, subject_ids: Optional[Iterable[int]] = None, q_type: Optional[str] = None) -> int:
+    """
+    题目数
+
+    Args:
+        subject_ids: 只统计这些科目（None 表示全部题目，含未分科目的题目）
+        q_type: 只统计该题型（None / 'all' 表示全部题型）
+    """
+    where, params = _subject_filter(subject_ids)
+    if q_type and q_type != 'all':
+        where += ' AND q_type = ?'
+        params.append(q_type)
+    row = conn.execute(f'SELECT SUM(n) FROM question_counts WHERE 1=1{where}', params).fetchone()
+    return row[0] or 0
+
+
+def by_subject(conn) -> Dict[int, int]:
+    """各科目题目数 {subject_id: n}（不含未分科目的题目）"""
+    rows = conn.execute(
+        'SELECT subject_id, SUM(n) FROM question_counts WHERE subject_id != 0 GROUP BY subject_id'
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def q_types(conn, subject_ids: Optional[Iterable[int]] = None) -> List[str]:
+    """题库中现有的题型（subject_ids 不为 None 时只看这些科目）"""
+    where, params = _subject_filter(subject_ids)
+    rows = conn.execute(
+        f'SELECT DISTINCT q_type FROM question_counts WHERE n > 0{where} ORDER BY q_type', params
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def q_types_by_subject(conn, subject_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """各科目下现有的题型 {subject_id: [题型, ...]}（没有题目的科目不包含在内）"""
+    where, params = _subject_filter(subject_ids)
+    result: Dict[int, List[str]] = {}
+    for row in conn.execute(
+        f'SELECT subject_id, q_type FROM question_counts WHERE n > 0{where} ORDER BY subject_id, q_type', params
+    ).fetchall():
+        result.setdefault(row[0], []).append(row[1])
+    return result
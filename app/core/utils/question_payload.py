@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+题目载荷缓存
+
+题目的内容派生数据（解析后的选项、完整答案、规范化的图片路径）与用户无关，却在刷题页、
+搜索页、聊天题目卡片等每次请求中逐行重新解析。这里把它预先序列化为紧凑 JSON：
+
+- question_payloads：每题一行载荷（按需生成并写回）；题目内容变化或删除时由触发器删除对应行，
+  同时递增 question_payload_generation.generation
+- 进程内 LRU：缓存反序列化后的载荷；每次读取先比较 generation，变化时整体清空
+  （多进程部署下其它进程修改题目也能及时失效）
+
+返回的载荷字典为缓存共享对象，调用方需要修改时先复制（如打乱选项）。
+"""
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core.utils.database import QUESTION_PAYLOAD_COLUMNS as SOURCE_COLUMNS
+from app.core.utils.options_parser import parse_options
+
+DEFAULT_CACHE_SIZE = 5000
+# 单条语句 IN 列表的 ID 数上限
+_CHUNK_SIZE = 500
+
+
+def _image_path_json(image_path: Any) -> str:
+    """图片路径 -> JSON 数组文本（旧数据为单个路径字符串）"""
+    if image_path and isinstance(image_path, str):
+        if image_path.strip().startswith('[') and image_path.strip().endswith(']'):
+            return image_path
+        return json.dumps([image_path])
+    return '[]'
+
+
+def build_payload(row) -> Dict[str, Any]:
+    """
+    题目行 -> 载荷
+
+    Args:
+        row: 至少包含 id 与 SOURCE_COLUMNS 的题目行
+
+    Returns:
+        {'id', 'q_type', 'content', 'options', 'answer', 'full_answer',
+         'explanation', 'image_path', 'image_path_json'}
+    """
+    try:
+        # 统一 options 解析（兼容有/无 A/B 前缀、数字列表、结构化等）
+        options = parse_options(row['options']) if row['options'] else []
+    except Exception:
+        options = []
+
+    answer = row['answer'] or ''
+    # 完整答案：单选答案附上选项文本（如 "B. 内容"），其余保持原答案
+    answer_key = str(answer).strip()
+    full_answer = answer_key
+    for opt in options:
+        if opt['key'] == answer_key:
+            full_answer = f"{answer_key}. {opt['value']}"
+            break
+
+    return {
+        'id': row['id'],
+        'q_type': row['q_type'],
+        'content': row['content'],
+        'options': options,
+        'answer': answer,
+        'full_answer': full_answer,
+        'explanation': row['explanation'] or '',
+        'image_path': row['image_path'] or '',
+        'image_path_json': _image_path_json(row['image_path']),
+    }
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+class _PayloadLRU:
+    """线程安全的载荷 LRU（按 generation 整体失效）"""
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.generation: Optional[int] = None
+        self._data: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sync(self, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                self._data.clear()
+                self.generation = generation
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        found = {}
+        with self._lock:
+            for qid in ids:
+                payload = self._data.get(qid)
+                if payload is not None:
+                    self._data.move_to_end(qid)
+                    found[qid] = payload
+        return found
+
+    def put_many(self, payloads: Dict[int, Dict[str, Any]], generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            for qid, payload in payloads.items():
+                self._data[qid] = payload
+                self._data.move_to_end(qid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.generation = None
+
+
+_cache = _PayloadLRU()
+
+
+def configure(maxsize: int) -> None:
+    """设置进程内 LRU 容量（create_app 时按 QUESTION_PAYLOAD_CACHE_SIZE 调用）"""
+    _cache.maxsize = max(int(maxsize), 0)
+    _cache.clear()
+
+
+def clear_cache() -> None:
+    """清空进程内 LRU"""
+    _cache.clear()
+
+
+def _current_generation(conn) -> int:
+    row = conn.execute('SELECT generation FROM question_payload_generation WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        yield ids[start:start + _CHUNK_SIZE]
+
+
+def _store(conn, payloads: Dict[int, Dict[str, Any]], generation: int) -> None:
+    """
+    写回新生成的载荷
+
+    只在 generation 未变化时写入（生成期间题目被修改则放弃，避免写回旧内容）；
+    调用方已有未提交的事务时不写回，以免提前提交调用方的修改
+    """
+    if not payloads or conn.in_transaction:
+        return
+    try:
+        conn.executemany(
+            '''
+            INSERT OR REPLACE INTO question_payloads (question_id, payload)
+            SELECT ?, ? WHERE (SELECT generation FROM question_payload_generation WHERE id = 1) = ?
+            ''',
+            [(qid, _dumps(payload), generation) for qid, payload in payloads.items()]
+        )
+        conn.commit()
+    except sqlite3.Error:
+        # 写锁竞争等：缓存写回失败不影响本次读取
+        conn.rollback()
+
+
+def get_payloads(conn, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    批量获取题目载荷
+
+    依次查进程内 LRU、question_payloads；仍缺失的题目读取原始列生成载荷并写回
+
+    Args:
+        conn: 数据库连接
+        ids: 题目ID列表
+
+    Returns:
+        {题目ID: 载荷}（不存在的题目不包含在内；载荷为共享对象，勿直接修改）
+    """
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if not ids:
+        return {}
+    generation = _current_generation(conn)
+    _cache.sync(generation)
+
+    result = _cache.get_many(ids)
+    missing = [qid for qid in ids if qid not in result]
+    loaded: Dict[int, Dict[str, Any]] = {}
+
+    for chunk in _chunks(missing):
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT question_id, payload FROM question_payloads WHERE question_id IN ({placeholders})', chunk
+        ).fetchall():
+            loaded[row[0]] = json.loads(row[1])
+
+    built: Dict[int, Dict[str, Any]] = {}
+    missing = [qid for qid in missing if qid not in loaded]
+    for chunk in _chunks(missing):
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT id, {", ".join(SOURCE_COLUMNS)} FROM questions WHERE id IN ({placeholders})', chunk
+        ).fetchall():
+            built[row['id']] = build_payload(row)
+    _store(conn, built, generation)
+
+    loaded.update(built)
+    _cache.put_many(loaded, generation)
+    result.update(loaded)
+    return result
+
+
+def get_payload(conn, question_id: int) -> Optional[Dict[str, Any]]:
+    """获取单个题目载荷（不存在返回 None）"""
+    return get_payloads(conn, [question_id]).get(int(question_id))
+
+
+def warm(conn, batch_size: int = _CHUNK_SIZE) -> int:
+    """
+    为尚无载荷的题目批量生成载荷（命令行使用；调用方使用独立连接）
+
+    Returns:
+        新生成的载荷数
+    """
+    total = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            f'''
+            SELECT q.id, {", ".join('q.' + c for c in SOURCE_COLUMNS)}
+            FROM questions q
+            WHERE q.id > ? AND NOT EXISTS (SELECT 1 FROM question_payloads p WHERE p.question_id = q.id)
+            ORDER BY q.id LIMIT ?
+            ''',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return total
+        generation = _current_generation(conn)
+        _store(conn, {row[0]: build_payload(row) for row in rows}, generation)
+        total += len(rows)
+        last_id = rows[-1][0]
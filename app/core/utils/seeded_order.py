@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+种子题目顺序
+
+打乱模式的题目顺序只保存 (seed, bank_version)，按需重算：
+- seed 决定一个 32 位题目ID上的可逆置换（4 轮 Feistel），slot(keys, qid) 是题目在顺序中的
+  相对位置，单次 O(1)；置换可逆，不同题目的位置互不相同，排序结果与输入顺序无关
+- bank_version 为选定 seed 时题库的最大题目ID：不超过它的题目按 slot 排序，之后新增的题目
+  按原顺序追加在末尾；已删除的题目自然跳过，其余题目的相对顺序不变
+- 前端 reshuffle() 中的 orderSlot() 是同一算法的 JS 实现，两边必须保持一致
+"""
+import secrets
+from typing import Callable, List, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+_MASK32 = 0xFFFFFFFF
+_GOLDEN = 0x9E3779B9
+_ROUND_MUL = 0x2545F491
+
+
+def new_seed() -> int:
+    """随机 32 位种子"""
+    return secrets.randbits(32)
+
+
+def _mix32(x: int) -> int:
+    x = ((x ^ (x >> 16)) * 0x45D9F3B) & _MASK32
+    x = ((x ^ (x >> 16)) * 0x45D9F3B) & _MASK32
+    return x ^ (x >> 16)
+
+
+def round_keys(seed: int) -> Tuple[int, int, int, int]:
+    """seed -> 4 个轮密钥"""
+    return tuple(_mix32((seed + i * _GOLDEN) & _MASK32) for i in range(4))
+
+
+def slot(keys: Sequence[int], qid: int) -> int:
+    """题目ID -> 在种子顺序中的位置键（32 位上的可逆置换）"""
+    k0, k1, k2, k3 = keys
+    left = (qid >> 16) & 0xFFFF
+    right = qid & 0xFFFF
+    left ^= ((right ^ k0) * _ROUND_MUL & _MASK32) >> 16
+    right ^= ((left ^ k1) * _ROUND_MUL & _MASK32) >> 16
+    left ^= ((right ^ k2) * _ROUND_MUL & _MASK32) >> 16
+    right ^= ((left ^ k3) * _ROUND_MUL & _MASK32) >> 16
+    return (left << 16) | right
+
+
+def arrange(seed: int, bank_version: int, items: List[T], id_of: Callable[[T], int]) -> List[T]:
+    """
+    按种子顺序排列
+
+    Args:
+        seed: 种子
+        bank_version: 选定种子时题库的最大题目ID（更大的ID视为之后新增，按原顺序追加在末尾）
+        items: 题目（保持调用方的原顺序）
+        id_of: 取题目ID
+    """
+    keys = round_keys(seed)
+    seeded = [item for item in items if id_of(item) <= bank_version]
+    seeded.sort(key=lambda item: slot(keys, id_of(item)))
+    seeded.extend(item for item in items if id_of(item) > bank_version)
+    return seeded
+
+
+def bank_version(conn) -> int:
+    """当前题库版本（最大题目ID；questions 为 AUTOINCREMENT，ID 不复用）"""
+    row = conn.execute('SELECT MAX(id) FROM questions').fetchone()
+    return row[0] or 0
@@ -2,9 +2,18 @@
 """
 科目权限检查工具函数（黑名单模式）
 """
+import threading
+import time
 from typing import List, Tuple, Optional
+
+from flask import current_app
+
 from app.core.utils.database import get_db
 
+# 刷题限制配置的进程内缓存：(读取时间, 是否开启, 限制数量)
+_quiz_limit_config_cache: Optional[Tuple[float, bool, int]] = None
+_quiz_limit_config_lock = threading.Lock()
+
 
 def is_admin(user_id: int) -> bool:
     """检查用户是否是管理员"""
@@ -116,23 +125,52 @@ def filter_subjects_by_permission(user_id: Optional[int], subject_ids: List[int]
     return [sid for sid in subject_ids if sid not in restricted_ids]
 
 
-def is_quiz_limit_enabled() -> bool:
+def get_quiz_limit_config() -> Tuple[bool, int]:
     """
-    检查刷题数限制功能是否开启
+    获取刷题限制配置（进程内缓存 QUIZ_LIMIT_CONFIG_TTL 秒；本进程修改配置时立即失效）
     
     Returns:
-        True 如果功能开启，False 如果关闭
+        (是否开启, 限制数量（默认100）)
     """
+    global _quiz_limit_config_cache
+    ttl = current_app.config.get('QUIZ_LIMIT_CONFIG_TTL', 30)
+    cached = _quiz_limit_config_cache
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1], cached[2]
+    
     conn = get_db()
-    config = conn.execute(
-        'SELECT config_value FROM system_config WHERE config_key = ?',
-        ('quiz_limit_enabled',)
-    ).fetchone()
+    rows = {
+        row['config_key']: row['config_value']
+        for row in conn.execute(
+            "SELECT config_key, config_value FROM system_config WHERE config_key IN ('quiz_limit_enabled', 'quiz_limit_count')"
+        ).fetchall()
+    }
+    enabled = rows.get('quiz_limit_enabled') == '1'
+    try:
+        limit_count = int(rows['quiz_limit_count']) if 'quiz_limit_count' in rows else 100
+    except (ValueError, TypeError):
+        limit_count = 100
     
-    if not config:
-        return False
+    with _quiz_limit_config_lock:
+        _quiz_limit_config_cache = (time.monotonic(), enabled, limit_count)
+    return enabled, limit_count
+
+
+def invalidate_quiz_limit_config() -> None:
+    """清除刷题限制配置缓存（修改 system_config 后调用）"""
+    global _quiz_limit_config_cache
+    with _quiz_limit_config_lock:
+        _quiz_limit_config_cache = None
+
+
+def is_quiz_limit_enabled() -> bool:
+    """
+    检查刷题数限制功能是否开启
     
-    return config['config_value'] == '1'
+    Returns:
+        True 如果功能开启，False 如果关闭
+    """
+    return get_quiz_limit_config()[0]
 
 
 def get_quiz_limit_count() -> int:
@@ -142,19 +180,7 @@ def get_quiz_limit_count() -> int:
     Returns:
         限制数量（默认100）
     """
-    conn = get_db()
-    config = conn.execute(
-        'SELECT config_value FROM system_config WHERE config_key = ?',
-        ('quiz_limit_count',)
-    ).fetchone()
-    
-    if not config:
-        return 100
-    
-    try:
-        return int(config['config_value'])
-    except (ValueError, TypeError):
-        return 100
+    return get_quiz_limit_config()[1]
 
 
 def get_user_quiz_count(user_id: int) -> int:
@@ -223,30 +249,14 @@ def increment_user_quiz_count(user_id: int) -> None:
         return
     
     conn = get_db()
-    
-    # 检查是否已存在统计记录
-    existing = conn.execute(
-        'SELECT id FROM user_quiz_stats WHERE user_id = ?',
+    conn.execute(
+        '''INSERT INTO user_quiz_stats (user_id, total_answered)
+           VALUES (?, 1)
+           ON CONFLICT(user_id) DO UPDATE SET
+               total_answered = total_answered + 1,
+               updated_at = CURRENT_TIMESTAMP''',
         (user_id,)
-    ).fetchone()
-    
-    if existing:
-        # 更新现有记录
-        conn.execute(
-            '''UPDATE user_quiz_stats 
-               SET total_answered = total_answered + 1,
-                   updated_at = CURRENT_TIMESTAMP
-               WHERE user_id = ?''',
-            (user_id,)
-        )
-    else:
-        # 创建新记录
-        conn.execute(
-            '''INSERT INTO user_quiz_stats (user_id, total_answered)
-               VALUES (?, 1)''',
-            (user_id,)
-        )
-    
+    )
     conn.commit()
 
 
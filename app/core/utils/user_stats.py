@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+用户学习统计读取
+
+user_stats / user_subject_stats / user_type_stats / user_daily_stats / user_activity 由源表上的触发器在写入的
+同一事务内维护（见 database._create_user_stats），这里的函数只按用户主键读取少量汇总行，
+耗时与答题记录数无关。可用 flask stats rebuild 按源表重建。
+
+日期按 STATS_UTC_OFFSET_HOURS 换算到用户所在时区（数据库时间为 UTC）。
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from flask import current_app
+
+from app.core.utils.database import stats_day_modifier
+
+# user_stats 中的计数列
+SUMMARY_COLUMNS = ('answered', 'correct', 'favorites', 'mistakes', 'exams', 'submitted_exams')
+
+
+def summary(conn, user_id: int) -> Dict[str, int]:
+    """
+    用户汇总计数
+
+    Returns:
+        {'answered': 已答题数, 'correct': 答对题数（按每题最新作答）, 'favorites', 'mistakes',
+         'exams': 考试数, 'submitted_exams': 已交卷考试数}
+    """
+    row = conn.execute(
+        f'SELECT {", ".join(SUMMARY_COLUMNS)} FROM user_stats WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    if not row:
+        return {c: 0 for c in SUMMARY_COLUMNS}
+    return {c: row[i] or 0 for i, c in enumerate(SUMMARY_COLUMNS)}
+
+
+def by_subject(conn, user_id: int) -> List[Dict[str, Any]]:
+    """按科目的已答/答对题数 [{'subject', 'total', 'correct'}]（按已答题数降序）"""
+    rows = conn.execute(
+        '''
+        SELECT s.name AS subject, SUM(us.total) AS total, SUM(us.correct) AS correct
+        FROM user_subject_stats us
+        LEFT JOIN subjects s ON s.id = us.subject_id
+        WHERE us.user_id = ? AND us.total > 0
+        GROUP BY s.name
+        ORDER BY total DESC
+        ''',
+        (user_id,)
+    ).fetchall()
+    return [{'subject': r['subject'], 'total': r['total'], 'correct': r['correct']} for r in rows]
+
+
+def by_type(conn, user_id: int) -> List[Dict[str, Any]]:
+    """按题型的已答/答对题数 [{'q_type', 'total', 'correct'}]（按已答题数降序）"""
+    rows = conn.execute(
+        '''
+        SELECT q_type, total, correct FROM user_type_stats
+        WHERE user_id = ? AND total > 0
+        ORDER BY total DESC
+        ''',
+        (user_id,)
+    ).fetchall()
+    return [{'q_type': r['q_type'], 'total': r['total'], 'correct': r['correct']} for r in rows]
+
+
+def local_today() -> date:
+    """用户时区的今天"""
+    offset = int(current_app.config.get('STATS_UTC_OFFSET_HOURS', 8))
+    return (datetime.now(timezone.utc) + timedelta(hours=offset)).date()
+
+
+def daily(conn, user_id: int, days: int) -> List[Dict[str, Any]]:
+    """最近 days 天每天的作答次数 [{'date', 'total', 'correct'}]（按日期升序，无作答的日期不返回）"""
+    rows = conn.execute(
+        '''
+        SELECT day, answered, correct FROM user_daily_stats
+        WHERE user_id = ? AND day >= DATE('now', ?, ?)
+        ORDER BY day
+        ''',
+        (user_id, stats_day_modifier(), f'-{int(days)} days')
+    ).fetchall()
+    return [{'date': r['day'], 'total': r['answered'], 'correct': r['correct']} for r in rows]
+
+
+def activity(conn, user_id: int) -> Dict[str, Any]:
+    """
+    学习日历汇总（一次主键读取）
+
+    Returns:
+        {'current_streak': 连续学习天数（最近学习日不是今天或昨天时为 0）,
+         'longest_streak': 最长连续学习天数, 'active_days': 累计学习天数,
+         'first_day': 首个学习日, 'last_day': 最近学习日（无记录时为 None）}
+    """
+    row = conn.execute(
+        'SELECT first_day, last_day, current_streak, longest_streak, active_days FROM user_activity WHERE user_id = ?',
+        (user_id,)
+    ).fetchone()
+    if not row:
+        return {'current_streak': 0, 'longest_streak': 0, 'active_days': 0, 'first_day': None, 'last_day': None}
+    yesterday = (local_today() - timedelta(days=1)).isoformat()
+    return {
+        'current_streak': row['current_streak'] if row['last_day'] >= yesterday else 0,
+        'longest_streak': row['longest_streak'],
+        'active_days': row['active_days'],
+        'first_day': row['first_day'],
+        'last_day': row['last_day'],
+    }
+
+
+def calendar(conn, user_id: int, year: int) -> Dict[str, int]:
+    """某一年每天的作答次数 {'YYYY-MM-DD': 次数}（学习日历热力图；无作答的日期不返回）"""
+    rows = conn.execute(
+        'SELECT day, answered FROM user_daily_stats WHERE user_id = ? AND day >= ? AND day < ?',
+        (user_id, f'{year:04d}-01-01', f'{year + 1:04d}-01-01')
+    ).fetchall()
+    return {r['day']: r['answered'] for r in rows}
@@ -8,6 +8,9 @@ def init_admin_module(app: Flask):
     from .routes.pages import admin_pages_bp
     from .routes.api import admin_api_bp
     from .routes.api_legacy import admin_api_legacy_bp
+    from .routes.jobs import admin_jobs_bp
+    from .services.question_job_service import QuestionJobService
+    from app.core.jobs import job_manager
 
     module_dir = os.path.dirname(os.path.abspath(__file__))
     template_dir = os.path.join(module_dir, 'templates')
@@ -15,7 +18,11 @@ def init_admin_module(app: Flask):
     admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder=template_dir)
     admin_bp.register_blueprint(admin_pages_bp)
     admin_bp.register_blueprint(admin_api_bp, url_prefix='/api')
+    admin_bp.register_blueprint(admin_jobs_bp, url_prefix='/api')
     # 向后兼容：注册旧路径的路由（/admin/types, /admin/questions）
     admin_bp.register_blueprint(admin_api_legacy_bp)
     app.register_blueprint(admin_bp)
 
+    # 题库导入/导出后台作业
+    QuestionJobService.register(job_manager)
+
@@ -5,21 +5,35 @@
 import json
 import sqlite3
 import os
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, current_app, send_from_directory, send_file
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, current_app, send_from_directory, send_file, stream_with_context
 import zipfile
-import io
 import datetime
+import tempfile
+from urllib.parse import quote
 from werkzeug.security import generate_password_hash
-from app.core.utils.database import get_db
+from app.core.utils.database import get_db, METRIC_SOURCES
+from app.core.utils import blob_store, metrics, question_counts
 from app.core.utils.validators import parse_int, validate_password
 from app.core.utils.fill_blank_parser import parse_fill_blank
+from app.modules.admin.services.question_import_service import QuestionImportService
+from app.modules.admin.services.question_export_service import QuestionExportService
+from app.modules.admin.services.user_export_service import UserExportService
+from app.modules.admin.services.user_list_service import UserListService
+from app.modules.admin.services.bulk_operation_service import BulkOperationService, normalize_ids, parse_tags
+from app.modules.admin.services.question_list_service import (
+    QuestionListService,
+    DEFAULT_PAGE_SIZE as QUESTION_PAGE_SIZE,
+    MAX_PAGE_SIZE as QUESTION_MAX_PAGE_SIZE,
+)
 from app.core.extensions import limiter
-import pandas as pd
+
+METRIC_NAMES = {m[0] for m in METRIC_SOURCES}
 
 admin_api_bp = Blueprint('admin_api', __name__)
 
 ALLOWED_EXTENSIONS = {'json'}
+# 同步导出 Excel 时内存缓冲的上限，超过后转存临时文件
+EXCEL_SPOOL_MAX_SIZE = 8 * 1024 * 1024
 
 
 def allowed_file(filename):
@@ -34,9 +48,9 @@ def api_get_subjects():
     """获取科目列表（管理后台，包含锁定状态）"""
     conn = get_db()
     rows = conn.execute('''
-        SELECT s.id, s.name, s.is_locked, COUNT(q.id) as question_count
+        SELECT s.id, s.name, s.is_locked, IFNULL(SUM(c.n), 0) as question_count
         FROM subjects s
-        LEFT JOIN questions q ON s.id = q.subject_id
+        LEFT JOIN question_counts c ON s.id = c.subject_id
         GROUP BY s.id, s.name, s.is_locked
         ORDER BY s.id
     ''').fetchall()
@@ -49,50 +63,51 @@ def api_get_subjects():
 def get_question_types():
     """获取题型列表"""
     conn = get_db()
-    types = [row[0] for row in conn.execute('SELECT DISTINCT q_type FROM questions').fetchall()]
+    types = question_counts.q_types(conn)
     return jsonify(types)
 
 
 @admin_api_bp.route('/questions', methods=['GET'])
 def get_filtered_questions():
-    """获取筛选后的题目列表"""
+    """获取筛选后的题目列表
+    
+    带 limit 或 cursor 参数时按键集分页返回：
+        {status, items, next_cursor, has_more, total, type_counts}（total/type_counts 仅首页返回）
+    支持 difficulty / tag / keyword 筛选、sort（id/difficulty/updated_at）+ order 排序，
+    fields=content,image_path 返回完整题干与图片列表（默认只返回 content_preview）。
+    不带分页参数时保持旧版的数组格式。
+    """
     subject_id = request.args.get('subject_id')
     q_type = request.args.get('type', 'all')
     
     conn = get_db()
     
-    sql = '''
-        SELECT q.id, q.subject_id, q.q_type, q.content, q.difficulty, q.tags, q.image_path, u.username as created_by, q.updated_at
-        FROM questions q
-        LEFT JOIN users u ON q.created_by = u.id
-        WHERE 1=1
-    '''
-    params = []
-    
-    if subject_id:
-        sql += ' AND q.subject_id = ?'
-        params.append(subject_id)
-    
-    if q_type != 'all':
-        sql += ' AND q.q_type = ?'
-        params.append(q_type)
-    
-    sql += ' ORDER BY q.id DESC'
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return jsonify(QuestionListService.list_all(conn, subject_id, q_type))
     
-    rows = conn.execute(sql, params).fetchall()
-    questions = []
-    for row in rows:
-        question_dict = dict(row)
-        image_path = question_dict.get('image_path')
-        # Compatibility: if it's a non-empty string and not a JSON array, wrap it
-        if image_path and isinstance(image_path, str) and not image_path.strip().startswith('['):
-            question_dict['image_path'] = json.dumps([image_path])
-        # If it's an empty string or None, make it an empty JSON array
-        elif not image_path:
-             question_dict['image_path'] = '[]'
-        questions.append(question_dict)
+    subject_id = parse_int(subject_id, 0, min_val=0) or None
+    cursor = request.args.get('cursor') or None
+    try:
+        page = QuestionListService.list_page(
+            conn,
+            subject_id=subject_id,
+            q_type=q_type,
+            difficulty=parse_int(request.args.get('difficulty'), 0, min_val=0, max_val=5) or None,
+            tag=(request.args.get('tag') or '').strip() or None,
+            keyword=(request.args.get('keyword') or '').strip() or None,
+            sort=request.args.get('sort', 'id'),
+            order=request.args.get('order', 'desc'),
+            cursor=cursor,
+            limit=parse_int(request.args.get('limit'), QUESTION_PAGE_SIZE, min_val=1, max_val=QUESTION_MAX_PAGE_SIZE),
+            fields=[f.strip() for f in (request.args.get('fields') or '').split(',') if f.strip()],
+            with_total=cursor is None
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    return jsonify(questions)
+    if cursor is None:
+        page['type_counts'] = QuestionListService.type_counts(conn, subject_id)
+    return jsonify({'status': 'success', **page})
 
 
 @admin_api_bp.route('/questions/<int:question_id>', methods=['GET'])
@@ -196,6 +211,7 @@ def edit_question(question_id):
                 pass  # 如果解析选项失败，跳过验证
         
         conn = get_db()
+        old = conn.execute('SELECT image_path FROM questions WHERE id=?', (question_id,)).fetchone()
         conn.execute('''
             UPDATE questions SET
                 subject_id=?, q_type=?, content=?, options=?, answer=?, explanation=?,
@@ -213,6 +229,9 @@ def edit_question(question_id):
             data.get('image_path'),
             question_id
         ))
+        # 释放不再使用的图片（新上传的图片已在上传时计数）
+        if old:
+            blob_store.release_refs(conn, old['image_path'], data.get('image_path'))
         conn.commit()
         
         return jsonify({'status':'success','message':'题目修改成功'})
@@ -224,6 +243,7 @@ def edit_question(question_id):
 def delete_question(question_id):
     """删除题目"""
     conn = get_db()
+    blob_store.release_question_images(conn, 'id = ?', (question_id,))
     conn.execute('DELETE FROM questions WHERE id = ?', (question_id,))
     conn.commit()
     
@@ -233,17 +253,20 @@ def delete_question(question_id):
 @admin_api_bp.route('/questions/batch_delete', methods=['POST'])
 def batch_delete_questions():
     """批量删除题目"""
-    data = request.json
-    ids = data.get('ids', [])
+    data = request.json or {}
+    try:
+        ids = normalize_ids(data.get('ids', []))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     if not ids:
         return jsonify({'status': 'error', 'message': '未提供要删除的题目 ID'}), 400
     
     conn = get_db()
     try:
-        conn.executemany('DELETE FROM questions WHERE id = ?', [(id,) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': '批量删除成功'})
+        affected = BulkOperationService.delete_questions(conn, ids)
+        return jsonify({'status': 'success', 'message': f'成功删除 {affected} 道题目',
+                        'requested': len(ids), 'affected': affected})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'批量删除失败: {str(e)}'}), 500
 
@@ -251,24 +274,28 @@ def batch_delete_questions():
 @admin_api_bp.route('/questions/batch_change_type', methods=['POST'])
 def batch_change_type():
     """批量修改题型"""
-    data = request.json
-    ids = data.get('ids', [])
+    data = request.json or {}
     target_type = data.get('target_type')
+    try:
+        ids = normalize_ids(data.get('ids', []))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
     if not ids or not target_type:
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
 
     conn = get_db()
     try:
-        # 验证题型是否有效 (可选，但推荐)
-        valid_types = [row[0] for row in conn.execute('SELECT DISTINCT q_type FROM questions').fetchall()]
-        if target_type not in valid_types:
+        # 目标题型必须是题库中已有的题型（查计数表，不扫描题目表）
+        exists = conn.execute(
+            'SELECT 1 FROM question_counts WHERE q_type = ? AND n > 0 LIMIT 1', (target_type,)
+        ).fetchone()
+        if not exists:
             return jsonify({'status': 'error', 'message': '无效的目标题型'}), 400
 
-        conn.executemany('UPDATE questions SET q_type = ? WHERE id = ?', 
-                        [(target_type, id) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功将 {len(ids)} 道题目修改为 "{target_type}"'}) 
+        affected = BulkOperationService.update_questions(conn, ids, 'q_type', target_type)
+        return jsonify({'status': 'success', 'message': f'成功将 {affected} 道题目修改为 "{target_type}"',
+                        'requested': len(ids), 'affected': affected})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'批量修改题型失败: {str(e)}'}), 500
 
@@ -276,19 +303,21 @@ def batch_change_type():
 @admin_api_bp.route('/questions/batch_move_subject', methods=['POST'])
 def batch_move_subject():
     """批量移动题目到其他科目"""
-    data = request.json
-    ids = data.get('ids', [])
+    data = request.json or {}
     target_subject_id = data.get('target_subject_id')
+    try:
+        ids = normalize_ids(data.get('ids', []))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     if not ids or not target_subject_id:
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
     
     conn = get_db()
     try:
-        conn.executemany('UPDATE questions SET subject_id = ? WHERE id = ?', 
-                        [(target_subject_id, id) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功移动 {len(ids)} 道题目'})
+        affected = BulkOperationService.update_questions(conn, ids, 'subject_id', target_subject_id)
+        return jsonify({'status': 'success', 'message': f'成功移动 {affected} 道题目',
+                        'requested': len(ids), 'affected': affected})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'批量移动失败: {str(e)}'}), 500
 
@@ -296,19 +325,21 @@ def batch_move_subject():
 @admin_api_bp.route('/questions/batch_set_difficulty', methods=['POST'])
 def batch_set_difficulty():
     """批量设置题目难度"""
-    data = request.json
-    ids = data.get('ids', [])
+    data = request.json or {}
     difficulty = data.get('difficulty')
+    try:
+        ids = normalize_ids(data.get('ids', []))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     if not ids or difficulty is None:
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
     
     conn = get_db()
     try:
-        conn.executemany('UPDATE questions SET difficulty = ? WHERE id = ?', 
-                        [(difficulty, id) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功设置 {len(ids)} 道题目的难度'})
+        affected = BulkOperationService.update_questions(conn, ids, 'difficulty', difficulty)
+        return jsonify({'status': 'success', 'message': f'成功设置 {affected} 道题目的难度',
+                        'requested': len(ids), 'affected': affected})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'批量设置难度失败: {str(e)}'}), 500
 
@@ -316,37 +347,22 @@ def batch_set_difficulty():
 @admin_api_bp.route('/questions/batch_tags', methods=['POST'])
 def batch_tags():
     """批量操作标签"""
-    data = request.json
-    ids = data.get('ids', [])
+    data = request.json or {}
     action = data.get('action')  # 'add', 'remove', 'set'
-    tags = data.get('tags', '')
+    tags = parse_tags(data.get('tags', ''))
+    try:
+        ids = normalize_ids(data.get('ids', []))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    if not ids or not action:
+    if not ids or action not in ('add', 'remove', 'set'):
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
     
     conn = get_db()
     try:
-        for qid in ids:
-            row = conn.execute('SELECT tags FROM questions WHERE id = ?', (qid,)).fetchone()
-            if not row:
-                continue
-            
-            current_tags = row['tags'] or ''
-            current_set = set(t.strip() for t in current_tags.split(',') if t.strip())
-            new_tags_set = set(t.strip() for t in tags.split(',') if t.strip())
-            
-            if action == 'add':
-                current_set.update(new_tags_set)
-            elif action == 'remove':
-                current_set -= new_tags_set
-            elif action == 'set':
-                current_set = new_tags_set
-            
-            new_tags_str = ','.join(sorted(current_set))
-            conn.execute('UPDATE questions SET tags = ? WHERE id = ?', (new_tags_str, qid))
-        
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功处理 {len(ids)} 道题目的标签'})
+        affected = BulkOperationService.update_question_tags(conn, ids, action, tags)
+        return jsonify({'status': 'success', 'message': f'成功处理 {affected} 道题目的标签',
+                        'requested': len(ids), 'affected': affected})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'批量操作标签失败: {str(e)}'}), 500
 
@@ -400,7 +416,7 @@ def api_delete_subject(subject_id):
     
     conn = get_db()
     try:
-        qcount = conn.execute('SELECT COUNT(1) FROM questions WHERE subject_id=?', (subject_id,)).fetchone()[0]
+        qcount = question_counts.total(conn, [subject_id])
         
         if qcount > 0 and not force:
             return jsonify({'status': 'error', 'message': f'该科目下仍有 {qcount} 道题，无法直接删除'}), 400
@@ -408,6 +424,7 @@ def api_delete_subject(subject_id):
         if qcount > 0 and force:
             conn.execute('DELETE FROM favorites WHERE question_id IN (SELECT id FROM questions WHERE subject_id=?)', (subject_id,))
             conn.execute('DELETE FROM mistakes WHERE question_id IN (SELECT id FROM questions WHERE subject_id=?)', (subject_id,))
+            blob_store.release_question_images(conn, 'subject_id = ?', (subject_id,))
             conn.execute('DELETE FROM questions WHERE subject_id=?', (subject_id,))
         
         conn.execute('DELETE FROM subjects WHERE id=?', (subject_id,))
@@ -457,7 +474,10 @@ def api_unlock_subject(subject_id):
 @admin_api_bp.route('/users')
 @limiter.exempt
 def admin_api_users():
-    """用户列表API"""
+    """用户列表API
+
+    page/size 为 OFFSET 分页；带 cursor（上一页返回的 next_cursor）时按键集分页，深翻页耗时与页码无关
+    """
     try:
         search = (request.args.get('search') or '').strip()
         page = parse_int(request.args.get('page'), 1, 1)
@@ -465,146 +485,23 @@ def admin_api_users():
         sort = (request.args.get('sort') or 'created_at').lower()
         order = (request.args.get('order') or 'desc').lower()
         
-        sort_map = {'created_at':'created_at', 'username':'username', 'id':'id'}
-        if sort not in sort_map:
-            sort = 'created_at'
-        if order not in ('asc','desc'):
-            order = 'desc'
-        
-        offset = (page-1)*size
-        
         conn = get_db()
-        where = 'WHERE 1=1'
-        params = []
-        
-        if search:
-            where += ' AND username LIKE ?'
-            params.append(f'%{search}%')
-        
-        total = conn.execute(f'SELECT COUNT(1) FROM users {where}', params).fetchone()[0]
-        
-        # 检查 is_subject_admin 字段是否存在，如果不存在则自动添加
-        has_subject_admin_field = False
         try:
-            user_cols = [r['name'] for r in conn.execute("PRAGMA table_info(users)").fetchall()]
-            has_subject_admin_field = 'is_subject_admin' in user_cols
-            
-            # 如果字段不存在，尝试添加
-            if not has_subject_admin_field:
-                try:
-                    conn.execute('ALTER TABLE users ADD COLUMN is_subject_admin INTEGER DEFAULT 0')
-                    conn.commit()
-                    has_subject_admin_field = True
-                    current_app.logger.info('已自动添加 is_subject_admin 字段')
-                except Exception as e:
-                    current_app.logger.warning(f'添加 is_subject_admin 字段失败（可能已存在）: {e}')
-                    # 即使添加失败，也尝试查询，可能字段已经存在
-                    try:
-                        test_row = conn.execute('SELECT is_subject_admin FROM users LIMIT 1').fetchone()
-                        has_subject_admin_field = True
-                    except Exception:
-                        has_subject_admin_field = False
-        except Exception as e:
-            current_app.logger.warning(f'检查 is_subject_admin 字段失败: {e}')
-            # 如果检查失败，尝试直接查询，如果失败则使用不包含该字段的查询
-            try:
-                test_row = conn.execute('SELECT is_subject_admin FROM users LIMIT 1').fetchone()
-                has_subject_admin_field = True
-            except Exception:
-                has_subject_admin_field = False
-        
-        # 根据字段是否存在构建查询（使用子查询避免GROUP BY复杂性）
-        if has_subject_admin_field:
-            select_with_count = '''u.id, u.username, u.is_admin, u.is_subject_admin, u.is_locked, u.created_at, u.last_active,
-                COALESCE((SELECT COUNT(DISTINCT subject_id) FROM user_subjects WHERE user_id = u.id), 0) as restricted_subjects_count'''
-        else:
-            select_with_count = '''u.id, u.username, u.is_admin, u.is_locked, u.created_at, u.last_active,
-                COALESCE((SELECT COUNT(DISTINCT subject_id) FROM user_subjects WHERE user_id = u.id), 0) as restricted_subjects_count'''
-        
-        # 处理where子句：将条件中的字段引用改为u.前缀
-        where_for_query = where.replace('username', 'u.username')
-        rows = conn.execute(
-            f'SELECT {select_with_count} FROM users u {where_for_query} ORDER BY u.{sort_map[sort]} {order} LIMIT ? OFFSET ?',
-            params + [size, offset]
-        ).fetchall()
-        
-        from datetime import datetime, timedelta
-        
-        data = []
-        for r in rows:
-            # 判断在线状态：5分钟内有活动视为在线
-            is_online = False
-            last_active_val = r['last_active'] if 'last_active' in r.keys() else None
-            if last_active_val:
-                try:
-                    # SQLite 的 CURRENT_TIMESTAMP 格式: "YYYY-MM-DD HH:MM:SS" (UTC时间)
-                    last_active_str = last_active_val.replace('T', ' ').split('.')[0]
-                    last_active = datetime.strptime(last_active_str, '%Y-%m-%d %H:%M:%S')
-                    # SQLite CURRENT_TIMESTAMP 是 UTC，需要转换为本地时间
-                    # 或者使用 datetime.utcnow() 进行比较
-                    is_online = (datetime.utcnow() - last_active) < timedelta(minutes=5)
-                except Exception as e:
-                    current_app.logger.warning(f'解析 last_active 失败: {last_active_val}, 错误: {e}')
-            
-            # sqlite3.Row 对象使用字典式访问，但不是真正的字典，需要用 in 检查或直接访问
-            data.append({
-                'id': r['id'],
-                'username': r['username'],
-                'is_admin': bool(r['is_admin']) if 'is_admin' in r.keys() else False,
-                'is_subject_admin': bool(r['is_subject_admin']) if has_subject_admin_field and 'is_subject_admin' in r.keys() else False,
-                'is_locked': bool(r['is_locked']) if 'is_locked' in r.keys() else False,
-                'created_at': r['created_at'] if 'created_at' in r.keys() else '',
-                'is_online': is_online,
-                'last_active': last_active_val,
-                'restricted_subjects_count': r['restricted_subjects_count'] or 0
-            })
-        
-        # 统计所有用户的全局数据（不受分页和搜索影响）
-        # 获取所有用户的字段用于统计，根据字段是否存在决定查询字段
-        if has_subject_admin_field:
-            all_users_stats_query = 'SELECT is_admin, is_subject_admin, is_locked, last_active FROM users'
-        else:
-            all_users_stats_query = 'SELECT is_admin, is_locked, last_active FROM users'
-        all_users_rows = conn.execute(all_users_stats_query).fetchall()
-        
-        # 统计全局数据
-        online_count = 0
-        admin_count = 0
-        subject_admin_count = 0
-        locked_count = 0
-        
-        for user_row in all_users_rows:
-            # 统计管理员
-            if user_row['is_admin']:
-                admin_count += 1
-            # 统计科目管理员（不包括管理员）
-            elif has_subject_admin_field and 'is_subject_admin' in user_row.keys() and user_row['is_subject_admin']:
-                subject_admin_count += 1
-            # 统计锁定用户
-            if user_row['is_locked']:
-                locked_count += 1
-            # 统计在线用户（5分钟内有活动）
-            last_active_val = user_row['last_active'] if 'last_active' in user_row.keys() else None
-            if last_active_val:
-                try:
-                    last_active_str = last_active_val.replace('T', ' ').split('.')[0]
-                    last_active = datetime.strptime(last_active_str, '%Y-%m-%d %H:%M:%S')
-                    if (datetime.utcnow() - last_active) < timedelta(minutes=5):
-                        online_count += 1
-                except Exception:
-                    pass
+            result = UserListService.list_page(
+                conn, search=search, sort=sort, order=order, page=page, size=size,
+                cursor=request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
-        # 返回数据，包含全局统计数据
+        # 返回数据，包含全局统计数据（不受分页和搜索影响）
         return jsonify({
             'status': 'success',
-            'data': data,
-            'total': total,
-            'stats': {
-                'online': online_count,
-                'admin': admin_count,
-                'subject_admin': subject_admin_count,
-                'locked': locked_count
-            }
+            'data': result['data'],
+            'total': result['total'],
+            'next_cursor': result['next_cursor'],
+            'has_more': result['has_more'],
+            'stats': UserListService.stats(conn)
         })
     except Exception as e:
         current_app.logger.error(f'用户列表API错误: {e}', exc_info=True)
@@ -716,8 +613,10 @@ def delete_user(user_id):
         # 级联清理（仅清理我们明确知道的表；其余若还有外键引用，会被 IntegrityError 拦住）
         conn.execute('DELETE FROM favorites WHERE user_id=?', (user_id,))
         conn.execute('DELETE FROM mistakes WHERE user_id=?', (user_id,))
+        conn.execute('DELETE FROM answer_events WHERE user_id=?', (user_id,))
         conn.execute('DELETE FROM user_answers WHERE user_id=?', (user_id,))
         conn.execute('DELETE FROM user_progress WHERE user_id=?', (user_id,))
+        conn.execute('DELETE FROM user_progress_orders WHERE user_id=?', (user_id,))
         conn.execute('UPDATE questions SET created_by=NULL WHERE created_by=?', (user_id,))
         conn.execute('DELETE FROM users WHERE id=?', (user_id,))
         conn.commit()
@@ -854,32 +753,15 @@ def admin_force_logout(user_id):
 
 @admin_api_bp.route('/users/export')
 def admin_export_users():
-    """导出用户CSV"""
-    conn = get_db()
-    rows = conn.execute(
-        'SELECT id, username, is_admin, is_locked, created_at FROM users ORDER BY id'
-    ).fetchall()
-    
-    def csv_escape(s):
-        s = '' if s is None else str(s)
-        if any(c in s for c in [',','"','\n','\r']):
-            s = '"' + s.replace('"','""') + '"'
-        return s
-    
-    out = '\ufeff' + 'id,username,is_admin,is_locked,created_at\n'
-    for r in rows:
-        out += ','.join([
-            str(r['id']),
-            csv_escape(r['username']),
-            '1' if r['is_admin'] else '0',
-            '1' if (r['is_locked'] or 0) else '0',
-            csv_escape(r['created_at'])
-        ]) + '\n'
-    
-    return out, 200, {
-        'Content-Type':'text/csv; charset=utf-8',
-        'Content-Disposition':'attachment; filename=users.csv'
-    }
+    """导出用户CSV（流式输出）"""
+    def generate():
+        yield from UserExportService.iter_csv(get_db())
+    
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': 'attachment; filename=users.csv'}
+    )
 
 
 @admin_api_bp.route('/questions/import', methods=['POST'])
@@ -1314,6 +1196,23 @@ def admin_api_popup_stats(pid):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@admin_api_bp.route('/metrics/<metric>', methods=['GET'])
+def admin_api_metric_series(metric):
+    """统计指标按日序列：?days=30（最近 N 天，含今天）&dim=<维度>"""
+    if metric not in METRIC_NAMES:
+        return jsonify({'status': 'error', 'message': f'未定义的统计指标: {metric}'}), 404
+    days = parse_int(request.args.get('days'), 30, 1, 366)
+    end = datetime.datetime.utcnow().date()
+    start = end - datetime.timedelta(days=days - 1)
+    conn = get_db()
+    return jsonify({
+        'status': 'success',
+        'metric': metric,
+        'total': metrics.total(conn, metric, request.args.get('dim')),
+        'series': metrics.daily_series(conn, metric, start, end, request.args.get('dim'))
+    })
+
+
 @admin_api_bp.route('/notifications/<int:nid>/toggle', methods=['POST'])
 def admin_api_notifications_toggle(nid):
     """切换通知启用状态"""
@@ -1355,106 +1254,26 @@ def import_questions_from_excel():
     conn = get_db()
     
     try:
-        df = pd.read_excel(file, sheet_name='题目示例').fillna('')
-        
-        required_columns = ['subject', 'q_type', 'content']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            return jsonify({'status': 'error', 'message': f'Excel文件中缺少必需的列: {", ".join(missing_columns)}'}), 400
-
-        subjects = conn.execute('SELECT id, name FROM subjects').fetchall()
-        subject_map = {s['name']: s['id'] for s in subjects}
-
-        imported_count = 0
-        errors = []
-
-        option_cols = sorted([col for col in df.columns if col.startswith('option_')])
-        blank_cols = sorted([col for col in df.columns if col.startswith('blank_')])
-
-        for index, row in df.iterrows():
-            try:
-                subject_name = str(row.get('subject', '')).strip()
-                q_type = str(row.get('q_type', '')).strip()
-                content = str(row.get('content', '')).strip()
-                answer = str(row.get('answer', '')).strip()
-                explanation = str(row.get('explanation', '')).strip()
-
-                if not all([subject_name, q_type, content]):
-                    errors.append(f'第 {index + 2} 行: 必填字段（subject, q_type, content）不能为空。')
-                    continue
-
-                if subject_name not in subject_map:
-                    cursor = conn.execute('INSERT INTO subjects (name) VALUES (?)', (subject_name,))
-                    subject_id = cursor.lastrowid
-                    subject_map[subject_name] = subject_id
-                    conn.commit()
-                else:
-                    subject_id = subject_map[subject_name]
-
-                valid_q_types = ['选择题', '多选题', '判断题', '填空题', '问答题']
-                if q_type not in valid_q_types:
-                    errors.append(f'第 {index + 2} 行: 无效的题型 "{q_type}"。')
-                    continue
-                
-                options_json = '[]'
-                final_answer = answer
-
-                if q_type in ['选择题', '多选题']:
-                    options_list = []
-                    for i, col_name in enumerate(option_cols):
-                        option_text = str(row.get(col_name, '')).strip()
-                        if option_text:
-                            prefix = chr(ord('A') + i)
-                            options_list.append(f"{prefix}. {option_text}")
-                    if not options_list:
-                        errors.append(f'第 {index + 2} 行: 选择题或多选题至少需要一个选项。')
-                        continue
-                    options_json = json.dumps(options_list, ensure_ascii=False)
-                    if not final_answer:
-                        errors.append(f'第 {index + 2} 行: 选择题或多选题的 `answer` 列不能为空。')
-                        continue
-
-                elif q_type == '填空题':
-                    blank_answers = []
-                    for col_name in blank_cols:
-                        blank_text = str(row.get(col_name, '')).strip()
-                        if blank_text:
-                            blank_answers.append(blank_text)
-                    if not blank_answers:
-                        errors.append(f'第 {index + 2} 行: 填空题至少需要一个 `blank_` 答案。')
-                        continue
-                    final_answer = ';;'.join(blank_answers)
-                
-                elif not final_answer:
-                     errors.append(f'第 {index + 2} 行: `answer` 列不能为空。')
-                     continue
-
-                conn.execute('''
-                    INSERT INTO questions (subject_id, q_type, content, options, answer, explanation, created_by, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (subject_id, q_type, content, options_json, final_answer, explanation, session.get('user_id')))
-                
-                imported_count += 1
-
-            except Exception as e:
-                errors.append(f'第 {index + 2} 行: 导入失败 - {str(e)}')
-
-        conn.commit()
-        
-        message = f'成功导入 {imported_count} 道题。'
-        if errors:
-            message += f' 遇到 {len(errors)} 个问题。'
-        
-        return jsonify({
-            'status': 'success' if not errors else 'warning',
-            'message': message,
-            'imported_count': imported_count,
-            'errors': errors
-        })
-
+        result = QuestionImportService.import_excel(conn, file.stream, session.get('user_id'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'处理文件失败: {str(e)}'}), 500
 
+    report = result['error_report']
+    imported_count = result['imported_count']
+    message = f'成功导入 {imported_count} 道题。'
+    if report.total:
+        message += f' 遇到 {report.total} 个问题。'
+    
+    return jsonify({
+        'status': 'success' if not report.total else 'warning',
+        'message': message,
+        'imported_count': imported_count,
+        'errors': report.messages(),
+        'error_report': report.to_dict()
+    })
+
 
 @admin_api_bp.route('/download_template')
 def download_template():
@@ -1470,121 +1289,18 @@ def export_questions_to_excel():
     q_type = request.args.get('type', 'all')
     
     conn = get_db()
-    
-    # 构建查询SQL
-    sql = '''
-        SELECT q.*, s.name as subject_name
-        FROM questions q
-        LEFT JOIN subjects s ON q.subject_id = s.id
-        WHERE 1=1
-    '''
-    params = []
-    
-    if subject_id:
-        sql += ' AND q.subject_id = ?'
-        params.append(subject_id)
-    
-    if q_type and q_type != 'all':
-        sql += ' AND q.q_type = ?'
-        params.append(q_type)
-    
-    sql += ' ORDER BY q.id'
-    rows = conn.execute(sql, params).fetchall()
-    
-    if not rows:
+    # write_only 工作簿：小文件留在内存，大文件自动落到临时文件
+    output = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_SIZE)
+    count = QuestionExportService.write_excel(conn, subject_id, q_type, output)
+    if not count:
+        output.close()
         return jsonify({'status': 'error', 'message': '没有可导出的题目'}), 400
     
-    # 准备数据
-    export_data = []
-    max_options = 0
-    max_blanks = 0
-    
-    for row in rows:
-        question = dict(row)
-        q_type_val = question.get('q_type', '')
-        
-        # 解析选项
-        options = []
-        if question.get('options'):
-            try:
-                options = json.loads(question['options'])
-            except:
-                options = []
-        
-        # 解析填空题答案
-        blank_answers = []
-        if q_type_val == '填空题' and question.get('answer'):
-            blank_answers = question['answer'].split(';;')
-        
-        max_options = max(max_options, len(options))
-        max_blanks = max(max_blanks, len(blank_answers))
-        
-        # 构建基础数据行
-        row_data = {
-            'subject': question.get('subject_name', ''),
-            'q_type': q_type_val,
-            'content': question.get('content', ''),
-            'answer': question.get('answer', '') if q_type_val != '填空题' else '',
-            'explanation': question.get('explanation', '')
-        }
-        
-        # 添加选项列
-        for i, opt in enumerate(options):
-            # 移除选项前缀（如 "A. "）
-            opt_text = opt
-            if opt_text.startswith(chr(ord('A') + i) + '. '):
-                opt_text = opt_text[len(chr(ord('A') + i) + '. '):]
-            row_data[f'option_{i}'] = opt_text
-        
-        # 添加填空题答案列
-        for i, blank in enumerate(blank_answers):
-            row_data[f'blank_{i}'] = blank
-        
-        export_data.append(row_data)
-    
-    # 构建DataFrame
-    columns = ['subject', 'q_type', 'content', 'answer', 'explanation']
-    
-    # 添加选项列
-    for i in range(max_options):
-        columns.append(f'option_{i}')
-    
-    # 添加填空题答案列
-    for i in range(max_blanks):
-        columns.append(f'blank_{i}')
-    
-    # 创建DataFrame
-    df = pd.DataFrame(export_data)
-    
-    # 确保所有列都存在
-    for col in columns:
-        if col not in df.columns:
-            df[col] = ''
-    
-    # 按列顺序重新排列
-    df = df[columns]
-    
-    # 创建Excel文件
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='题目示例', index=False)
-    
     output.seek(0)
-    
-    # 生成文件名
-    subject_name = "all_subjects"
-    if subject_id:
-        subject_row = conn.execute('SELECT name FROM subjects WHERE id = ?', (subject_id,)).fetchone()
-        if subject_row:
-            subject_name = subject_row['name']
-    
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"questions_export_{subject_name}_{timestamp}.xlsx"
-    
     return send_file(
         output,
         as_attachment=True,
-        download_name=filename,
+        download_name=QuestionExportService.export_filename(conn, subject_id, 'xlsx'),
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
 
@@ -1604,19 +1320,16 @@ def upload_question_image():
         return jsonify({'status': 'error', 'message': '无效的文件类型'}), 400
 
     try:
-        filename = secure_filename(file.filename)
-        # 为了避免重名，可以加上时间戳和随机数
-        import time, random
-        unique_filename = f"{int(time.time())}_{random.randint(1000, 9999)}_{filename}"
-        
-        upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'question_images')
-        file_path = os.path.join(upload_path, unique_filename)
-        file.save(file_path)
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        conn = get_db()
+        # 内容寻址存储：按 sha256 命名，重复上传同一图片不会产生新文件
+        blob = blob_store.save_upload(conn, current_app.config['UPLOAD_FOLDER'], file, ext)
+        conn.commit()
         
         # 返回可访问的URL
-        file_url = url_for('main.main_pages.serve_upload', filename=f'question_images/{unique_filename}')
+        file_url = url_for('main.main_pages.serve_upload', filename=blob['path'])
         
-        return jsonify({'status': 'success', 'url': file_url, 'path': f'question_images/{unique_filename}'})
+        return jsonify({'status': 'success', 'url': file_url, 'path': blob['path']})
 
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'上传失败: {str(e)}'}), 500
@@ -1624,75 +1337,23 @@ def upload_question_image():
 
 @admin_api_bp.route('/questions/export_package', methods=['GET'])
 def export_questions_package():
-    """导出包含完整数据和图片的题目包"""
+    """导出包含完整数据和图片的题目包（边生成边发送，不在内存中拼装整个 ZIP）"""
     subject_id = request.args.get('subject_id')
     q_type = request.args.get('type')
     
     conn = get_db()
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(current_app.root_path, '..', 'uploads'))
+    filename = QuestionExportService.export_filename(conn, subject_id, 'zip')
     
-    # 1. 获取科目名称
-    subject_name = "all_subjects"
-    if subject_id:
-        subject_row = conn.execute('SELECT name FROM subjects WHERE id = ?', (subject_id,)).fetchone()
-        if subject_row:
-            subject_name = subject_row['name']
-
-    # 2. 查询题目数据
-    sql = '''
-        SELECT q.*, s.name as subject_name 
-        FROM questions q 
-        LEFT JOIN subjects s ON q.subject_id = s.id
-        WHERE 1=1
-    '''
-    params = []
-    if subject_id:
-        sql += ' AND subject_id = ?'
-        params.append(subject_id)
-    if q_type and q_type != 'all':
-        sql += ' AND q_type = ?'
-        params.append(q_type)
-    
-    sql += ' ORDER BY id'
-    rows = conn.execute(sql, params).fetchall()
-    
-    questions_data = [dict(row) for row in rows]
-    
-    # 3. 创建 ZIP 文件
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 3.1 写入 data.json
-        # 使用能够处理 datetime 对象的 JSON encoder
-        def json_default(o):
-            if isinstance(o, (datetime.date, datetime.datetime)):
-                return o.isoformat()
-        zf.writestr('data.json', json.dumps(questions_data, indent=4, ensure_ascii=False, default=json_default))
-        
-        # 3.2 收集并写入图片
-        image_paths = {q['image_path'] for q in questions_data if q.get('image_path')}
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(current_app.root_path, '..', 'uploads'))
-        
-        for image_path in image_paths:
-            # image_path is like 'question_images/1766...png'
-            if not image_path:
-                continue
-            full_image_path = os.path.join(upload_folder, *image_path.split('/'))
-            if os.path.exists(full_image_path):
-                # 写入 zip 时保持目录结构, e.g., images/question_images/....png
-                arcname = 'images/' + image_path.replace('\\', '/')
-                zf.write(full_image_path, arcname)
-
-    memory_file.seek(0)
-    
-    # 4. 生成文件名并发送文件
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"questions_export_{subject_name}_{timestamp}.zip"
+    def generate():
+        # 视图返回后请求上下文的连接已关闭，响应流内重新获取
+        yield from QuestionExportService.iter_package(get_db(), subject_id, q_type, upload_folder)
     
-    return send_file(
-        memory_file,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/zip'
-    )
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    # 避免反向代理缓冲整个响应
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @admin_api_bp.route('/questions/import_package', methods=['POST'])
@@ -1705,99 +1366,35 @@ def import_questions_package():
     if file.filename == '' or not file.filename.endswith('.zip'):
         return jsonify({'status': 'error', 'message': '请上传有效的 .zip 文件'}), 400
 
-    conn = get_db()
-    
-    # 获取现有的科目 name -> id 映射
-    subjects = conn.execute('SELECT id, name FROM subjects').fetchall()
-    subject_map = {s['name']: s['id'] for s in subjects}
+    return _import_package_response(get_db(), file, None)
 
-    imported_count = 0
-    errors = []
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(current_app.root_path, '..', 'uploads'))
 
+def _import_package_response(conn, file, user_id):
+    """同步导入题目包并返回统一格式的结果（新旧路径共用）"""
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(current_app.root_path, '..', 'uploads'))
     try:
-        with zipfile.ZipFile(file, 'r') as zf:
-            if 'data.json' not in zf.namelist():
-                return jsonify({'status': 'error', 'message': '压缩包中缺少 data.json 文件'}), 400
-            
-            with zf.open('data.json') as f:
-                questions_data = json.load(f)
-            
-            for q in questions_data:
-                try:
-                    # 1. 处理科目
-                    subject_name = q.get('subject_name')
-                    if not subject_name:
-                        errors.append(f"题目ID {q.get('id')} 缺少科目名称，已跳过。")
-                        continue
-
-                    if subject_name not in subject_map:
-                        cursor = conn.execute('INSERT INTO subjects (name) VALUES (?)', (subject_name,))
-                        subject_id = cursor.lastrowid
-                        subject_map[subject_name] = subject_id
-                    else:
-                        subject_id = subject_map[subject_name]
-
-                    # 2. 处理图片
-                    new_image_path = q.get('image_path')
-                    if new_image_path:
-                        arcname = 'images/' + new_image_path.replace('\\', '/')
-                        if arcname in zf.namelist():
-                            # 生成新的唯一文件名以避免冲突
-                            ext = os.path.splitext(new_image_path)[1]
-                            unique_filename = f"{int(datetime.datetime.now().timestamp())}_{imported_count}{ext}"
-                            image_save_dir = os.path.join(upload_folder, 'question_images')
-                            os.makedirs(image_save_dir, exist_ok=True)
-                            image_save_path = os.path.join(image_save_dir, unique_filename)
-                            
-                            with zf.open(arcname) as source, open(image_save_path, 'wb') as target:
-                                target.write(source.read())
-                            
-                            new_image_path = f'question_images/{unique_filename}'
-                        else:
-                            new_image_path = None # 图片在zip中不存在
-
-                    # 3. 插入题目数据 (忽略原始ID)
-                    conn.execute('''
-                        INSERT INTO questions (subject_id, q_type, content, options, answer, explanation, difficulty, tags, image_path, created_by, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        subject_id,
-                        q.get('q_type'),
-                        q.get('content'),
-                        q.get('options'),
-                        q.get('answer'),
-                        q.get('explanation'),
-                        q.get('difficulty'),
-                        q.get('tags'),
-                        new_image_path,
-                        q.get('created_by'),
-                        q.get('created_at'),
-                        q.get('updated_at')
-                    ))
-                    imported_count += 1
-                except Exception as e:
-                    errors.append(f"导入题目ID {q.get('id', 'N/A')} 时出错: {str(e)}")
-
-        conn.commit()
-
-        message = f'成功导入 {imported_count} 道题。'
-        if errors:
-            message += f' 遇到 {len(errors)} 个问题。'
-        
-        return jsonify({
-            'status': 'success' if not errors else 'warning',
-            'message': message,
-            'imported_count': imported_count,
-            'errors': errors
-        })
-
+        result = QuestionImportService.import_package(conn, file, upload_folder, user_id)
     except zipfile.BadZipFile:
         return jsonify({'status': 'error', 'message': '文件不是一个有效的ZIP压缩包'}), 400
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
-        conn.rollback() # 如果发生意外错误，回滚事务
         return jsonify({'status': 'error', 'message': f'处理文件时发生未知错误: {str(e)}'}), 500
 
+    report = result['error_report']
+    imported_count = result['imported_count']
+    message = f'成功导入 {imported_count} 道题。'
+    if report.total:
+        message += f' 遇到 {report.total} 个问题。'
+    
+    return jsonify({
+        'status': 'success' if not report.total else 'warning',
+        'message': message,
+        'imported_count': imported_count,
+        'errors': report.messages(),
+        'error_report': report.to_dict()
+    })
+
 
 # ========== 聊天管理 ==========
 @admin_api_bp.route('/chat/stats', methods=['GET'])
@@ -1806,29 +1403,23 @@ def api_chat_stats():
     try:
         conn = get_db()
         
-        # 会话总数
-        conv_count = conn.execute('SELECT COUNT(*) FROM chat_conversations').fetchone()[0]
+        # 计数均取自触发器维护的统计汇总表（metric_daily），不扫描消息表
+        conv_count = metrics.total(conn, 'chat.conversations')
         
-        # 消息总数
-        msg_count = conn.execute('SELECT COUNT(*) FROM chat_messages').fetchone()[0]
+        # 消息总数（在线表 + 已归档消息，归档数量取自 chat_archive_stats，无需打开归档库）
+        msg_count = metrics.total(conn, 'chat.messages')
+        msg_count += conn.execute(
+            'SELECT COALESCE(SUM(archived_count), 0) FROM chat_archive_stats'
+        ).fetchone()[0]
         
         # 今日消息数
-        today_msg_count = conn.execute('''
-            SELECT COUNT(*) FROM chat_messages 
-            WHERE DATE(created_at) = DATE('now')
-        ''').fetchone()[0]
+        today_msg_count = metrics.recent(conn, 'chat.messages', days=1)
         
         # 活跃会话数（最近7天有消息的会话）
-        active_conv_count = conn.execute('''
-            SELECT COUNT(DISTINCT conversation_id) FROM chat_messages 
-            WHERE created_at >= datetime('now', '-7 days')
-        ''').fetchone()[0]
+        active_conv_count = metrics.distinct_recent(conn, 'chat.active_conversations', days=7)
         
         # 私聊会话数
-        direct_conv_count = conn.execute(
-            'SELECT COUNT(*) FROM chat_conversations WHERE c_type = ?',
-            ('direct',)
-        ).fetchone()[0]
+        direct_conv_count = metrics.total(conn, 'chat.conversations.direct')
         
         return jsonify({
             'status': 'success',
@@ -2285,6 +1876,7 @@ def api_delete_coding_question(question_id):
             }), 400
         
         # 删除编程题
+        blob_store.release_question_images(conn, 'id = ?', (question_id,))
         conn.execute('DELETE FROM questions WHERE id = ?', (question_id,))
         conn.commit()
         
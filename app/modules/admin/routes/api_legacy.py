@@ -2,6 +2,7 @@
 """管理后台API路由（向后兼容的旧路径）"""
 from flask import Blueprint, request, jsonify
 from app.core.utils.database import get_db
+from app.core.utils import blob_store, question_counts
 import json
 
 # 创建一个额外的蓝图用于向后兼容
@@ -12,50 +13,15 @@ admin_api_legacy_bp = Blueprint('admin_api_legacy', __name__)
 def get_question_types():
     """获取题型列表（向后兼容路径：/admin/types）"""
     conn = get_db()
-    types = [row[0] for row in conn.execute('SELECT DISTINCT q_type FROM questions').fetchall()]
+    types = question_counts.q_types(conn)
     return jsonify(types)
 
 
 @admin_api_legacy_bp.route('/questions', methods=['GET'])
 def get_filtered_questions():
     """获取筛选后的题目列表（向后兼容路径：/admin/questions）"""
-    subject_id = request.args.get('subject_id')
-    q_type = request.args.get('type', 'all')
-    
-    conn = get_db()
-    
-    sql = '''
-        SELECT q.id, q.subject_id, q.q_type, q.content, q.difficulty, q.tags, q.image_path, u.username as created_by, q.updated_at
-        FROM questions q
-        LEFT JOIN users u ON q.created_by = u.id
-        WHERE 1=1
-    '''
-    params = []
-    
-    if subject_id:
-        sql += ' AND q.subject_id = ?'
-        params.append(subject_id)
-    
-    if q_type != 'all':
-        sql += ' AND q.q_type = ?'
-        params.append(q_type)
-    
-    sql += ' ORDER BY q.id DESC'
-    
-    rows = conn.execute(sql, params).fetchall()
-    questions = []
-    for row in rows:
-        question_dict = dict(row)
-        image_path = question_dict.get('image_path')
-        # Compatibility: if it's a non-empty string and not a JSON array, wrap it
-        if image_path and isinstance(image_path, str) and not image_path.strip().startswith('['):
-            question_dict['image_path'] = json.dumps([image_path])
-        # If it's an empty string or None, make it an empty JSON array
-        elif not image_path:
-             question_dict['image_path'] = '[]'
-        questions.append(question_dict)
-    
-    return jsonify(questions)
+    from .api import get_filtered_questions as _get_filtered_questions
+    return _get_filtered_questions()
 
 
 @admin_api_legacy_bp.route('/questions', methods=['POST'])
@@ -165,6 +131,7 @@ def edit_question_legacy(question_id):
                 pass  # 如果解析选项失败，跳过验证
         
         conn = get_db()
+        old = conn.execute('SELECT image_path FROM questions WHERE id=?', (question_id,)).fetchone()
         conn.execute('''
             UPDATE questions SET
                 subject_id=?, q_type=?, content=?, options=?, answer=?, explanation=?,
@@ -182,6 +149,9 @@ def edit_question_legacy(question_id):
             data.get('image_path'),
             question_id
         ))
+        # 释放不再使用的图片（新上传的图片已在上传时计数）
+        if old:
+            blob_store.release_refs(conn, old['image_path'], data.get('image_path'))
         conn.commit()
         
         return jsonify({'status':'success','message':'题目修改成功'})
@@ -194,6 +164,7 @@ def delete_question_legacy(question_id):
     """删除题目（向后兼容路径：/admin/questions/<id>）"""
     conn = get_db()
     try:
+        blob_store.release_question_images(conn, 'id = ?', (question_id,))
         conn.execute('DELETE FROM questions WHERE id = ?', (question_id,))
         conn.commit()
         return jsonify({'status': 'success', 'message': '题目删除成功'})
@@ -279,80 +250,36 @@ def import_questions_api():
 @admin_api_legacy_bp.route('/questions/batch_delete', methods=['POST'])
 def batch_delete_questions():
     """批量删除题目（向后兼容路径：/admin/questions/batch_delete）"""
-    data = request.json
-    ids = data.get('ids', [])
-    
-    if not ids:
-        return jsonify({'status': 'error', 'message': '未提供要删除的题目 ID'}), 400
-    
-    conn = get_db()
-    try:
-        conn.executemany('DELETE FROM questions WHERE id = ?', [(id,) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': '批量删除成功'})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({'status': 'error', 'message': f'批量删除失败: {str(e)}'}), 500
+    from .api import batch_delete_questions as _batch_delete_questions
+    return _batch_delete_questions()
 
 
 @admin_api_legacy_bp.route('/questions/batch_change_type', methods=['POST'])
 def batch_change_type():
     """批量修改题型（向后兼容路径：/admin/questions/batch_change_type）"""
-    data = request.json
-    ids = data.get('ids', [])
-    target_type = data.get('target_type', '')
-    
-    if not ids or not target_type:
-        return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
-    
-    conn = get_db()
-    try:
-        conn.executemany('UPDATE questions SET q_type = ? WHERE id = ?', [(target_type, id) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功修改 {len(ids)} 道题目的题型'})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({'status': 'error', 'message': f'批量修改失败: {str(e)}'}), 500
+    from .api import batch_change_type as _batch_change_type
+    return _batch_change_type()
 
 
 @admin_api_legacy_bp.route('/questions/batch_move_subject', methods=['POST'])
 def batch_move_subject():
     """批量移动科目（向后兼容路径：/admin/questions/batch_move_subject）"""
-    data = request.json
-    ids = data.get('ids', [])
-    target_subject_id = data.get('target_subject_id')
-    
-    if not ids or not target_subject_id:
-        return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
-    
-    conn = get_db()
-    try:
-        conn.executemany('UPDATE questions SET subject_id = ? WHERE id = ?', [(target_subject_id, id) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功移动 {len(ids)} 道题目'})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({'status': 'error', 'message': f'批量移动失败: {str(e)}'}), 500
+    from .api import batch_move_subject as _batch_move_subject
+    return _batch_move_subject()
 
 
 @admin_api_legacy_bp.route('/questions/batch_set_difficulty', methods=['POST'])
 def batch_set_difficulty():
     """批量设置难度（向后兼容路径：/admin/questions/batch_set_difficulty）"""
-    data = request.json
-    ids = data.get('ids', [])
-    difficulty = data.get('difficulty', '')
-    
-    if not ids or not difficulty:
-        return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
-    
-    conn = get_db()
-    try:
-        conn.executemany('UPDATE questions SET difficulty = ? WHERE id = ?', [(difficulty, id) for id in ids])
-        conn.commit()
-        return jsonify({'status': 'success', 'message': f'成功设置 {len(ids)} 道题目的难度'})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({'status': 'error', 'message': f'批量设置失败: {str(e)}'}), 500
+    from .api import batch_set_difficulty as _batch_set_difficulty
+    return _batch_set_difficulty()
+
+
+@admin_api_legacy_bp.route('/questions/batch_tags', methods=['POST'])
+def batch_tags():
+    """批量操作标签（向后兼容路径：/admin/questions/batch_tags）"""
+    from .api import batch_tags as _batch_tags
+    return _batch_tags()
 
 
 @admin_api_legacy_bp.route('/users/<int:user_id>/toggle_admin', methods=['POST'])
@@ -475,33 +402,8 @@ def reset_password(user_id):
 @admin_api_legacy_bp.route('/users/export')
 def export_users():
     """导出用户CSV（向后兼容路径：/admin/users/export）"""
-    conn = get_db()
-    rows = conn.execute(
-        'SELECT id, username, is_admin, is_locked, created_at FROM users ORDER BY id'
-    ).fetchall()
-    
-    def csv_escape(s):
-        s = '' if s is None else str(s)
-        if any(c in s for c in [',','"','\n','\r']):
-            s = '"' + s.replace('"','""') + '"'
-        return s
-    
-    out = '\ufeff' + 'id,username,is_admin,is_locked,created_at\n'
-    for r in rows:
-        out += ','.join([
-            str(r['id']),
-            csv_escape(r['username']),
-            '1' if r['is_admin'] else '0',
-            '1' if (r['is_locked'] or 0) else '0',
-            csv_escape(r['created_at'])
-        ]) + '\n'
-    
-    from flask import Response
-    return Response(
-        out,
-        mimetype='text/csv; charset=utf-8',
-        headers={'Content-Disposition': 'attachment; filename=users.csv'}
-    )
+    from .api import admin_export_users
+    return admin_export_users()
 
 
 @admin_api_legacy_bp.route('/users/create', methods=['POST'])
@@ -564,8 +466,10 @@ def delete_user(user_id):
         # 级联清理（仅清理我们明确知道的表；其余若还有外键引用，会被 IntegrityError 拦住）
         conn.execute('DELETE FROM favorites WHERE user_id=?', (user_id,))
         conn.execute('DELETE FROM mistakes WHERE user_id=?', (user_id,))
+        conn.execute('DELETE FROM answer_events WHERE user_id=?', (user_id,))
         conn.execute('DELETE FROM user_answers WHERE user_id=?', (user_id,))
         conn.execute('DELETE FROM user_progress WHERE user_id=?', (user_id,))
+        conn.execute('DELETE FROM user_progress_orders WHERE user_id=?', (user_id,))
         conn.execute('UPDATE questions SET created_by=NULL WHERE created_by=?', (user_id,))
         conn.execute('DELETE FROM users WHERE id=?', (user_id,))
         conn.commit()
@@ -645,90 +549,15 @@ def export_questions_api():
 @admin_api_legacy_bp.route('/questions/export_package', methods=['GET'])
 def export_questions_package():
     """导出题目包（向后兼容路径：/admin/questions/export_package）"""
-    from flask import request, send_file, current_app
-    import zipfile
-    import io
-    import datetime
-    import os
-    
-    subject_id = request.args.get('subject_id')
-    q_type = request.args.get('type')
-    
-    conn = get_db()
-    
-    # 1. 获取科目名称
-    subject_name = "all_subjects"
-    if subject_id:
-        subject_row = conn.execute('SELECT name FROM subjects WHERE id = ?', (subject_id,)).fetchone()
-        if subject_row:
-            subject_name = subject_row['name']
-
-    # 2. 查询题目数据
-    sql = '''
-        SELECT q.*, s.name as subject_name 
-        FROM questions q 
-        LEFT JOIN subjects s ON q.subject_id = s.id
-        WHERE 1=1
-    '''
-    params = []
-    if subject_id:
-        sql += ' AND subject_id = ?'
-        params.append(subject_id)
-    if q_type and q_type != 'all':
-        sql += ' AND q_type = ?'
-        params.append(q_type)
-    
-    sql += ' ORDER BY id'
-    rows = conn.execute(sql, params).fetchall()
-    
-    questions_data = [dict(row) for row in rows]
-    
-    # 3. 创建 ZIP 文件
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 3.1 写入 data.json
-        # 使用能够处理 datetime 对象的 JSON encoder
-        def json_default(o):
-            if isinstance(o, (datetime.date, datetime.datetime)):
-                return o.isoformat()
-        zf.writestr('data.json', json.dumps(questions_data, indent=4, ensure_ascii=False, default=json_default))
-        
-        # 3.2 收集并写入图片
-        image_paths = {q['image_path'] for q in questions_data if q.get('image_path')}
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(current_app.root_path, '..', 'uploads'))
-        
-        for image_path in image_paths:
-            # image_path is like 'question_images/1766...png'
-            if not image_path:
-                continue
-            full_image_path = os.path.join(upload_folder, *image_path.split('/'))
-            if os.path.exists(full_image_path):
-                # 写入 zip 时保持目录结构, e.g., images/question_images/....png
-                arcname = 'images/' + image_path.replace('\\', '/')
-                zf.write(full_image_path, arcname)
-
-    memory_file.seek(0)
-    
-    # 4. 生成文件名并发送文件
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"questions_export_{subject_name}_{timestamp}.zip"
-    
-    return send_file(
-        memory_file,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/zip'
-    )
+    from .api import export_questions_package as _export_questions_package
+    return _export_questions_package()
 
 
 @admin_api_legacy_bp.route('/questions/import_package', methods=['POST'])
 def import_questions_package():
     """导入题目包（向后兼容路径：/admin/questions/import_package）"""
-    # 直接使用api.py中的实现，但需要导入必要的模块
-    from flask import current_app
-    import zipfile
-    import datetime
-    import os
+    from flask import session
+    from .api import _import_package_response
     
     if 'file' not in request.files:
         return jsonify({'status': 'error', 'message': '没有文件部分'}), 400
@@ -737,97 +566,5 @@ def import_questions_package():
     if file.filename == '' or not file.filename.endswith('.zip'):
         return jsonify({'status': 'error', 'message': '请上传有效的 .zip 文件'}), 400
 
-    conn = get_db()
-    
-    # 获取现有的科目 name -> id 映射
-    subjects = conn.execute('SELECT id, name FROM subjects').fetchall()
-    subject_map = {s['name']: s['id'] for s in subjects}
-
-    imported_count = 0
-    errors = []
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(current_app.root_path, '..', 'uploads'))
-
-    try:
-        with zipfile.ZipFile(file, 'r') as zf:
-            if 'data.json' not in zf.namelist():
-                return jsonify({'status': 'error', 'message': '压缩包中缺少 data.json 文件'}), 400
-            
-            with zf.open('data.json') as f:
-                questions_data = json.load(f)
-            
-            for q in questions_data:
-                try:
-                    # 1. 处理科目
-                    subject_name = q.get('subject_name')
-                    if not subject_name:
-                        errors.append(f"题目ID {q.get('id')} 缺少科目名称，已跳过。")
-                        continue
-
-                    if subject_name not in subject_map:
-                        cursor = conn.execute('INSERT INTO subjects (name) VALUES (?)', (subject_name,))
-                        subject_id = cursor.lastrowid
-                        subject_map[subject_name] = subject_id
-                    else:
-                        subject_id = subject_map[subject_name]
-
-                    # 2. 处理图片
-                    new_image_path = q.get('image_path')
-                    if new_image_path:
-                        arcname = 'images/' + new_image_path.replace('\\', '/')
-                        if arcname in zf.namelist():
-                            # 生成新的唯一文件名以避免冲突
-                            ext = os.path.splitext(new_image_path)[1]
-                            unique_filename = f"{int(datetime.datetime.now().timestamp())}_{imported_count}{ext}"
-                            image_save_dir = os.path.join(upload_folder, 'question_images')
-                            os.makedirs(image_save_dir, exist_ok=True)
-                            image_save_path = os.path.join(image_save_dir, unique_filename)
-                            
-                            with zf.open(arcname) as source, open(image_save_path, 'wb') as target:
-                                target.write(source.read())
-                            
-                            new_image_path = f'question_images/{unique_filename}'
-                        else:
-                            new_image_path = None # 图片在zip中不存在
-
-                    # 3. 插入题目数据 (忽略原始ID)
-                    from flask import session
-                    conn.execute('''
-                        INSERT INTO questions (subject_id, q_type, content, options, answer, explanation, difficulty, tags, image_path, created_by, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        subject_id,
-                        q.get('q_type'),
-                        q.get('content'),
-                        q.get('options'),
-                        q.get('answer'),
-                        q.get('explanation'),
-                        q.get('difficulty'),
-                        q.get('tags'),
-                        new_image_path,
-                        session.get('user_id') or q.get('created_by'),
-                        q.get('created_at'),
-                        q.get('updated_at')
-                    ))
-                    imported_count += 1
-                except Exception as e:
-                    errors.append(f"导入题目ID {q.get('id', 'N/A')} 时出错: {str(e)}")
-
-        conn.commit()
-
-        message = f'成功导入 {imported_count} 道题。'
-        if errors:
-            message += f' 遇到 {len(errors)} 个问题。'
-        
-        return jsonify({
-            'status': 'success' if not errors else 'warning',
-            'message': message,
-            'imported_count': imported_count,
-            'errors': errors
-        })
-
-    except zipfile.BadZipFile:
-        return jsonify({'status': 'error', 'message': '文件不是一个有效的ZIP压缩包'}), 400
-    except Exception as e:
-        conn.rollback() # 如果发生意外错误，回滚事务
-        return jsonify({'status': 'error', 'message': f'处理文件时发生未知错误: {str(e)}'}), 500
+    return _import_package_response(get_db(), file, session.get('user_id'))
 
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+管理后台后台作业API（题库导入/导出）
+上传文件落盘后立即返回作业ID，前端轮询 /admin/api/jobs/<id> 获取进度
+"""
+from flask import Blueprint, request, jsonify, session, send_file
+from app.core.utils.database import get_db
+from app.core.utils.validators import parse_int
+from app.core.jobs import job_manager, JobManager, JOB_FAILED, JOB_CANCELLED, JOB_SUCCEEDED
+from app.modules.admin.services.question_job_service import (
+    JOB_IMPORT_EXCEL,
+    JOB_IMPORT_PACKAGE,
+    JOB_EXPORT_EXCEL,
+    JOB_EXPORT_PACKAGE,
+)
+
+admin_jobs_bp = Blueprint('admin_jobs', __name__)
+
+
+def _load_job(job_id):
+    """读取作业并校验访问权限（管理员可查看全部，其他人只能查看自己创建的作业）"""
+    job = job_manager.get(get_db(), job_id)
+    if not job:
+        return None, (jsonify({'status': 'error', 'message': '作业不存在'}), 404)
+    if not session.get('is_admin') and job.get('created_by') != session.get('user_id'):
+        return None, (jsonify({'status': 'forbidden', 'message': '无权访问该作业'}), 403)
+    return job, None
+
+
+def _job_response(job, **extra):
+    payload = {'status': 'success', 'job': JobManager.to_dict(job)}
+    payload.update(extra)
+    return jsonify(payload)
+
+
+def _create_import_job(kind, ext):
+    """保存上传文件并创建导入作业；同一用户重复提交同一文件（sha256）时复用已有作业"""
+    if 'file' not in request.files:
+        return jsonify({'status': 'error', 'message': '没有文件部分'}), 400
+    file = request.files['file']
+    if not file or file.filename == '' or not file.filename.lower().endswith(f'.{ext}'):
+        return jsonify({'status': 'error', 'message': f'只允许上传 .{ext} 文件'}), 400
+
+    conn = get_db()
+    file_path, sha256 = job_manager.store_upload(file, ext)
+    dedupe_key = f'{kind}:{sha256}'
+    force = request.form.get('force') in ('1', 'true')
+
+    if not force:
+        existing = job_manager.find_by_dedupe_key(conn, dedupe_key, session.get('user_id'))
+        if existing and existing['status'] in (JOB_FAILED, JOB_CANCELLED):
+            # 幂等重试：同一文件上次未完成，从断点继续（文件可能已被过期清理，指回本次落盘的文件）
+            conn.execute('UPDATE jobs SET file_path = ? WHERE id = ?', (file_path, existing['id']))
+            job_manager.retry(conn, existing['id'])
+            return _job_response(job_manager.get(conn, existing['id']), resumed=True)
+        if existing:
+            # 排队中/执行中/已成功：不重复导入（force=1 可强制重新导入）
+            return _job_response(existing, duplicate=True)
+
+    job_id = job_manager.create(
+        conn, kind, session.get('user_id'),
+        file_path=file_path, file_name=file.filename, dedupe_key=dedupe_key
+    )
+    conn.commit()
+    job_manager.submit(job_id)
+    return _job_response(job_manager.get(conn, job_id)), 202
+
+
+def _create_export_job(kind):
+    payload = request.get_json(silent=True) or request.form
+    params = {
+        'subject_id': parse_int(payload.get('subject_id'), 0, min_val=0) or None,
+        'type': payload.get('type') or 'all',
+    }
+    conn = get_db()
+    job_id = job_manager.create(conn, kind, session.get('user_id'), params=params)
+    conn.commit()
+    job_manager.submit(job_id)
+    return _job_response(job_manager.get(conn, job_id)), 202
+
+
+@admin_jobs_bp.route('/jobs/import/excel', methods=['POST'])
+def create_import_excel_job():
+    """创建 Excel 导入作业"""
+    return _create_import_job(JOB_IMPORT_EXCEL, 'xlsx')
+
+
+@admin_jobs_bp.route('/jobs/import/package', methods=['POST'])
+def create_import_package_job():
+    """创建题目包导入作业"""
+    return _create_import_job(JOB_IMPORT_PACKAGE, 'zip')
+
+
+@admin_jobs_bp.route('/jobs/export/excel', methods=['POST'])
+def create_export_excel_job():
+    """创建 Excel 导出作业"""
+    return _create_export_job(JOB_EXPORT_EXCEL)
+
+
+@admin_jobs_bp.route('/jobs/export/package', methods=['POST'])
+def create_export_package_job():
+    """创建题目包导出作业"""
+    return _create_export_job(JOB_EXPORT_PACKAGE)
+
+
+@admin_jobs_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """最近的作业列表（管理员查看全部，其他人只看自己的）"""
+    limit = parse_int(request.args.get('limit'), 20, min_val=1, max_val=100)
+    conn = get_db()
+    if session.get('is_admin'):
+        rows = conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    else:
+        rows = conn.execute(
+            'SELECT * FROM jobs WHERE created_by = ? ORDER BY id DESC LIMIT ?',
+            (session.get('user_id'), limit)
+        ).fetchall()
+    return jsonify({'status': 'success', 'jobs': [JobManager.to_dict(dict(r)) for r in rows]})
+
+
+@admin_jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """作业进度（已处理行数、成功数、错误数与最近的错误明细）"""
+    job, error = _load_job(job_id)
+    if error:
+        return error
+    return _job_response(job)
+
+
+@admin_jobs_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消作业（运行中的作业在下一个检查点停止，已提交的部分保留）"""
+    job, error = _load_job(job_id)
+    if error:
+        return error
+    conn = get_db()
+    job_manager.cancel(conn, job_id)
+    return _job_response(job_manager.get(conn, job_id))
+
+
+@admin_jobs_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """重试失败/已取消的作业（导入从断点继续）"""
+    job, error = _load_job(job_id)
+    if error:
+        return error
+    conn = get_db()
+    if not job_manager.retry(conn, job_id):
+        return jsonify({'status': 'error', 'message': '只有失败或已取消的作业可以重试'}), 400
+    return _job_response(job_manager.get(conn, job_id))
+
+
+@admin_jobs_bp.route('/jobs/<int:job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    """下载导出作业的结果文件"""
+    job, error = _load_job(job_id)
+    if error:
+        return error
+    info = JobManager.to_dict(job)
+    if job['status'] != JOB_SUCCEEDED or not info['has_download']:
+        return jsonify({'status': 'error', 'message': '导出文件不存在或已过期'}), 404
+    result = info['result'] or {}
+    return send_file(
+        job['result_path'],
+        as_attachment=True,
+        download_name=result.get('download_name') or f'job_{job_id}'
+    )
@@ -2,6 +2,7 @@
 """管理后台页面路由"""
 from flask import Blueprint, render_template, session, request
 from app.core.utils.database import get_db
+from app.core.utils import metrics, user_stats
 
 admin_pages_bp = Blueprint('admin_pages', __name__)
 
@@ -12,9 +13,10 @@ def admin_dashboard():
     """管理后台首页"""
     conn = get_db()
     
-    q_count = conn.execute('SELECT COUNT(1) FROM questions').fetchone()[0]
+    # 计数取自汇总表：题目数来自 question_counts，用户数来自 metric_daily（均由触发器维护）
+    q_count = conn.execute('SELECT IFNULL(SUM(n), 0) FROM question_counts').fetchone()[0]
     s_count = conn.execute('SELECT COUNT(1) FROM subjects').fetchone()[0]
-    u_count = conn.execute('SELECT COUNT(1) FROM users').fetchone()[0]
+    u_count = metrics.total(conn, 'users')
     admin_count = conn.execute('SELECT COUNT(1) FROM users WHERE is_admin = 1').fetchone()[0]
     
     recent_q = conn.execute(
@@ -22,9 +24,9 @@ def admin_dashboard():
     ).fetchall()
     
     subject_dist = conn.execute('''
-        SELECT s.name, COUNT(q.id) as count
+        SELECT s.name, IFNULL(SUM(c.n), 0) as count
         FROM subjects s
-        LEFT JOIN questions q ON s.id = q.subject_id
+        LEFT JOIN question_counts c ON s.id = c.subject_id
         GROUP BY s.id
         ORDER BY count DESC
     ''').fetchall()
@@ -77,22 +79,17 @@ def admin_user_detail_page(user_id):
     if not u:
         return "用户不存在", 404
     
-    # 收藏/错题
-    fav = conn.execute('SELECT COUNT(1) FROM favorites WHERE user_id=?', (user_id,)).fetchone()[0]
-    mis = conn.execute('SELECT COUNT(1) FROM mistakes WHERE user_id=?', (user_id,)).fetchone()[0]
-    
-    # 答题统计
-    r = conn.execute(
-        'SELECT COUNT(1) AS total, SUM(is_correct) AS correct FROM user_answers WHERE user_id=?',
-        (user_id,)
-    ).fetchone()
-    total = r['total'] or 0
-    correct = r['correct'] or 0
+    # 收藏/错题/答题/考试计数（触发器维护的 user_stats）
+    summary = user_stats.summary(conn, user_id)
+    fav = summary['favorites']
+    mis = summary['mistakes']
+    total = summary['answered']
+    correct = summary['correct']
     acc = round(correct * 100.0 / total, 1) if total else 0.0
     
     # 考试统计
     ex_ongoing = conn.execute('SELECT COUNT(1) FROM exams WHERE user_id=? AND status="ongoing"', (user_id,)).fetchone()[0]
-    ex_submitted = conn.execute('SELECT COUNT(1) FROM exams WHERE user_id=? AND status="submitted"', (user_id,)).fetchone()[0]
+    ex_submitted = summary['submitted_exams']
     
     recent = conn.execute(
         'SELECT id, subject, total_score, started_at, submitted_at FROM exams WHERE user_id=? AND status="submitted" ORDER BY submitted_at DESC LIMIT 5',
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+批量操作引擎
+
+管理后台的批量删除/改题型/移动科目/设难度/改标签、批量重置刷题数共用：
+- ID 去重排序后按 BULK_CHUNK_SIZE 分块，每块一条带有界 IN 列表的集合语句
+  （排序后每块落在连续的主键区间，索引访问局部性好；IN 列表不会超过 SQLite 变量上限）
+- 所有分块在同一个事务中执行，任一块失败整体回滚
+- 返回实际影响的行数（cursor.rowcount 之和），不存在的 ID 不计入
+- 题目计数（question_counts）与标签索引（question_tags）由触发器随语句维护
+"""
+import json
+from typing import Any, Iterable, Iterator, List, Sequence
+
+from app.core.utils import blob_store
+from app.core.utils.database import tags_json_sql
+
+BULK_CHUNK_SIZE = 500
+
+
+def normalize_ids(ids: Any) -> List[int]:
+    """
+    校验并规范化 ID 列表（转为整数、去重、升序）
+
+    Raises:
+        ValueError: 不是列表或包含非整数 ID
+    """
+    if not isinstance(ids, (list, tuple)):
+        raise ValueError('ID 列表格式错误')
+    try:
+        return sorted({int(i) for i in ids if not isinstance(i, bool)})
+    except (TypeError, ValueError):
+        raise ValueError('ID 列表包含无效的 ID')
+
+
+def parse_tags(tags: Any) -> List[str]:
+    """逗号分隔的标签字符串/列表 -> 去重后的标签列表"""
+    if isinstance(tags, (list, tuple)):
+        tags = ','.join(str(t) for t in tags)
+    return sorted({t.strip() for t in (tags or '').split(',') if t.strip()})
+
+
+def _chunks(ids: Sequence[int], size: int) -> Iterator[Sequence[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class BulkOperationService:
+    """批量操作引擎"""
+
+    @staticmethod
+    def execute(conn, sql: str, ids: Iterable[int], params: Sequence[Any] = (),
+                chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """
+        分块执行集合语句（单事务）
+
+        Args:
+            conn: 数据库连接
+            sql: SQL 语句，用 {ids} 表示 ID 列表占位（展开为 ?,?,...），参数顺序为 params + 本块 ID
+            ids: 已规范化的 ID 列表
+            params: 位于 ID 之前的语句参数
+            chunk_size: 每块 ID 数
+
+        Returns:
+            影响的行数
+        """
+        ids = list(ids)
+        affected = 0
+        try:
+            for chunk in _chunks(ids, chunk_size):
+                placeholders = ','.join('?' * len(chunk))
+                cur = conn.execute(sql.format(ids=placeholders), [*params, *chunk])
+                affected += max(cur.rowcount, 0)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return affected
+
+    @staticmethod
+    def delete_questions(conn, ids: List[int]) -> int:
+        """批量删除题目（收藏/错题/答题记录随外键级联删除，计数与标签由触发器维护，图片引用先行释放）"""
+        try:
+            for chunk in _chunks(ids, BULK_CHUNK_SIZE):
+                blob_store.release_question_images(conn, f"id IN ({','.join('?' * len(chunk))})", chunk)
+        except Exception:
+            conn.rollback()
+            raise
+        return BulkOperationService.execute(conn, 'DELETE FROM questions WHERE id IN ({ids})', ids)
+
+    @staticmethod
+    def update_questions(conn, ids: List[int], column: str, value: Any) -> int:
+        """
+        批量设置题目的单个字段
+
+        Args:
+            column: 字段名（q_type / subject_id / difficulty，由调用方固定传入，不接受用户输入）
+            value: 新值
+        """
+        if column not in ('q_type', 'subject_id', 'difficulty'):
+            raise ValueError(f'不支持批量修改的字段: {column}')
+        return BulkOperationService.execute(
+            conn,
+            f'UPDATE questions SET {column} = ?, updated_at = CURRENT_TIMESTAMP WHERE id IN ({{ids}})',
+            ids, (value,)
+        )
+
+    @staticmethod
+    def update_question_tags(conn, ids: List[int], action: str, tags: List[str]) -> int:
+        """
+        批量修改题目标签
+
+        新标签在 SQL 中与原标签合并/剔除（去重、排序后以逗号拼接），不再逐题读出后回写
+
+        Args:
+            action: add / remove / set
+            tags: 标签列表（已去除空白）
+        """
+        if action == 'set':
+            return BulkOperationService.execute(
+                conn,
+                'UPDATE questions SET tags = ?, updated_at = CURRENT_TIMESTAMP WHERE id IN ({ids})',
+                ids, (','.join(tags),)
+            )
+        if action not in ('add', 'remove'):
+            raise ValueError(f'不支持的标签操作: {action}')
+
+        tags_json = json.dumps(tags, ensure_ascii=False)
+        add_json, remove_json = (tags_json, '[]') if action == 'add' else ('[]', tags_json)
+        sql = f'''
+            UPDATE questions SET
+                tags = (
+                    SELECT IFNULL(GROUP_CONCAT(tag, ','), '') FROM (
+                        SELECT TRIM(value) AS tag FROM json_each({tags_json_sql('questions')})
+                        WHERE TRIM(value) != '' AND TRIM(value) NOT IN (SELECT value FROM json_each(?))
+                        UNION
+                        SELECT value FROM json_each(?)
+                        ORDER BY tag
+                    )
+                ),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN ({{ids}})
+        '''
+        return BulkOperationService.execute(conn, sql, ids, (remove_json, add_json))
+
+    @staticmethod
+    def reset_quiz_counts(conn, user_ids: List[int]) -> int:
+        """批量重置刷题数（没有统计记录的用户插入一条清零记录；不存在的用户跳过）"""
+        return BulkOperationService.execute(
+            conn,
+            '''
+            INSERT INTO user_quiz_stats (user_id, total_answered, last_reset_at)
+            SELECT id, 0, CURRENT_TIMESTAMP FROM users WHERE id IN ({ids})
+            ON CONFLICT(user_id) DO UPDATE SET
+                total_answered = 0,
+                last_reset_at = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+            ''',
+            user_ids
+        )
+
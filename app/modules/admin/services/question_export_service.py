@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+题库导出服务（Excel / 题目包）
+同步下载接口与后台导出作业共用
+"""
+import datetime
+import io
+import json
+import os
+import time
+import zipfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from app.core.utils.lazy_import import lazy_import
+
+openpyxl = lazy_import('openpyxl')
+
+# 导出时每批从数据库读取的行数
+EXPORT_FETCH_SIZE = 500
+# 本身已压缩的图片格式，打包时直接存储（ZIP_STORED）
+PRECOMPRESSED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+_COPY_CHUNK_SIZE = 64 * 1024
+
+
+class QuestionExportService:
+    """题库导出服务"""
+
+    @staticmethod
+    def build_query(subject_id: Optional[str], q_type: Optional[str],
+                    after_id: Optional[int] = None, limit: Optional[int] = None) -> Tuple[str, List[Any]]:
+        """构建导出查询（科目/题型筛选，按 id 排序；after_id/limit 用于按主键分批读取）"""
+        sql = '''
+            SELECT q.*, s.name as subject_name
+            FROM questions q
+            LEFT JOIN subjects s ON q.subject_id = s.id
+            WHERE 1=1
+        '''
+        params: List[Any] = []
+        if after_id is not None:
+            sql += ' AND q.id > ?'
+            params.append(after_id)
+        if subject_id:
+            sql += ' AND q.subject_id = ?'
+            params.append(subject_id)
+        if q_type and q_type != 'all':
+            sql += ' AND q.q_type = ?'
+            params.append(q_type)
+        sql += ' ORDER BY q.id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return sql, params
+
+    @staticmethod
+    def iter_batches(conn, subject_id: Optional[str], q_type: Optional[str],
+                     batch_size: int = EXPORT_FETCH_SIZE) -> Iterator[List[Any]]:
+        """
+        按主键分批读取待导出的题目
+
+        每批是一条独立执行完的查询：流式下载期间不会长时间持有读锁，
+        调用方在批与批之间写库（如上报作业进度）也不会与其他写入方互相等待
+        """
+        last_id = 0
+        while True:
+            sql, params = QuestionExportService.build_query(subject_id, q_type, after_id=last_id, limit=batch_size)
+            rows = conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['id']
+
+    @staticmethod
+    def export_filename(conn, subject_id: Optional[str], ext: str) -> str:
+        """生成下载文件名：questions_export_<科目名>_<时间戳>.<ext>"""
+        subject_name = "all_subjects"
+        if subject_id:
+            subject_row = conn.execute('SELECT name FROM subjects WHERE id = ?', (subject_id,)).fetchone()
+            if subject_row:
+                subject_name = subject_row[0]
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"questions_export_{subject_name}_{timestamp}.{ext}"
+
+    @staticmethod
+    def _sheet_shape(conn, subject_id: Optional[str], q_type: Optional[str]) -> Tuple[int, int, int]:
+        """
+        预先统计导出行数与最大选项数/填空数（用于确定表头列数）
+
+        write_only 工作表必须先写表头，因此用一条聚合查询代替“先读全部题目再建表”
+        """
+        sql, params = QuestionExportService.build_query(subject_id, q_type)
+        row = conn.execute(f'''
+            SELECT
+                COUNT(*),
+                MAX(CASE WHEN json_valid(options) THEN json_array_length(options) ELSE 0 END),
+                MAX(CASE WHEN q_type = '填空题' AND answer IS NOT NULL AND answer != ''
+                         THEN (LENGTH(answer) - LENGTH(REPLACE(answer, ';;', ''))) / 2 + 1
+                         ELSE 0 END)
+            FROM ({sql})
+        ''', params).fetchone()
+        return row[0] or 0, row[1] or 0, row[2] or 0
+
+    @staticmethod
+    def _excel_row(question: Dict[str, Any], max_options: int, max_blanks: int) -> List[Any]:
+        """题目 -> 导出行（subject, q_type, content, answer, explanation, option_*, blank_*）"""
+        q_type_val = question.get('q_type', '')
+
+        # 解析选项
+        options = []
+        if question.get('options'):
+            try:
+                options = json.loads(question['options'])
+            except Exception:
+                options = []
+
+        # 解析填空题答案
+        blank_answers = []
+        if q_type_val == '填空题' and question.get('answer'):
+            blank_answers = question['answer'].split(';;')
+
+        row = [
+            question.get('subject_name', ''),
+            q_type_val,
+            question.get('content', ''),
+            question.get('answer', '') if q_type_val != '填空题' else '',
+            question.get('explanation', ''),
+        ]
+
+        # 选项列（移除选项前缀，如 "A. "）
+        option_cells = []
+        for i, opt in enumerate(options[:max_options]):
+            opt_text = opt
+            prefix = chr(ord('A') + i) + '. '
+            if isinstance(opt_text, str) and opt_text.startswith(prefix):
+                opt_text = opt_text[len(prefix):]
+            option_cells.append(opt_text)
+        row += option_cells + [None] * (max_options - len(option_cells))
+
+        # 填空题答案列
+        blank_cells = blank_answers[:max_blanks]
+        row += blank_cells + [None] * (max_blanks - len(blank_cells))
+        return row
+
+    @staticmethod
+    def write_excel(conn, subject_id: Optional[str], q_type: Optional[str], dest,
+                    progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        导出题目为 Excel（与导入模板相同的分列格式）
+
+        使用 openpyxl write_only 工作簿按批写入行（行数据落在临时文件中），
+        内存占用与题目数量无关
+
+        Args:
+            conn: 数据库连接
+            subject_id: 科目筛选
+            q_type: 题型筛选（'all' 或空表示全部）
+            dest: 输出文件路径或可写二进制流
+            progress: 进度回调（参数为已处理题目数）
+
+        Returns:
+            导出的题目数（为 0 时不写出文件）
+        """
+        total, max_options, max_blanks = QuestionExportService._sheet_shape(conn, subject_id, q_type)
+        if not total:
+            return 0
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('题目示例')
+        ws.append(
+            ['subject', 'q_type', 'content', 'answer', 'explanation']
+            + [f'option_{i}' for i in range(max_options)]
+            + [f'blank_{i}' for i in range(max_blanks)]
+        )
+
+        processed = 0
+        for rows in QuestionExportService.iter_batches(conn, subject_id, q_type):
+            for row in rows:
+                ws.append(QuestionExportService._excel_row(dict(row), max_options, max_blanks))
+            processed += len(rows)
+            if progress:
+                progress(processed)
+
+        wb.save(dest)
+        return processed
+
+    @staticmethod
+    def iter_package(conn, subject_id: Optional[str], q_type: Optional[str], upload_root: str,
+                     progress: Optional[Callable[[int], None]] = None) -> Iterator[bytes]:
+        """
+        流式生成题目包（data.json + images/），边查询边压缩边输出
+
+        - 题目按主键分批读取，data.json 逐条写入（仍是合法的 JSON 数组，导入端无需改动）
+        - 已压缩的图片格式使用 ZIP_STORED，不再二次 deflate
+        - ZIP 写入不可 seek 的缓冲区（条目使用 data descriptor），每写一段就产出一段，内存占用与题库大小无关
+
+        Args:
+            conn: 数据库连接
+            subject_id: 科目筛选
+            q_type: 题型筛选
+            upload_root: 上传根目录（读取题目图片）
+            progress: 进度回调（参数为已处理题目数）
+
+        Yields:
+            ZIP 文件字节块
+        """
+        buffer = _ZipStreamBuffer()
+        image_paths: Dict[str, None] = {}  # 保持首次出现顺序的去重集合
+        processed = 0
+
+        def json_default(o):
+            if isinstance(o, (datetime.date, datetime.datetime)):
+                return o.isoformat()
+
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            # 1. data.json：逐条序列化写入压缩流
+            with zf.open(_zip_info('data.json', zipfile.ZIP_DEFLATED), 'w') as entry:
+                entry.write(b'[')
+                for rows in QuestionExportService.iter_batches(conn, subject_id, q_type):
+                    for row in rows:
+                        question = dict(row)
+                        if question.get('image_path'):
+                            image_paths[question['image_path']] = None
+                        entry.write((',\n' if processed else '\n').encode('utf-8'))
+                        entry.write(json.dumps(question, ensure_ascii=False, default=json_default).encode('utf-8'))
+                        processed += 1
+                    if progress:
+                        progress(processed)
+                    yield buffer.drain()
+                entry.write(b'\n]')
+            yield buffer.drain()
+
+            # 2. 图片：保持目录结构, e.g., images/question_images/....png
+            for image_path in image_paths:
+                full_image_path = os.path.join(upload_root, *image_path.split('/'))
+                if not os.path.isfile(full_image_path):
+                    continue
+                ext = os.path.splitext(image_path)[1].lower().lstrip('.')
+                compress_type = zipfile.ZIP_STORED if ext in PRECOMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                info = zipfile.ZipInfo.from_file(full_image_path, 'images/' + image_path.replace('\\', '/'))
+                info.compress_type = compress_type
+                with open(full_image_path, 'rb') as source, zf.open(info, 'w') as entry:
+                    for chunk in iter(lambda: source.read(_COPY_CHUNK_SIZE), b''):
+                        entry.write(chunk)
+                        if buffer.pending() >= _COPY_CHUNK_SIZE:
+                            yield buffer.drain()
+                yield buffer.drain()
+
+        # 中央目录
+        yield buffer.drain()
+
+    @staticmethod
+    def write_package(conn, subject_id: Optional[str], q_type: Optional[str], upload_root: str, dest,
+                      progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        导出题目包到文件/可写流（后台作业使用）
+
+        Args:
+            conn: 数据库连接
+            subject_id: 科目筛选
+            q_type: 题型筛选
+            upload_root: 上传根目录
+            dest: 输出文件路径或可写二进制流
+            progress: 进度回调（参数为已处理题目数）
+
+        Returns:
+            导出的题目数
+        """
+        counter = {'processed': 0}
+
+        def _progress(processed: int) -> None:
+            counter['processed'] = processed
+            if progress:
+                progress(processed)
+
+        out = open(dest, 'wb') if isinstance(dest, str) else dest
+        try:
+            for chunk in QuestionExportService.iter_package(conn, subject_id, q_type, upload_root, _progress):
+                if chunk:
+                    out.write(chunk)
+        finally:
+            if out is not dest:
+                out.close()
+        return counter['processed']
+
+
+def _zip_info(name: str, compress_type: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    info.compress_type = compress_type
+    return info
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """ZipFile 的只写输出目标：不可 seek，只记录位置；写入的数据由 drain() 取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._size = 0
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._size += len(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def pending(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+"""
+题库导入服务（Excel 流式导入 / 题目包导入）
+
+说明：
+- 使用 openpyxl read_only 模式逐行读取，不把整个工作簿载入内存（不再经过 pandas DataFrame）
+- 按块（chunk_size 行）校验，每块一个事务：新科目 + executemany 批量插入题目
+- 错误以结构化报告返回（行号 / 列名 / 错误码 / 说明），报告条目有上限，内存占用不随行数增长
+- 题目包（.zip）同样按块提交；两种导入都支持在块边界停止、按断点续导（供后台作业使用）
+- 题目包图片由线程池并行解压，与数据库写入重叠；图片清单记录已落盘的哈希，续导时不重复解压
+"""
+import collections
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from app.core.utils import blob_store
+from app.core.utils.lazy_import import lazy_import
+
+openpyxl = lazy_import('openpyxl')
+
+SHEET_NAME = '题目示例'
+REQUIRED_COLUMNS = ['subject', 'q_type', 'content']
+VALID_Q_TYPES = ('选择题', '多选题', '判断题', '填空题', '问答题')
+
+DEFAULT_CHUNK_SIZE = 1000
+# 错误报告最多保留的明细条数（超出部分只计数）
+MAX_ERROR_ITEMS = 1000
+# 题目包图片解压线程数与预取窗口（同时处于解压中/待取用的图片数）
+IMAGE_WORKERS = 4
+IMAGE_PREFETCH_WINDOW = 32
+
+
+def _cell_text(value: Any) -> str:
+    """单元格值 -> 去首尾空白的字符串（整数值的浮点数去掉 .0）"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class ImportErrorReport:
+    """结构化错误报告（明细条数有上限，按错误码汇总计数）"""
+
+    def __init__(self, max_items: int = MAX_ERROR_ITEMS):
+        self.max_items = max_items
+        self.total = 0
+        self.by_code: Dict[str, int] = {}
+        self.items: List[Dict[str, Any]] = []
+
+    def add(self, row: Optional[int], code: str, message: str, column: Optional[str] = None) -> None:
+        self.total += 1
+        self.by_code[code] = self.by_code.get(code, 0) + 1
+        if len(self.items) < self.max_items:
+            self.items.append({'row': row, 'column': column, 'code': code, 'message': message})
+
+    def messages(self) -> List[str]:
+        """兼容旧版前端的文本错误列表"""
+        lines = [
+            f"第 {item['row']} 行: {item['message']}" if item['row'] is not None else item['message']
+            for item in self.items
+        ]
+        if self.total > len(self.items):
+            lines.append(f'……另有 {self.total - len(self.items)} 个问题未列出。')
+        return lines
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'total': self.total,
+            'by_code': dict(self.by_code),
+            'items': list(self.items),
+            'truncated': self.total > len(self.items),
+        }
+
+
+class QuestionImportService:
+    """题库 Excel 导入服务"""
+
+    @staticmethod
+    def iter_excel_rows(source: BinaryIO, sheet_name: str = SHEET_NAME) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """
+        流式读取工作表（第一行为表头）
+
+        Args:
+            source: .xlsx 文件路径或可 seek 的二进制流
+            sheet_name: 工作表名称
+
+        Yields:
+            (Excel 行号, {列名: 单元格文本})；整行为空的行会被跳过
+
+        Raises:
+            ValueError: 工作表不存在或缺少必需列
+        """
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            if sheet_name not in wb.sheetnames:
+                raise ValueError(f'Excel文件中缺少工作表: {sheet_name}')
+            rows = wb[sheet_name].iter_rows(values_only=True)
+
+            header = next(rows, None) or ()
+            columns = [_cell_text(v) for v in header]
+            missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+            if missing:
+                raise ValueError(f'Excel文件中缺少必需的列: {", ".join(missing)}')
+            indexed = [(i, col) for i, col in enumerate(columns) if col]
+
+            for row_number, values in enumerate(rows, start=2):
+                record = {}
+                has_value = False
+                for i, col in indexed:
+                    text = _cell_text(values[i]) if i < len(values) else ''
+                    if text:
+                        has_value = True
+                    # 重名列以第一列为准
+                    record.setdefault(col, text)
+                if has_value:
+                    yield row_number, record
+        finally:
+            wb.close()
+
+    @staticmethod
+    def estimate_rows(source, sheet_name: str = SHEET_NAME) -> Optional[int]:
+        """根据工作表维度信息估算数据行数（不遍历单元格；无维度信息时返回 None）"""
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            if sheet_name not in wb.sheetnames:
+                return None
+            max_row = wb[sheet_name].max_row
+            return max(max_row - 1, 0) if max_row else None
+        finally:
+            wb.close()
+
+    @staticmethod
+    def validate_row(row_number: int, record: Dict[str, str], option_cols: List[str],
+                     blank_cols: List[str], report: ImportErrorReport) -> Optional[Tuple[str, str, str, str, str, str]]:
+        """
+        校验并规整单行数据
+
+        Returns:
+            (subject_name, q_type, content, options_json, answer, explanation)；校验失败返回 None
+        """
+        subject_name = record.get('subject', '')
+        q_type = record.get('q_type', '')
+        content = record.get('content', '')
+        answer = record.get('answer', '')
+        explanation = record.get('explanation', '')
+
+        if not all([subject_name, q_type, content]):
+            report.add(row_number, 'required', '必填字段（subject, q_type, content）不能为空。')
+            return None
+
+        if q_type not in VALID_Q_TYPES:
+            report.add(row_number, 'invalid_type', f'无效的题型 "{q_type}"。', 'q_type')
+            return None
+
+        options_json = '[]'
+        final_answer = answer
+
+        if q_type in ('选择题', '多选题'):
+            options_list = []
+            for i, col_name in enumerate(option_cols):
+                option_text = record.get(col_name, '')
+                if option_text:
+                    prefix = chr(ord('A') + i)
+                    options_list.append(f"{prefix}. {option_text}")
+            if not options_list:
+                report.add(row_number, 'missing_options', '选择题或多选题至少需要一个选项。',
+                           option_cols[0] if option_cols else None)
+                return None
+            if not final_answer:
+                report.add(row_number, 'missing_answer', '选择题或多选题的 `answer` 列不能为空。', 'answer')
+                return None
+            options_json = json.dumps(options_list, ensure_ascii=False)
+
+        elif q_type == '填空题':
+            blank_answers = [record.get(col_name, '') for col_name in blank_cols]
+            blank_answers = [text for text in blank_answers if text]
+            if not blank_answers:
+                report.add(row_number, 'missing_blanks', '填空题至少需要一个 `blank_` 答案。',
+                           blank_cols[0] if blank_cols else None)
+                return None
+            final_answer = ';;'.join(blank_answers)
+
+        elif not final_answer:
+            report.add(row_number, 'missing_answer', '`answer` 列不能为空。', 'answer')
+            return None
+
+        return subject_name, q_type, content, options_json, final_answer, explanation
+
+    @staticmethod
+    def _resolve_subjects(conn, names, subject_map: Dict[str, int]) -> None:
+        """为本块中新出现的科目建档（与题目插入处于同一事务）"""
+        new_names = [name for name in names if name not in subject_map]
+        if not new_names:
+            return
+        conn.executemany(
+            'INSERT OR IGNORE INTO subjects (name) VALUES (?)',
+            [(name,) for name in new_names]
+        )
+        placeholders = ','.join('?' * len(new_names))
+        for row in conn.execute(f'SELECT id, name FROM subjects WHERE name IN ({placeholders})', new_names):
+            subject_map[row[1]] = row[0]
+
+    @staticmethod
+    def _insert_chunk(conn, chunk: List[Tuple[str, str, str, str, str, str]],
+                      subject_map: Dict[str, int], user_id: Optional[int]) -> int:
+        """写入一个块：补建科目 + executemany 批量插入（由调用方提交）"""
+        if not chunk:
+            return 0
+        QuestionImportService._resolve_subjects(conn, {item[0] for item in chunk}, subject_map)
+        conn.executemany(
+            '''
+            INSERT INTO questions (subject_id, q_type, content, options, answer, explanation, created_by, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''',
+            [
+                (subject_map[name], q_type, content, options_json, answer, explanation, user_id)
+                for name, q_type, content, options_json, answer, explanation in chunk
+            ]
+        )
+        return len(chunk)
+
+    @staticmethod
+    def import_excel(conn, source: BinaryIO, user_id: Optional[int],
+                     chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     should_stop: Optional[Callable[[], bool]] = None,
+                     resume_after_row: int = 0) -> Dict[str, Any]:
+        """
+        流式导入 Excel 题库
+
+        Args:
+            conn: 数据库连接（每个块一个事务）
+            source: .xlsx 文件路径或可 seek 的二进制流
+            user_id: 导入人（写入 questions.created_by）
+            chunk_size: 每个事务处理的行数
+            progress: 每个块提交前回调（与块数据同一事务，可在同一连接上记录断点），参数为当前统计
+            should_stop: 返回 True 时在块边界停止（已提交的块保留）
+            resume_after_row: 断点续导：跳过行号不大于该值的行（上次已提交的 last_row）
+
+        Returns:
+            {'imported_count', 'processed_rows', 'last_row', 'stopped', 'error_report': ImportErrorReport}
+
+        Raises:
+            ValueError: 文件格式不符合模板（缺少工作表/必需列）
+        """
+        chunk_size = max(int(chunk_size or DEFAULT_CHUNK_SIZE), 1)
+        report = ImportErrorReport()
+        subject_map = {row[1]: row[0] for row in conn.execute('SELECT id, name FROM subjects')}
+
+        stats = {'imported_count': 0, 'processed_rows': 0, 'last_row': resume_after_row, 'stopped': False}
+        option_cols: Optional[List[str]] = None
+        blank_cols: List[str] = []
+        chunk: List[Tuple[str, str, str, str, str, str]] = []
+        pending_rows = 0
+        last_row = resume_after_row
+
+        def _commit_chunk():
+            nonlocal chunk, pending_rows
+            try:
+                imported = QuestionImportService._insert_chunk(conn, chunk, subject_map, user_id)
+                stats['imported_count'] += imported
+                stats['processed_rows'] += pending_rows
+                stats['last_row'] = last_row
+                if progress:
+                    progress({**stats, 'error_count': report.total, 'error_report': report})
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            chunk, pending_rows = [], 0
+
+        for row_number, record in QuestionImportService.iter_excel_rows(source):
+            if option_cols is None:
+                option_cols = sorted(col for col in record if col.startswith('option_'))
+                blank_cols = sorted(col for col in record if col.startswith('blank_'))
+            if row_number <= resume_after_row:
+                continue
+
+            pending_rows += 1
+            last_row = row_number
+            item = QuestionImportService.validate_row(row_number, record, option_cols, blank_cols, report)
+            if item is not None:
+                chunk.append(item)
+
+            if pending_rows >= chunk_size:
+                _commit_chunk()
+                if should_stop and should_stop():
+                    stats['stopped'] = True
+                    break
+
+        if pending_rows:
+            _commit_chunk()
+
+        stats['error_report'] = report
+        return stats
+
+    @staticmethod
+    def import_package(conn, source, upload_root: str, user_id: Optional[int] = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       should_stop: Optional[Callable[[], bool]] = None,
+                       resume_after: int = 0,
+                       manifest_path: Optional[str] = None,
+                       image_workers: int = IMAGE_WORKERS) -> Dict[str, Any]:
+        """
+        导入题目包（.zip：data.json + images/）
+
+        图片由线程池按题目顺序预先解压（流式写临时文件并计算哈希），与数据库写入并行；
+        主线程只负责把已解压的文件落位并登记引用。
+
+        Args:
+            conn: 数据库连接（每个块一个事务）
+            source: .zip 文件路径或二进制流
+            upload_root: 上传根目录（图片写入内容寻址存储）
+            user_id: 导入人；为空时沿用题目包中的 created_by
+            chunk_size: 每个事务处理的题目数
+            progress: 每个块提交前回调（与块数据同一事务），参数为当前统计
+            should_stop: 返回 True 时在块边界停止
+            resume_after: 断点续导：跳过 data.json 中前 resume_after 道题
+            manifest_path: 图片清单文件（记录已落盘图片的哈希）；续导时清单中的图片不再重复解压
+            image_workers: 解压图片的线程数
+
+        Returns:
+            {'imported_count', 'processed_rows', 'last_row', 'stopped', 'total', 'error_report'}
+
+        Raises:
+            ValueError: 压缩包中缺少 data.json
+            zipfile.BadZipFile: 不是有效的 ZIP 文件
+        """
+        chunk_size = max(int(chunk_size or DEFAULT_CHUNK_SIZE), 1)
+        report = ImportErrorReport()
+        subject_map = {row[1]: row[0] for row in conn.execute('SELECT id, name FROM subjects')}
+        stats = {'imported_count': 0, 'processed_rows': 0, 'last_row': resume_after, 'stopped': False, 'total': 0}
+        manifest = _load_manifest(manifest_path)
+
+        with zipfile.ZipFile(source, 'r') as zf:
+            zip_names = set(zf.namelist())
+            if 'data.json' not in zip_names:
+                raise ValueError('压缩包中缺少 data.json 文件')
+
+            with zf.open('data.json') as f:
+                questions_data = json.load(f)
+            stats['total'] = len(questions_data)
+
+            # 需要解压的图片（按首次使用顺序，清单中已落盘的除外）
+            pending_images: Dict[str, None] = {}
+            for q in questions_data[resume_after:]:
+                arcname = _package_image_arcname(q)
+                if arcname and q.get('subject_name') and arcname in zip_names and arcname not in manifest:
+                    pending_images[arcname] = None
+
+            images = _ImagePrefetcher(zf, upload_root, list(pending_images), image_workers)
+            ctx = {
+                'zip_names': zip_names,
+                'images': images,
+                'imported_images': {},  # arcname -> blob 相对路径（本次导入中已登记）
+                'manifest': manifest,
+                'upload_root': upload_root,
+            }
+            try:
+                for start in range(resume_after, len(questions_data), chunk_size):
+                    try:
+                        for q in questions_data[start:start + chunk_size]:
+                            if QuestionImportService._insert_package_question(
+                                    conn, ctx, q, subject_map, user_id, report):
+                                stats['imported_count'] += 1
+                        stats['last_row'] = min(start + chunk_size, len(questions_data))
+                        stats['processed_rows'] = stats['last_row'] - resume_after
+                        if progress:
+                            progress({**stats, 'error_count': report.total, 'error_report': report})
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        # 已落盘的图片与事务无关：回滚后续导同样可以复用
+                        _save_manifest(manifest_path, manifest)
+
+                    if should_stop and should_stop():
+                        stats['stopped'] = stats['last_row'] < len(questions_data)
+                        break
+            finally:
+                images.close()
+
+        if manifest_path and not stats['stopped']:
+            _remove_manifest(manifest_path)
+        stats['error_report'] = report
+        return stats
+
+    @staticmethod
+    def _insert_package_question(conn, ctx: Dict[str, Any], q: Dict[str, Any], subject_map: Dict[str, int],
+                                 user_id: Optional[int], report: ImportErrorReport) -> bool:
+        """导入题目包中的单道题（失败记入报告，不中断整个块）"""
+        try:
+            # 1. 处理科目
+            subject_name = q.get('subject_name')
+            if not subject_name:
+                report.add(None, 'missing_subject', f"题目ID {q.get('id')} 缺少科目名称，已跳过。", 'subject_name')
+                return False
+
+            if subject_name not in subject_map:
+                cursor = conn.execute('INSERT INTO subjects (name) VALUES (?)', (subject_name,))
+                subject_map[subject_name] = cursor.lastrowid
+            subject_id = subject_map[subject_name]
+
+            # 2. 处理图片（内容寻址：重复导入同一题库不会重复落盘）
+            new_image_path = None
+            arcname = _package_image_arcname(q)
+            if arcname:
+                new_image_path = QuestionImportService._import_package_image(conn, ctx, arcname)
+
+            # 3. 插入题目数据 (忽略原始ID)
+            conn.execute('''
+                INSERT INTO questions (subject_id, q_type, content, options, answer, explanation, difficulty, tags, image_path, created_by, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                subject_id,
+                q.get('q_type'),
+                q.get('content'),
+                q.get('options'),
+                q.get('answer'),
+                q.get('explanation'),
+                q.get('difficulty'),
+                q.get('tags'),
+                new_image_path,
+                user_id or q.get('created_by'),
+                q.get('created_at'),
+                q.get('updated_at')
+            ))
+            return True
+        except Exception as e:
+            report.add(None, 'insert_failed', f"导入题目ID {q.get('id', 'N/A')} 时出错: {str(e)}")
+            return False
+
+    @staticmethod
+    def _import_package_image(conn, ctx: Dict[str, Any], arcname: str) -> Optional[str]:
+        """登记题目包中的图片，返回 blob 相对路径（图片在 zip 中不存在时返回 None）"""
+        imported_images: Dict[str, str] = ctx['imported_images']
+        if arcname in imported_images:
+            blob_store.incref(conn, imported_images[arcname])
+            return imported_images[arcname]
+
+        upload_root = ctx['upload_root']
+        ext = os.path.splitext(arcname)[1]
+        manifest: Dict[str, Dict[str, Any]] = ctx['manifest']
+        blob = None
+        entry = manifest.get(arcname)
+        if entry:
+            # 续导：上次已落盘，直接登记引用
+            blob = blob_store.ref_existing(conn, upload_root, entry['sha256'], ext, entry['size'])
+        if blob is None:
+            if arcname not in ctx['zip_names']:
+                return None
+            blob = blob_store.commit_staged(conn, upload_root, ctx['images'].take(arcname), ext)
+            manifest[arcname] = {'sha256': blob['sha256'], 'size': blob['size']}
+
+        imported_images[arcname] = blob['path']
+        return blob['path']
+
+
+def _package_image_arcname(q: Dict[str, Any]) -> Optional[str]:
+    """题目的 image_path -> 题目包中的成员名（images/...）"""
+    image_path = q.get('image_path')
+    if not image_path:
+        return None
+    return 'images/' + str(image_path).replace('\\', '/')
+
+
+def _load_manifest(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """读取图片清单（{成员名: {'sha256', 'size'}}）；不存在或损坏时视为空"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path: Optional[str], manifest: Dict[str, Dict[str, Any]]) -> None:
+    """原子写入图片清单（先写临时文件再改名）"""
+    if not path or not manifest:
+        return
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def _remove_manifest(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _ImagePrefetcher:
+    """
+    图片预取：线程池按使用顺序解压题目包中的图片（流式写临时文件并计算哈希）
+
+    最多同时有 window 个图片处于解压中/待取用，临时文件占用有上限。
+    ZipFile 成员的打开/关闭会修改共享的文件引用计数，需在锁内进行；读取本身由 zipfile 加锁。
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, upload_root: str, arcnames: List[str],
+                 workers: int = IMAGE_WORKERS, window: int = IMAGE_PREFETCH_WINDOW):
+        self._zf = zf
+        self._upload_root = upload_root
+        self._pending = collections.deque(arcnames)
+        self._futures: Dict[str, Future] = {}
+        self._taken: set = set()
+        self._window = max(window, 1)
+        self._zip_lock = threading.Lock()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='package-image')
+            if arcnames else None
+        )
+        self._fill()
+
+    def _extract(self, arcname: str) -> Dict[str, Any]:
+        with self._zip_lock:
+            source = self._zf.open(arcname)
+        try:
+            return blob_store.stage_stream(self._upload_root, source)
+        finally:
+            with self._zip_lock:
+                source.close()
+
+    def _fill(self) -> None:
+        while self._pending and len(self._futures) < self._window:
+            arcname = self._pending.popleft()
+            if arcname not in self._futures and arcname not in self._taken:
+                self._futures[arcname] = self._executor.submit(self._extract, arcname)
+
+    def take(self, arcname: str) -> Dict[str, Any]:
+        """取出已解压的图片（尚未预取的同步解压）；返回值交给 blob_store.commit_staged"""
+        self._taken.add(arcname)
+        future = self._futures.pop(arcname, None)
+        try:
+            return future.result() if future is not None else self._extract(arcname)
+        finally:
+            if self._executor is not None:
+                self._fill()
+
+    def close(self) -> None:
+        """停止预取并清理未取用的临时文件"""
+        if self._executor is None:
+            return
+        self._pending.clear()
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        for future in self._futures.values():
+            if not future.cancelled() and future.exception() is None:
+                blob_store.discard_staged(future.result())
+        self._futures.clear()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+题库导入/导出后台作业
+在 app.core.jobs 的工作线程中执行，进度与断点写入 jobs 表
+"""
+import os
+from typing import Any, Dict
+from flask import current_app
+from app.core.jobs import JobCancelled, JobContext, JobManager
+from app.modules.admin.services.question_export_service import QuestionExportService
+from app.modules.admin.services.question_import_service import QuestionImportService
+
+JOB_IMPORT_EXCEL = 'question_import_excel'
+JOB_IMPORT_PACKAGE = 'question_import_package'
+JOB_EXPORT_EXCEL = 'question_export_excel'
+JOB_EXPORT_PACKAGE = 'question_export_package'
+
+
+class QuestionJobService:
+    """题库导入/导出作业处理函数"""
+
+    @staticmethod
+    def register(manager: JobManager) -> None:
+        """注册全部题库作业类型"""
+        manager.register(JOB_IMPORT_EXCEL, QuestionJobService.run_import_excel)
+        manager.register(JOB_IMPORT_PACKAGE, QuestionJobService.run_import_package)
+        manager.register(JOB_EXPORT_EXCEL, QuestionJobService.run_export_excel)
+        manager.register(JOB_EXPORT_PACKAGE, QuestionJobService.run_export_package)
+
+    @staticmethod
+    def _import_progress(ctx: JobContext):
+        """
+        导入进度回调：与块数据同一事务写入断点
+
+        重试时在上次已记录的计数基础上累加
+        """
+        job = ctx.job
+        base_processed = job.get('processed') or 0
+        base_success = job.get('success_count') or 0
+        base_error_count = job.get('error_count') or 0
+        base_errors = JobManager.to_dict(job)['errors']
+
+        def progress(stats: Dict[str, Any]) -> None:
+            report = stats['error_report']
+            ctx.report(
+                processed=base_processed + stats['processed_rows'],
+                success_count=base_success + stats['imported_count'],
+                error_count=base_error_count + report.total,
+                errors=base_errors + report.messages(),
+                total=stats.get('total'),
+                checkpoint=stats['last_row'],
+                commit=False
+            )
+
+        return progress, base_success
+
+    @staticmethod
+    def _import_result(result: Dict[str, Any], base_success: int) -> Dict[str, Any]:
+        if result['stopped']:
+            raise JobCancelled()
+        report = result['error_report']
+        imported_count = base_success + result['imported_count']
+        message = f'成功导入 {imported_count} 道题。'
+        if report.total:
+            message += f' 遇到 {report.total} 个问题。'
+        return {
+            'imported_count': imported_count,
+            'error_report': report.to_dict(),
+            'message': message,
+        }
+
+    @staticmethod
+    def run_import_excel(ctx: JobContext) -> Dict[str, Any]:
+        """Excel 导入作业（断点为已提交的最后一个 Excel 行号）"""
+        if not ctx.checkpoint:
+            # 维度信息（dimension）即可估算总行数，不需要遍历工作表
+            ctx.report(total=QuestionImportService.estimate_rows(ctx.file_path))
+        progress, base_success = QuestionJobService._import_progress(ctx)
+        result = QuestionImportService.import_excel(
+            ctx.conn, ctx.file_path, ctx.job.get('created_by'),
+            progress=progress,
+            should_stop=ctx.should_stop,
+            resume_after_row=ctx.checkpoint
+        )
+        return QuestionJobService._import_result(result, base_success)
+
+    @staticmethod
+    def run_import_package(ctx: JobContext) -> Dict[str, Any]:
+        """题目包导入作业（断点为 data.json 中已提交的题目数；图片清单与上传文件放在一起，续导时复用）"""
+        progress, base_success = QuestionJobService._import_progress(ctx)
+        result = QuestionImportService.import_package(
+            ctx.conn, ctx.file_path, current_app.config['UPLOAD_FOLDER'], ctx.job.get('created_by'),
+            progress=progress,
+            should_stop=ctx.should_stop,
+            resume_after=ctx.checkpoint,
+            manifest_path=ctx.sidecar_path('manifest.json')
+        )
+        return QuestionJobService._import_result(result, base_success)
+
+    @staticmethod
+    def _run_export(ctx: JobContext, ext: str, writer) -> Dict[str, Any]:
+        """导出作业公共流程：写入临时文件，完成后原子改名为结果文件"""
+        subject_id = ctx.params.get('subject_id')
+        q_type = ctx.params.get('type')
+        path = ctx.result_path(ext)
+        tmp_path = f'{os.path.splitext(path)[0]}.part.{ext}'
+
+        def progress(processed: int) -> None:
+            ctx.report(processed=processed, success_count=processed)
+            ctx.check_cancelled()
+
+        try:
+            count = writer(subject_id, q_type, tmp_path, progress)
+            if not count:
+                raise ValueError('没有可导出的题目')
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        ctx.report(total=count, processed=count, success_count=count)
+        return {
+            'exported_count': count,
+            'download_name': QuestionExportService.export_filename(ctx.conn, subject_id, ext),
+            'result_path': path,
+            'message': f'成功导出 {count} 道题。',
+        }
+
+    @staticmethod
+    def run_export_excel(ctx: JobContext) -> Dict[str, Any]:
+        """Excel 导出作业"""
+        return QuestionJobService._run_export(
+            ctx, 'xlsx',
+            lambda subject_id, q_type, dest, progress: QuestionExportService.write_excel(
+                ctx.conn, subject_id, q_type, dest, progress=progress)
+        )
+
+    @staticmethod
+    def run_export_package(ctx: JobContext) -> Dict[str, Any]:
+        """题目包导出作业"""
+        upload_root = current_app.config['UPLOAD_FOLDER']
+        return QuestionJobService._run_export(
+            ctx, 'zip',
+            lambda subject_id, q_type, dest, progress: QuestionExportService.write_package(
+                ctx.conn, subject_id, q_type, upload_root, dest, progress=progress)
+        )
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+管理后台题目列表服务
+
+- 键集分页：游标为 (排序键, id)，深翻页不需要 OFFSET 扫描
+- 列投影：默认只返回题干前缀（content_preview），完整题干/图片需通过 fields 显式请求
+- 科目/题型/难度/标签筛选与排序均有对应索引；总数优先取自 question_counts 计数表
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.utils.pagination import encode_cursor, decode_cursor
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+CONTENT_PREVIEW_LENGTH = 120
+
+# 排序键 -> SQL 表达式（与 idx_questions_subject_difficulty / idx_questions_subject_updated 的表达式一致）
+SORT_EXPRESSIONS = {
+    'id': 'q.id',
+    'difficulty': 'IFNULL(q.difficulty, 1)',
+    'updated_at': "IFNULL(q.updated_at, '')",
+}
+
+# 可选列（fields 参数）
+OPTIONAL_FIELDS = {
+    'content': 'q.content',
+    # 旧数据为单个路径字符串，统一为 JSON 数组文本（在 SQL 中完成，不逐行在 Python 中转换）
+    'image_path': """
+        CASE
+            WHEN q.image_path IS NULL OR q.image_path = '' THEN '[]'
+            WHEN LTRIM(q.image_path) LIKE '[%' THEN q.image_path
+            ELSE json_array(q.image_path)
+        END
+    """,
+}
+
+
+class QuestionListService:
+    """管理后台题目列表"""
+
+    @staticmethod
+    def _build_filters(subject_id: Optional[int], q_type: Optional[str], difficulty: Optional[int],
+                       tag: Optional[str], keyword: Optional[str]) -> Tuple[List[str], List[Any]]:
+        where: List[str] = []
+        params: List[Any] = []
+        if subject_id:
+            where.append('q.subject_id = ?')
+            params.append(subject_id)
+        if q_type and q_type != 'all':
+            where.append('q.q_type = ?')
+            params.append(q_type)
+        if difficulty:
+            where.append(f"{SORT_EXPRESSIONS['difficulty']} = ?")
+            params.append(difficulty)
+        if tag:
+            where.append('q.id IN (SELECT question_id FROM question_tags WHERE tag = ?)')
+            params.append(tag)
+        if keyword:
+            where.append("q.content LIKE ? ESCAPE '\\'")
+            escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}%')
+        return where, params
+
+    @staticmethod
+    def type_counts(conn, subject_id: Optional[int]) -> Dict[str, int]:
+        """各题型题目数（取自 question_counts）"""
+        if subject_id:
+            rows = conn.execute(
+                'SELECT q_type, n FROM question_counts WHERE subject_id = ? AND n > 0', (subject_id,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT q_type, SUM(n) FROM question_counts GROUP BY q_type HAVING SUM(n) > 0'
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def count(conn, subject_id: Optional[int] = None, q_type: Optional[str] = None,
+              difficulty: Optional[int] = None, tag: Optional[str] = None,
+              keyword: Optional[str] = None) -> int:
+        """
+        符合筛选条件的题目总数
+
+        只按科目/题型筛选时汇总 question_counts 中的少量行；
+        带难度/标签/关键字时按索引计数
+        """
+        if not (difficulty or tag or keyword):
+            counts = QuestionListService.type_counts(conn, subject_id)
+            if q_type and q_type != 'all':
+                return counts.get(q_type, 0)
+            return sum(counts.values())
+
+        where, params = QuestionListService._build_filters(subject_id, q_type, difficulty, tag, keyword)
+        sql = 'SELECT COUNT(*) FROM questions q WHERE ' + ' AND '.join(where)
+        return conn.execute(sql, params).fetchone()[0]
+
+    @staticmethod
+    def list_page(conn, subject_id: Optional[int] = None, q_type: Optional[str] = None,
+                  difficulty: Optional[int] = None, tag: Optional[str] = None,
+                  keyword: Optional[str] = None, sort: str = 'id', order: str = 'desc',
+                  cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                  fields: Sequence[str] = (), with_total: bool = True) -> Dict[str, Any]:
+        """
+        键集分页查询题目列表
+
+        Args:
+            conn: 数据库连接
+            subject_id / q_type / difficulty / tag / keyword: 筛选条件（keyword 匹配题干）
+            sort: 排序键（id / difficulty / updated_at）
+            order: asc / desc
+            cursor: 上一页返回的 next_cursor
+            limit: 每页条数（1 ~ MAX_PAGE_SIZE）
+            fields: 额外返回的列（content / image_path）
+            with_total: 是否返回总数
+
+        Returns:
+            {'items', 'next_cursor', 'has_more', 'total'（可选）}
+
+        Raises:
+            ValueError: 排序参数或游标不合法
+        """
+        if sort not in SORT_EXPRESSIONS:
+            raise ValueError(f'不支持的排序字段: {sort}')
+        order = (order or 'desc').lower()
+        if order not in ('asc', 'desc'):
+            raise ValueError(f'不支持的排序方向: {order}')
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        sort_expr = SORT_EXPRESSIONS[sort]
+
+        where, params = QuestionListService._build_filters(subject_id, q_type, difficulty, tag, keyword)
+        after = decode_cursor(cursor)
+        if after is not None:
+            comparator = '<' if order == 'desc' else '>'
+            if sort == 'id':
+                where.append(f'q.id {comparator} ?')
+                params.append(after[1])
+            else:
+                # 冗余的单列范围条件让索引直接定位到游标处（行值比较本身不能作为索引范围）
+                where.append(f'{sort_expr} {comparator}= ?')
+                where.append(f'({sort_expr}, q.id) {comparator} (?, ?)')
+                params.extend([after[0], after[0], after[1]])
+
+        columns = [
+            'q.id', 'q.subject_id', 'q.q_type', 'q.difficulty', 'q.tags',
+            'u.username AS created_by', 'q.updated_at',
+            f'SUBSTR(q.content, 1, {CONTENT_PREVIEW_LENGTH}) AS content_preview',
+            "(q.image_path IS NOT NULL AND q.image_path NOT IN ('', '[]')) AS has_image",
+            f'{sort_expr} AS _sort_value',
+        ]
+        for field in fields:
+            if field in OPTIONAL_FIELDS:
+                columns.append(f'{OPTIONAL_FIELDS[field]} AS {field}')
+
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        order_by = f'q.id {direction}' if sort == 'id' else f'{sort_expr} {direction}, q.id {direction}'
+        sql = f'''
+            SELECT {', '.join(columns)}
+            FROM questions q
+            LEFT JOIN users u ON q.created_by = u.id
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY {order_by}
+            LIMIT ?
+        '''
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+
+        has_more = len(rows) > limit
+        items = []
+        for row in rows[:limit]:
+            item = dict(row)
+            item.pop('_sort_value', None)
+            item['has_image'] = bool(item['has_image'])
+            items.append(item)
+
+        next_cursor = None
+        if has_more:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last['_sort_value'], last['id'])
+
+        result: Dict[str, Any] = {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
+        if with_total:
+            result['total'] = QuestionListService.count(conn, subject_id, q_type, difficulty, tag, keyword)
+        return result
+
+    @staticmethod
+    def list_all(conn, subject_id: Optional[str], q_type: Optional[str]) -> List[Dict[str, Any]]:
+        """旧版接口：一次返回全部题目（不带分页参数时保持原有的数组格式）"""
+        sql = f'''
+            SELECT q.id, q.subject_id, q.q_type, q.content, q.difficulty, q.tags,
+                   {OPTIONAL_FIELDS['image_path']} AS image_path,
+                   u.username as created_by, q.updated_at
+            FROM questions q
+            LEFT JOIN users u ON q.created_by = u.id
+            WHERE 1=1
+        '''
+        params: List[Any] = []
+        if subject_id:
+            sql += ' AND q.subject_id = ?'
+            params.append(subject_id)
+        if q_type and q_type != 'all':
+            sql += ' AND q.q_type = ?'
+            params.append(q_type)
+        sql += ' ORDER BY q.id DESC'
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
@@ -4,6 +4,7 @@
 """
 from typing import Dict, Any, List, Optional
 from app.core.utils.database import get_db
+from app.modules.admin.services.bulk_operation_service import BulkOperationService, normalize_ids
 from app.core.utils.subject_permissions import (
     get_user_quiz_count,
     get_quiz_limit_count,
@@ -76,7 +77,7 @@ class QuizStatsService:
     @staticmethod
     def batch_reset_quiz_count(user_ids: List[int]) -> Dict[str, Any]:
         """
-        批量重置用户刷题数
+        批量重置用户刷题数（分块 UPSERT，单事务；不存在的用户不计入成功数）
         
         Args:
             user_ids: 用户ID列表
@@ -84,14 +85,8 @@ class QuizStatsService:
         Returns:
             操作结果字典
         """
-        success_count = 0
-        
-        for user_id in user_ids:
-            try:
-                QuizStatsService.reset_user_quiz_count(user_id)
-                success_count += 1
-            except Exception:
-                continue
+        ids = normalize_ids(user_ids)
+        success_count = BulkOperationService.reset_quiz_counts(get_db(), ids)
         
         return {
             'success_count': success_count,
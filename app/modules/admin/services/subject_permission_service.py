@@ -34,9 +34,9 @@ class SubjectPermissionService:
         
         # 获取所有科目及其题目数量
         all_subjects = conn.execute('''
-            SELECT s.id, s.name, COUNT(q.id) as question_count
+            SELECT s.id, s.name, IFNULL(SUM(c.n), 0) as question_count
             FROM subjects s
-            LEFT JOIN questions q ON s.id = q.subject_id
+            LEFT JOIN question_counts c ON s.id = c.subject_id
             GROUP BY s.id, s.name
             ORDER BY s.id
         ''').fetchall()
@@ -317,10 +317,10 @@ class SubjectPermissionService:
         
         # 获取科目列表（带限制用户统计）
         subjects = conn.execute('''
-            SELECT s.id, s.name, COUNT(q.id) as question_count,
+            SELECT s.id, s.name,
+                   (SELECT IFNULL(SUM(c.n), 0) FROM question_counts c WHERE c.subject_id = s.id) as question_count,
                    COUNT(DISTINCT us.user_id) as restricted_users_count
             FROM subjects s
-            LEFT JOIN questions q ON s.id = q.subject_id
             LEFT JOIN user_subjects us ON s.id = us.subject_id
             GROUP BY s.id, s.name
             ORDER BY s.id
@@ -4,6 +4,7 @@
 """
 from typing import Dict, Any, List, Optional
 from app.core.utils.database import get_db
+from app.core.utils.subject_permissions import invalidate_quiz_limit_config
 
 
 class SystemConfigService:
@@ -96,6 +97,7 @@ class SystemConfigService:
             )
         
         conn.commit()
+        invalidate_quiz_limit_config()
         
         return SystemConfigService.get_config(config_key)
     
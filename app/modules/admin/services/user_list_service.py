@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+管理后台用户列表服务
+
+- 搜索：关键词 >= 3 个字符走 user_admin_search_fts（trigram，匹配用户名/邮箱任意子串）；
+  更短的关键词或 FTS 不可用时用 LIKE 做同样的子串匹配
+- 分页：page/size 的 OFFSET 分页保留给浅页与跳页；带 cursor 时按 (排序键, id) 键集分页
+- 受限科目数只对当前页的用户做一次 GROUP BY 聚合，不再逐行执行相关子查询
+- 全局统计只扫描部分索引，不再把全部用户读到 Python 中计数
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.utils.pagination import encode_cursor, decode_cursor
+
+# trigram 分词要求关键词至少 3 个字符才能走索引
+MIN_TRIGRAM_LEN = 3
+# 5 分钟内有活动视为在线
+ONLINE_WINDOW = timedelta(minutes=5)
+# 命中数超过 每页条数 × 该值 时，按排序索引扫描代替“取出全部命中行再排序”
+DENSE_MATCH_RATIO = 50
+
+# 排序键 -> SQL 表达式（created_at 与 idx_users_created_at 的表达式一致；username 走 UNIQUE 索引）
+SORT_EXPRESSIONS = {
+    'created_at': "IFNULL(u.created_at, '')",
+    'username': 'u.username',
+    'id': 'u.id',
+}
+
+
+class UserListService:
+    """管理后台用户列表"""
+
+    # 进程内缓存：FTS 表是否存在（init_db 启动时创建，运行期不会变化）
+    _fts_available: Optional[bool] = None
+
+    @staticmethod
+    def fts_available(conn) -> bool:
+        """检查用户名/邮箱搜索索引是否可用"""
+        if UserListService._fts_available is None:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name = 'user_admin_search_fts'"
+            ).fetchone()
+            UserListService._fts_available = row is not None
+        return UserListService._fts_available
+
+    @staticmethod
+    def _search_filter(conn, search: str, dense: bool = False) -> Tuple[Optional[str], List[Any]]:
+        """
+        关键词 -> (WHERE 条件, 参数)
+
+        dense=True 时用一元 + 屏蔽条件上的索引：命中的用户很多时，沿排序索引扫描并逐行判断是否命中，
+        凑满一页即可停止，比先取出全部命中行再排序快得多
+        """
+        if not search:
+            return None, []
+        plus = '+' if dense else ''
+        if len(search) >= MIN_TRIGRAM_LEN and UserListService.fts_available(conn):
+            match = '"' + search.replace('"', '""') + '"'
+            return (f'{plus}u.id IN (SELECT rowid FROM user_admin_search_fts WHERE user_admin_search_fts MATCH ?)',
+                    [match])
+        # 短关键词（trigram 无法命中索引）与 FTS 不可用时：LIKE 子串匹配，语义与原来的 '%kw%' 一致。
+        # 短关键词命中的用户通常很多，列表走 dense 路径沿排序索引扫描，凑满一页即停止
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f'%{escaped}%'
+        return "(u.username LIKE ? ESCAPE '\\' OR u.email LIKE ? ESCAPE '\\')", [pattern, pattern]
+
+    @staticmethod
+    def _count(conn, search: str) -> int:
+        """符合关键词的用户数（trigram 搜索直接在 FTS 表上计数，不回表）"""
+        if not search:
+            return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        if len(search) >= MIN_TRIGRAM_LEN and UserListService.fts_available(conn):
+            match = '"' + search.replace('"', '""') + '"'
+            return conn.execute(
+                'SELECT COUNT(*) FROM user_admin_search_fts WHERE user_admin_search_fts MATCH ?', (match,)
+            ).fetchone()[0]
+        search_sql, params = UserListService._search_filter(conn, search)
+        return conn.execute(f'SELECT COUNT(*) FROM users u WHERE {search_sql}', params).fetchone()[0]
+
+    @staticmethod
+    def _restricted_counts(conn, user_ids: List[int]) -> Dict[int, int]:
+        """当前页用户的受限科目数（一次分组聚合，走 user_subjects 的 (user_id, subject_id) 唯一索引）"""
+        if not user_ids:
+            return {}
+        placeholders = ','.join('?' * len(user_ids))
+        rows = conn.execute(
+            f'SELECT user_id, COUNT(*) FROM user_subjects WHERE user_id IN ({placeholders}) GROUP BY user_id',
+            user_ids
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def stats(conn) -> Dict[str, int]:
+        """
+        全局用户统计（不受分页和搜索影响）
+
+        角色/锁定数只扫描对应的部分索引，在线数走 idx_users_last_active 范围扫描
+        """
+        row = conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM users WHERE is_admin = 1),
+                (SELECT COUNT(*) FROM users WHERE is_subject_admin = 1 AND NOT IFNULL(is_admin, 0)),
+                (SELECT COUNT(*) FROM users WHERE is_locked = 1)
+        ''').fetchone()
+        # last_active 由 CURRENT_TIMESTAMP 写入（UTC，"YYYY-MM-DD HH:MM:SS"），可直接按字符串比较
+        threshold = (datetime.utcnow() - ONLINE_WINDOW).strftime('%Y-%m-%d %H:%M:%S')
+        online = conn.execute('SELECT COUNT(*) FROM users WHERE last_active >= ?', (threshold,)).fetchone()[0]
+        return {'online': online, 'admin': row[0], 'subject_admin': row[1], 'locked': row[2]}
+
+    @staticmethod
+    def list_page(conn, search: str = '', sort: str = 'created_at', order: str = 'desc',
+                  page: int = 1, size: int = 10, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        分页查询用户列表
+
+        Args:
+            conn: 数据库连接
+            search: 用户名/邮箱关键词
+            sort: 排序键（created_at / username / id）
+            order: asc / desc
+            page: 页码（未提供 cursor 时按 OFFSET 分页）
+            size: 每页条数
+            cursor: 上一页返回的 next_cursor（提供时忽略 page）
+
+        Returns:
+            {'data', 'total', 'next_cursor', 'has_more'}
+
+        Raises:
+            ValueError: 游标不合法
+        """
+        sort_expr = SORT_EXPRESSIONS.get(sort, SORT_EXPRESSIONS['created_at'])
+        order = 'asc' if order == 'asc' else 'desc'
+
+        total = UserListService._count(conn, search)
+
+        where: List[str] = []
+        params: List[Any] = []
+        # 命中比例高时改为沿排序索引扫描（见 _search_filter）
+        dense = total > DENSE_MATCH_RATIO * size
+        search_sql, search_params = UserListService._search_filter(conn, search, dense=dense)
+        if search_sql:
+            where.append(search_sql)
+            params.extend(search_params)
+
+        after = decode_cursor(cursor)
+        offset = 0
+        if after is not None:
+            comparator = '<' if order == 'desc' else '>'
+            if sort_expr == 'u.id':
+                where.append(f'u.id {comparator} ?')
+                params.append(after[1])
+            else:
+                # 冗余的单列范围条件让索引直接定位到游标处（行值比较本身不能作为索引范围）
+                where.append(f'{sort_expr} {comparator}= ?')
+                where.append(f'({sort_expr}, u.id) {comparator} (?, ?)')
+                params.extend([after[0], after[0], after[1]])
+        else:
+            offset = (max(page, 1) - 1) * size
+
+        direction = order.upper()
+        # 命中比例低时一元 + 屏蔽排序索引：先按搜索条件取出命中行再排序，
+        # 避免 SQLite 为省去排序而沿排序索引逐行回表判断 LIKE（命中很少时近乎全表随机读）
+        plus = '+' if search_sql and not dense else ''
+        order_by = (f'{plus}u.id {direction}' if sort_expr == 'u.id'
+                    else f'{plus}{sort_expr} {direction}, u.id {direction}')
+        rows = conn.execute(f'''
+            SELECT u.id, u.username, u.is_admin, u.is_subject_admin, u.is_locked, u.created_at, u.last_active,
+                   {sort_expr} AS _sort_value
+            FROM users u
+            {('WHERE ' + ' AND '.join(where)) if where else ''}
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+        ''', params + [size + 1, offset]).fetchall()
+
+        has_more = len(rows) > size
+        rows = rows[:size]
+        restricted = UserListService._restricted_counts(conn, [r['id'] for r in rows])
+        online_after = (datetime.utcnow() - ONLINE_WINDOW).strftime('%Y-%m-%d %H:%M:%S')
+
+        data = []
+        for r in rows:
+            last_active = r['last_active']
+            data.append({
+                'id': r['id'],
+                'username': r['username'],
+                'is_admin': bool(r['is_admin']),
+                'is_subject_admin': bool(r['is_subject_admin']),
+                'is_locked': bool(r['is_locked']),
+                'created_at': r['created_at'] or '',
+                'is_online': bool(last_active) and last_active.replace('T', ' ') >= online_after,
+                'last_active': last_active,
+                'restricted_subjects_count': restricted.get(r['id'], 0),
+            })
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(last['_sort_value'], last['id'])
+        return {'data': data, 'total': total, 'next_cursor': next_cursor, 'has_more': has_more}
@@ -13,8 +13,11 @@
 from flask import Blueprint, request, jsonify, session, current_app
 from werkzeug.utils import secure_filename
 from app.core.utils.database import get_db
-from app.core.utils.options_parser import parse_options
+from app.core.utils import blob_store
+from app.core.utils import question_payload
 from app.core.extensions import limiter
+from app.modules.chat.services.retention_service import ChatRetentionService
+from app.modules.chat.services.user_search_service import UserSearchService
 import os
 import uuid
 import json
@@ -115,27 +118,8 @@ def chat_users():
     q = (request.args.get('q') or '').strip()
 
     conn = get_db()
-    params = [uid]
-    sql = """
-        SELECT id, username, avatar, last_active
-        FROM users
-        WHERE id != ?
-    """
-    if q:
-        sql += " AND username LIKE ?"
-        params.append(f"%{q}%")
-
-    # 排序优化：精确命中优先，其次前缀命中；再按活跃度与用户名
-    # 说明：即使前端不做精确匹配，这里也尽量把最可能目标排在前面
-    if q:
-        sql += " ORDER BY (LOWER(username) = LOWER(?)) DESC, (LOWER(username) LIKE LOWER(?) ) DESC, (last_active IS NULL) ASC, last_active DESC, username ASC LIMIT 50"
-        params.append(q)
-        params.append(f"{q}%")
-    else:
-        sql += " ORDER BY (last_active IS NULL) ASC, last_active DESC, username ASC LIMIT 50"
-
-    rows = conn.execute(sql, params).fetchall()
-    return jsonify({'status': 'success', 'data': [dict(r) for r in rows]})
+    data = UserSearchService.search_users(conn, q, exclude_user_id=uid, limit=50)
+    return jsonify({'status': 'success', 'data': data})
 
 
 @chat_api_bp.route('/chat/conversations')
@@ -226,46 +210,7 @@ def chat_conversation_users():
     q = (request.args.get('q') or '').strip()
     conn = get_db()
 
-    # 查询已有direct会话的对方用户
-    sql = """
-        SELECT DISTINCT
-               pu.id,
-               pu.username,
-               pu.avatar,
-               ur.remark,
-               c.updated_at
-        FROM chat_conversations c
-        JOIN chat_members mb ON mb.conversation_id = c.id AND mb.user_id = ?
-        -- 取对方成员（direct会话：除自己外的那个人）
-        JOIN chat_members pmb ON pmb.conversation_id = c.id AND pmb.user_id != ?
-        JOIN users pu ON pu.id = pmb.user_id
-        -- 取当前用户对对方的备注
-        LEFT JOIN user_remarks ur ON ur.owner_user_id = ? AND ur.target_user_id = pu.id
-        WHERE c.c_type = 'direct'
-    """
-    params = [uid, uid, uid]
-
-    # 如果有关键词，搜索用户名或备注
-    if q:
-        sql += " AND (pu.username LIKE ? OR ur.remark LIKE ?)"
-        params.extend([f"%{q}%", f"%{q}%"])
-
-    # 按最后更新时间排序，最近聊天的用户排在前面
-    sql += " ORDER BY c.updated_at DESC, pu.username ASC LIMIT 50"
-
-    rows = conn.execute(sql, params).fetchall()
-    
-    # 转换为前端需要的格式
-    data = []
-    for r in rows:
-        user_data = {
-            'id': r['id'],
-            'username': r['username'],
-            'avatar': r['avatar'],
-            'remark': r['remark']  # 备注信息
-        }
-        data.append(user_data)
-
+    data = UserSearchService.search_conversation_users(conn, uid, q, limit=50)
     return jsonify({'status': 'success', 'data': data})
 
 
@@ -451,10 +396,89 @@ def chat_user_profile():
     return jsonify({'status': 'success', 'user': dict(u), 'remark': remark})
 
 
+def _question_payload(payload, subject_name):
+    """题目载荷 -> 聊天题目卡片结构（send_question / 题目详情 / 消息分页共用）"""
+    return {
+        'id': payload['id'],
+        'content': payload['content'],
+        'type': payload['q_type'],
+        'subject': subject_name or '',
+        'options': payload['options'],
+        'answer': payload['answer'],
+        'explanation': payload['explanation'],
+        'image_path': payload['image_path'],
+        'has_full_data': True,
+    }
+
+
+def _load_question_cards(conn, question_ids):
+    """按题目ID批量生成题目卡片 {question_id: 题目卡片}（内容取自题目载荷缓存）"""
+    qids = sorted(set(question_ids))
+    if not qids:
+        return {}
+    placeholders = ','.join('?' * len(qids))
+    subject_names = {
+        row['id']: row['subject_name']
+        for row in conn.execute(
+            'SELECT q.id, s.name as subject_name '
+            f'FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id WHERE q.id IN ({placeholders})',
+            qids
+        ).fetchall()
+    }
+    payloads = question_payload.get_payloads(conn, list(subject_names))
+    return {
+        qid: _question_payload(payloads[qid], subject_name)
+        for qid, subject_name in subject_names.items() if qid in payloads
+    }
+
+
+def _load_page_side_tables(conn, rows):
+    """为一页消息批量加载发送者资料与引用题目（各一条查询）
+
+    Returns:
+        (users, questions)
+        - users: {user_id: {username, avatar}}
+        - questions: {question_id: 题目卡片}，仅补全旧结构（不含完整数据）的题目消息
+    """
+    sender_ids = sorted({r['sender_id'] for r in rows if r['sender_id']})
+    users = {}
+    if sender_ids:
+        placeholders = ','.join('?' * len(sender_ids))
+        for u in conn.execute(
+            f"SELECT id, username, avatar FROM users WHERE id IN ({placeholders})",
+            sender_ids
+        ).fetchall():
+            users[u['id']] = {'username': u['username'], 'avatar': u['avatar']}
+
+    question_ids = set()
+    for r in rows:
+        if r['content_type'] != 'question':
+            continue
+        try:
+            obj = json.loads(r['content'] or '')
+        except Exception:
+            continue
+        if isinstance(obj, dict) and obj.get('id') and not obj.get('has_full_data'):
+            try:
+                question_ids.add(int(obj.get('id')))
+            except Exception:
+                pass
+
+    return users, _load_question_cards(conn, question_ids)
+
+
 @chat_api_bp.route('/chat/messages')
 @limiter.exempt
 def chat_messages():
-    """拉取会话消息（增量）并推进已读。
+    """拉取会话消息并推进已读。
+
+    两种游标模式（均走 (conversation_id, id DESC) 索引）：
+    - after_id（默认）：增量拉取 id > after_id 的新消息，升序返回（轮询用）
+    - before_id：向前翻页，取 id < before_id 的最近 limit 条，仍按升序返回；
+      before_id=0 表示从最新一条开始（打开会话时只拉一页）。热表不足一页时从聊天归档库
+      （ChatRetentionService.read_archived）继续读取更早的已归档消息
+
+    compact=1 时消息行不再重复携带发送者昵称/头像，统一放在 users 旁表中。
 
     关键点：已读推进应当以“当前会话的最新消息 id”为准，而不是仅推进到本次返回的最后一条。
 
@@ -468,6 +492,9 @@ def chat_messages():
     uid = session.get('user_id')
     conversation_id = int(request.args.get('conversation_id') or 0)
     after_id = int(request.args.get('after_id') or 0)
+    backward = 'before_id' in request.args
+    before_id = int(request.args.get('before_id') or 0)
+    compact = (request.args.get('compact') or '') in ('1', 'true')
     limit = int(request.args.get('limit') or 50)
     limit = max(1, min(limit, 200))
 
@@ -478,38 +505,97 @@ def chat_messages():
     if not _is_member(conn, conversation_id, uid):
         return jsonify({'status': 'forbidden', 'message': '无权访问该会话'}), 403
 
-    rows = conn.execute(
-        """
-        SELECT m.id, m.conversation_id, m.sender_id, u.username as sender_username,
-               u.avatar as sender_avatar, m.content, m.content_type, m.created_at
-        FROM chat_messages m
-        LEFT JOIN users u ON u.id = m.sender_id
-        WHERE m.conversation_id = ?
-          AND m.id > ?
-        ORDER BY m.id ASC
-        LIMIT ?
-        """,
-        (conversation_id, after_id, limit)
-    ).fetchall()
-
-    # 更新已读到当前会话的最新消息ID（无论是否有新消息）
-    # 注意：这里使用 MAX(id) 而不是 rows[-1]['id']，因为可能因为 after_id 过大而返回空列表
-    latest_msg = conn.execute(
-        "SELECT COALESCE(MAX(id), 0) as max_id FROM chat_messages WHERE conversation_id=?",
-        (conversation_id,)
-    ).fetchone()
-    if latest_msg and latest_msg['max_id'] > 0:
-        conn.execute(
+    has_more = False
+    if backward:
+        # 多取一条用于判断是否还有更早的消息
+        if before_id > 0:
+            rows = conn.execute(
+                """
+                SELECT id, conversation_id, sender_id, content, content_type, created_at
+                FROM chat_messages
+                WHERE conversation_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (conversation_id, before_id, limit + 1)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                """
+                SELECT id, conversation_id, sender_id, content, content_type, created_at
+                FROM chat_messages
+                WHERE conversation_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (conversation_id, limit + 1)
+            ).fetchall()
+        # 热表已翻到头：更早的消息可能已被归档
+        if len(rows) <= limit:
+            archived = conn.execute(
+                'SELECT archived_count FROM chat_archive_stats WHERE conversation_id = ?',
+                (conversation_id,)
+            ).fetchone()
+            if archived and archived['archived_count'] > 0:
+                boundary = rows[-1]['id'] if rows else (before_id if before_id > 0 else None)
+                rows = list(rows) + ChatRetentionService.read_archived(
+                    current_app.config.get('CHAT_ARCHIVE_DB_PATH'), conversation_id, boundary,
+                    limit + 1 - len(rows)
+                )
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+    else:
+        rows = conn.execute(
             """
-            UPDATE chat_members 
-            SET last_read_message_id = MAX(COALESCE(last_read_message_id, 0), ?) 
-            WHERE conversation_id = ? AND user_id = ?
+            SELECT id, conversation_id, sender_id, content, content_type, created_at
+            FROM chat_messages
+            WHERE conversation_id = ?
+              AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
             """,
-            (latest_msg['max_id'], conversation_id, uid)
-        )
-        conn.commit()
+            (conversation_id, after_id, limit)
+        ).fetchall()
+
+    users, questions = _load_page_side_tables(conn, rows)
+
+    data = []
+    for r in rows:
+        d = dict(r)
+        if not compact:
+            u = users.get(r['sender_id']) or {}
+            d['sender_username'] = u.get('username')
+            d['sender_avatar'] = u.get('avatar')
+        data.append(d)
 
-    return jsonify({'status': 'success', 'data': [dict(r) for r in rows]})
+    # 更新已读到当前会话的最新消息ID（无论是否有新消息）
+    # 注意：这里使用 MAX(id) 而不是 rows[-1]['id']，因为可能因为 after_id 过大而返回空列表
+    # 向前翻页（before_id>0）只是浏览历史，不需要推进已读
+    if not (backward and before_id > 0):
+        latest_msg = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) as max_id FROM chat_messages WHERE conversation_id=?",
+            (conversation_id,)
+        ).fetchone()
+        if latest_msg and latest_msg['max_id'] > 0:
+            conn.execute(
+                """
+                UPDATE chat_members 
+                SET last_read_message_id = MAX(COALESCE(last_read_message_id, 0), ?) 
+                WHERE conversation_id = ? AND user_id = ?
+                """,
+                (latest_msg['max_id'], conversation_id, uid)
+            )
+            conn.commit()
+
+    payload = {'status': 'success', 'data': data}
+    if questions:
+        payload['questions'] = {str(k): v for k, v in questions.items()}
+    if compact:
+        payload['users'] = {str(k): v for k, v in users.items()}
+    if backward:
+        payload['has_more'] = has_more
+        payload['next_before_id'] = (rows[0]['id'] if rows else 0)
+    return jsonify(payload)
 
 
 @chat_api_bp.route('/chat/messages/send', methods=['POST'])
@@ -614,24 +700,16 @@ def chat_upload_image():
         return jsonify({'status': 'forbidden', 'message': '无权发送到该会话'}), 403
 
     upload_root = current_app.config.get('UPLOAD_FOLDER')
-    chat_dir = os.path.join(upload_root, 'chat')
-    os.makedirs(chat_dir, exist_ok=True)
 
-    # 保存主图
+    # 保存主图（内容寻址：转发/重复发送同一图片只存一份）
     ext = f.filename.rsplit('.', 1)[1].lower()
-    fname = secure_filename(f"chat_{conversation_id}_{uid}_{uuid.uuid4().hex[:10]}.{ext}")
-    abs_path = os.path.join(chat_dir, fname)
-    f.save(abs_path)
-    url = f"/uploads/chat/{fname}"
+    url = blob_store.save_upload(conn, upload_root, f, ext)['url']
 
     # 保存缩略图（可选）
     thumb_url = None
     if thumb_f and thumb_f.filename:
         thumb_ext = thumb_f.filename.rsplit('.', 1)[1].lower()
-        thumb_name = secure_filename(f"chat_{conversation_id}_{uid}_{uuid.uuid4().hex[:10]}_thumb.{thumb_ext}")
-        thumb_abs = os.path.join(chat_dir, thumb_name)
-        thumb_f.save(thumb_abs)
-        thumb_url = f"/uploads/chat/{thumb_name}"
+        thumb_url = blob_store.save_upload(conn, upload_root, thumb_f, thumb_ext)['url']
 
     # content：兼容展示与扩展，image 类型存 JSON
     content_obj = {
@@ -717,20 +795,19 @@ def chat_upload_audio():
     ext = f.filename.rsplit('.', 1)[1].lower()
     base = secure_filename(f"chat_{conversation_id}_{uid}_{uuid.uuid4().hex[:10]}")
 
-    # 1) 先保存原始文件
-    raw_name = f"{base}.{ext}"
-    raw_abs = os.path.join(chat_dir, raw_name)
-    f.save(raw_abs)
-    raw_url = f"/uploads/chat/{raw_name}"
+    # 1) 先保存原始文件（内容寻址存储）
+    raw_blob = blob_store.save_upload(conn, upload_root, f, ext)
+    raw_name = raw_blob['path']
+    raw_abs = os.path.join(upload_root, *raw_name.split('/'))
+    raw_url = raw_blob['url']
 
     # 2) 尝试转码为 m4a（AAC），以获得 iOS/安卓最佳兼容；失败则回退转 mp3
-    m4a_name = f"{base}.m4a"
-    m4a_abs = os.path.join(chat_dir, m4a_name)
-    m4a_url = f"/uploads/chat/{m4a_name}"
+    #    转码产物先写到 chat 目录的临时文件，成功后再纳入 blob 存储
+    m4a_abs = os.path.join(chat_dir, f"{base}.m4a")
+    m4a_url = None
 
-    mp3_name = f"{base}.mp3"
-    mp3_abs = os.path.join(chat_dir, mp3_name)
-    mp3_url = f"/uploads/chat/{mp3_name}"
+    mp3_abs = os.path.join(chat_dir, f"{base}.mp3")
+    mp3_url = None
 
     m4a_ok = False
     mp3_ok = False
@@ -773,6 +850,11 @@ def chat_upload_audio():
             f"audio transcode failed(m4a) fallback(mp3)={'ok' if mp3_ok else 'failed'}: conv={conversation_id} uid={uid} raw={raw_name} err={transcode_err}"
         )
 
+    if m4a_ok:
+        m4a_url = blob_store.save_local_file(conn, upload_root, m4a_abs, 'm4a', move=True)['url']
+    elif mp3_ok:
+        mp3_url = blob_store.save_local_file(conn, upload_root, mp3_abs, 'mp3', move=True)['url']
+
     # content：存 raw + m4a/mp3（如有），前端播放优先：m4a > mp3 > raw
     best_url = m4a_url if m4a_ok else (mp3_url if mp3_ok else raw_url)
     content_obj = {
@@ -837,46 +919,10 @@ def chat_send_question():
         return jsonify({'status': 'forbidden', 'message': '无权发送到该会话'}), 403
 
     # 获取题目信息
-    q = conn.execute(
-        'SELECT q.id, q.content, q.q_type, q.options, q.answer, q.explanation, q.image_path, s.name as subject_name '
-        'FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id WHERE q.id = ?',
-        (question_id,)
-    ).fetchone()
-    if not q:
+    content_obj = _load_question_cards(conn, [question_id]).get(question_id)
+    if not content_obj:
         return jsonify({'status': 'error', 'message': '题目不存在'}), 404
 
-    # 解析 options（统一入口）
-    options_payload = []
-    try:
-        current_app.logger.info(f"[send_question] qid={q['id']} raw_options={q['options']}")
-    except Exception:
-        pass
-
-    try:
-        options_payload = parse_options(q['options'])
-    except Exception as _e:
-        options_payload = []
-        try:
-            current_app.logger.warning(f"[send_question] qid={q['id']} options_parse_failed err={_e}")
-        except Exception:
-            pass
-
-    try:
-        current_app.logger.info(f"[send_question] qid={q['id']} options_payload_len={len(options_payload)} head={options_payload[:2]}")
-    except Exception:
-        pass
-
-    content_obj = {
-        'id': q['id'],
-        'content': q['content'],
-        'type': q['q_type'],
-        'subject': q['subject_name'] or '',
-        'options': options_payload,
-        'answer': (q['answer'] or ''),
-        'explanation': (q['explanation'] or ''),
-        'image_path': (q['image_path'] or ''),
-        'has_full_data': True,
-    }
     content_str = json.dumps(content_obj, ensure_ascii=False)
 
     cur = conn.cursor()
@@ -910,42 +956,13 @@ def chat_get_question_detail(question_id: int):
         return jsonify({'status': 'unauthorized', 'message': '请先登录'}), 401
 
     conn = get_db()
-    q = conn.execute(
-        'SELECT q.id, q.content, q.q_type, q.options, q.answer, q.explanation, q.image_path, s.name as subject_name '
-        'FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id WHERE q.id = ?',
-        (int(question_id),)
-    ).fetchone()
-    if not q:
+    card = _load_question_cards(conn, [int(question_id)]).get(int(question_id))
+    if not card:
         return jsonify({'status': 'error', 'message': '题目不存在'}), 404
 
-    options_payload = []
-    try:
-        options_payload = parse_options(q['options'])
-    except Exception as _e:
-        options_payload = []
-        try:
-            current_app.logger.warning(f"[get_question] qid={q['id']} options_parse_failed err={_e}")
-        except Exception:
-            pass
-
-    try:
-        current_app.logger.info(f"[get_question] qid={q['id']} options_payload_len={len(options_payload)} head={options_payload[:2]}")
-    except Exception:
-        pass
-
     return jsonify({
         'status': 'success',
-        'question': {
-            'id': q['id'],
-            'content': q['content'],
-            'type': q['q_type'],
-            'subject': q['subject_name'] or '',
-            'options': options_payload,
-            'answer': (q['answer'] or ''),
-            'explanation': (q['explanation'] or ''),
-            'image_path': (q['image_path'] or ''),
-            'has_full_data': True,
-        }
+        'question': card
     })
 
 
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+聊天服务层
+"""
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+聊天消息保留/归档服务
+
+说明：
+- 按会话类型（chat_conversations.c_type）配置保留策略（Config.CHAT_RETENTION_POLICIES）
+- 满足条件的旧消息按批从 chat_messages 移入独立归档库（CHAT_ARCHIVE_DB_PATH），可选 gzip 压缩
+- 只归档“所有成员都已读”的消息，且每个会话热表中始终保留最近 keep_recent 条，
+  因此 last_read_message_id / 未读数 / 会话最后一条消息的语义不受影响
+- 归档库中超过 purge_after_days 的消息彻底删除：blob 文件减引用（由 GC 回收），
+  旧版 uploads/chat 下的文件直接删除
+- 每批一个 BEGIN IMMEDIATE 短事务，批间休眠，避免长时间阻塞在线写入
+- 已归档（尚未彻底删除）的消息仍可通过 /api/chat/messages 的 before_id 翻页读取（read_archived）
+"""
+import gzip
+import os
+import sqlite3
+import time
+from typing import Dict, Any, List, Optional
+from app.core.utils import blob_store
+
+ARCHIVE_SCHEMA = 'chat_archive'
+
+
+class ChatRetentionService:
+    """聊天消息保留/归档服务"""
+
+    @staticmethod
+    def open_connection(db_path: str, archive_db_path: str) -> sqlite3.Connection:
+        """
+        打开独立连接并挂载归档库（后台任务/命令行使用，不依赖请求上下文）
+
+        Args:
+            db_path: 主库路径
+            archive_db_path: 归档库路径
+
+        Returns:
+            数据库连接（autocommit 模式，事务由调用方显式控制）
+        """
+        os.makedirs(os.path.dirname(archive_db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_db_path,))
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.chat_messages_archive (
+                id INTEGER PRIMARY KEY,
+                conversation_id INTEGER NOT NULL,
+                sender_id INTEGER NOT NULL,
+                content BLOB NOT NULL,
+                content_type TEXT DEFAULT 'text',
+                created_at DATETIME,
+                compressed INTEGER DEFAULT 0,
+                blob_refs TEXT,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_chat_archive_conversation '
+            'ON chat_messages_archive(conversation_id, id)'
+        )
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_chat_archive_created '
+            'ON chat_messages_archive(created_at)'
+        )
+        return conn
+
+    @staticmethod
+    def get_policy(policies: Dict[str, Dict[str, Any]], c_type: Optional[str]) -> Optional[Dict[str, Any]]:
+        """获取会话类型对应的策略（未单独配置时使用 default）"""
+        policy = (policies or {}).get(c_type or '') or (policies or {}).get('default')
+        if not policy:
+            return None
+        return {
+            'archive_after_days': policy.get('archive_after_days'),
+            'keep_recent': max(int(policy.get('keep_recent') or 1), 1),
+            'compress': bool(policy.get('compress')),
+            'purge_after_days': policy.get('purge_after_days'),
+        }
+
+    @staticmethod
+    def decode_content(row) -> str:
+        """读取归档消息内容（兼容压缩/未压缩）"""
+        content = row['content']
+        if row['compressed']:
+            return gzip.decompress(content).decode('utf-8')
+        if isinstance(content, bytes):
+            return content.decode('utf-8')
+        return content or ''
+
+    @staticmethod
+    def read_archived(archive_db_path: str, conversation_id: int, before_id: Optional[int],
+                      limit: int) -> List[Dict[str, Any]]:
+        """
+        读取归档库中某会话 id < before_id 的最近 limit 条消息（按 id 降序，内容已解压）
+
+        只读打开归档库，走 (conversation_id, id) 索引；归档库不存在时返回空列表
+
+        Args:
+            archive_db_path: 归档库路径
+            conversation_id: 会话ID
+            before_id: 只取更早的消息（None 表示不限）
+            limit: 条数
+        """
+        if limit <= 0 or not archive_db_path or not os.path.exists(archive_db_path):
+            return []
+        conn = sqlite3.connect(f'file:{archive_db_path}?mode=ro', uri=True, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                '''
+                SELECT id, conversation_id, sender_id, content, content_type, created_at, compressed
+                FROM chat_messages_archive
+                WHERE conversation_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+                ''',
+                (conversation_id, before_id if before_id is not None else 2 ** 63 - 1, limit)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # 归档表尚未创建
+            return []
+        finally:
+            conn.close()
+        return [{
+            'id': r['id'],
+            'conversation_id': r['conversation_id'],
+            'sender_id': r['sender_id'],
+            'content': ChatRetentionService.decode_content(r),
+            'content_type': r['content_type'],
+            'created_at': r['created_at'],
+        } for r in rows]
+
+    @staticmethod
+    def _archive_batch(conn, conversation_id: int, upper_id: int, cutoff: str,
+                       compress: bool, batch_size: int) -> int:
+        """归档一批消息，返回实际移动条数（单个短事务）"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                '''
+                SELECT id, conversation_id, sender_id, content, content_type, created_at
+                FROM chat_messages
+                WHERE conversation_id = ? AND id <= ? AND created_at < ?
+                ORDER BY id
+                LIMIT ?
+                ''',
+                (conversation_id, upper_id, cutoff, batch_size)
+            ).fetchall()
+            if not rows:
+                conn.execute('COMMIT')
+                return 0
+
+            archive_rows = []
+            for r in rows:
+                text = r['content'] or ''
+                refs = ' '.join(
+                    f"{blob_store.BLOB_DIR}/{sha[:2]}/{sha}" for sha in blob_store.iter_blob_refs(text)
+                )
+                if compress:
+                    payload, compressed = gzip.compress(text.encode('utf-8')), 1
+                else:
+                    payload, compressed = text, 0
+                archive_rows.append((
+                    r['id'], r['conversation_id'], r['sender_id'], payload,
+                    r['content_type'], r['created_at'], compressed, refs
+                ))
+
+            conn.executemany(
+                f'''
+                INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.chat_messages_archive
+                    (id, conversation_id, sender_id, content, content_type, created_at, compressed, blob_refs)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                archive_rows
+            )
+            ids = [r['id'] for r in rows]
+            placeholders = ','.join('?' * len(ids))
+            moved = conn.execute(f'DELETE FROM chat_messages WHERE id IN ({placeholders})', ids).rowcount
+
+            conn.execute(
+                '''
+                INSERT INTO chat_archive_stats (conversation_id, archived_count, last_archived_id, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(conversation_id) DO UPDATE SET
+                    archived_count = chat_archive_stats.archived_count + excluded.archived_count,
+                    last_archived_id = MAX(chat_archive_stats.last_archived_id, excluded.last_archived_id),
+                    updated_at = CURRENT_TIMESTAMP
+                ''',
+                (conversation_id, moved, ids[-1])
+            )
+            conn.execute('COMMIT')
+            return moved
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def archive_conversation(conn, conversation_id: int, policy: Dict[str, Any],
+                             batch_size: int = 500, pause: float = 0.0,
+                             should_stop=None) -> int:
+        """
+        归档单个会话
+
+        Args:
+            conn: open_connection 返回的连接
+            conversation_id: 会话ID
+            policy: get_policy 返回的策略
+            batch_size: 每批条数
+            pause: 批间休眠秒数
+            should_stop: 可选回调，返回 True 时中止（后台任务停止时）
+
+        Returns:
+            归档条数
+        """
+        days = policy.get('archive_after_days')
+        if not days:
+            return 0
+
+        # 1) 所有成员都已读到的位置（未读消息不归档，未读数语义保持不变）
+        read_floor = conn.execute(
+            'SELECT MIN(COALESCE(last_read_message_id, 0)) FROM chat_members WHERE conversation_id = ?',
+            (conversation_id,)
+        ).fetchone()[0] or 0
+        if read_floor <= 0:
+            return 0
+
+        # 2) 热表中保留最近 keep_recent 条
+        keep_row = conn.execute(
+            'SELECT id FROM chat_messages WHERE conversation_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?',
+            (conversation_id, policy['keep_recent'] - 1)
+        ).fetchone()
+        if not keep_row:
+            return 0
+
+        upper_id = min(read_floor, keep_row['id'] - 1)
+        if upper_id <= 0:
+            return 0
+
+        cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{int(days)} days',)).fetchone()[0]
+
+        total = 0
+        while True:
+            if should_stop and should_stop():
+                break
+            moved = ChatRetentionService._archive_batch(
+                conn, conversation_id, upper_id, cutoff, policy['compress'], batch_size
+            )
+            total += moved
+            if moved < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return total
+
+    @staticmethod
+    def _purge_batch(conn, ids: List[int], upload_root: Optional[str]) -> int:
+        """彻底删除一批归档消息并释放其上传文件"""
+        placeholders = ','.join('?' * len(ids))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                f'SELECT id, conversation_id, content, compressed, content_type, blob_refs '
+                f'FROM {ARCHIVE_SCHEMA}.chat_messages_archive WHERE id IN ({placeholders})',
+                ids
+            ).fetchall()
+
+            legacy_files = []
+            per_conversation: Dict[int, int] = {}
+            for r in rows:
+                per_conversation[r['conversation_id']] = per_conversation.get(r['conversation_id'], 0) + 1
+                for ref in (r['blob_refs'] or '').split():
+                    blob_store.decref(conn, ref)
+                if r['content_type'] in ('image', 'audio') and upload_root:
+                    text = ChatRetentionService.decode_content(r)
+                    legacy_files.extend(ChatRetentionService._legacy_chat_files(text))
+
+            conn.execute(
+                f'DELETE FROM {ARCHIVE_SCHEMA}.chat_messages_archive WHERE id IN ({placeholders})', ids
+            )
+            conn.executemany(
+                'UPDATE chat_archive_stats SET archived_count = MAX(archived_count - ?, 0), '
+                'updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?',
+                [(n, cid) for cid, n in per_conversation.items()]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        # 旧版 uploads/chat 文件没有引用计数，消息删除后即为孤儿文件
+        for name in legacy_files:
+            path = os.path.join(upload_root, 'chat', name)
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+        return len(rows)
+
+    @staticmethod
+    def _legacy_chat_files(text: str) -> List[str]:
+        """从图片/语音消息内容中提取旧版 /uploads/chat/<name> 文件名"""
+        names = []
+        marker = '/uploads/chat/'
+        start = text.find(marker)
+        while start != -1:
+            end = start + len(marker)
+            stop = end
+            while stop < len(text) and text[stop] not in '"\'\\ ,}':
+                stop += 1
+            name = text[end:stop]
+            if name and '/' not in name and '..' not in name:
+                names.append(name)
+            start = text.find(marker, stop)
+        return names
+
+    @staticmethod
+    def purge_archive(conn, policies: Dict[str, Dict[str, Any]], upload_root: Optional[str],
+                      batch_size: int = 500, pause: float = 0.0, should_stop=None) -> int:
+        """
+        清理归档库：超过 purge_after_days 的消息、以及所属会话已被删除的消息
+
+        Returns:
+            删除条数
+        """
+        conv_types = {
+            r['id']: r['c_type']
+            for r in conn.execute('SELECT id, c_type FROM chat_conversations').fetchall()
+        }
+
+        total = 0
+        last_id = 0
+        while True:
+            if should_stop and should_stop():
+                break
+            rows = conn.execute(
+                f'''
+                SELECT id, conversation_id, created_at FROM {ARCHIVE_SCHEMA}.chat_messages_archive
+                WHERE id > ? ORDER BY id LIMIT ?
+                ''',
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            cutoffs: Dict[Optional[int], Optional[str]] = {}
+            expired = []
+            for r in rows:
+                cid = r['conversation_id']
+                if cid not in conv_types:
+                    expired.append(r['id'])  # 会话已删除：归档残留
+                    continue
+                c_type = conv_types[cid]
+                if c_type not in cutoffs:
+                    policy = ChatRetentionService.get_policy(policies, c_type) or {}
+                    days = policy.get('purge_after_days')
+                    cutoffs[c_type] = conn.execute(
+                        "SELECT datetime('now', ?)", (f'-{int(days)} days',)
+                    ).fetchone()[0] if days else None
+                cutoff = cutoffs[c_type]
+                if cutoff and (r['created_at'] or '') < cutoff:
+                    expired.append(r['id'])
+
+            if expired:
+                total += ChatRetentionService._purge_batch(conn, expired, upload_root)
+                if pause:
+                    time.sleep(pause)
+        return total
+
+    @staticmethod
+    def run(db_path: str, archive_db_path: str, policies: Dict[str, Dict[str, Any]],
+            upload_root: Optional[str] = None, batch_size: int = 500, pause: float = 0.0,
+            should_stop=None) -> Dict[str, int]:
+        """
+        执行一轮保留策略（归档 + 清理）
+
+        Returns:
+            {'conversations': 处理会话数, 'archived': 归档条数, 'purged': 删除条数}
+        """
+        conn = ChatRetentionService.open_connection(db_path, archive_db_path)
+        try:
+            archived = 0
+            touched = 0
+            conversations = conn.execute('SELECT id, c_type FROM chat_conversations ORDER BY id').fetchall()
+            for conv in conversations:
+                if should_stop and should_stop():
+                    break
+                policy = ChatRetentionService.get_policy(policies, conv['c_type'])
+                if not policy:
+                    continue
+                n = ChatRetentionService.archive_conversation(
+                    conn, conv['id'], policy, batch_size=batch_size, pause=pause, should_stop=should_stop
+                )
+                if n:
+                    archived += n
+                    touched += 1
+
+            purged = ChatRetentionService.purge_archive(
+                conn, policies, upload_root, batch_size=batch_size, pause=pause, should_stop=should_stop
+            )
+
+            if archived or purged:
+                # 热表缩小后刷新统计信息，保证查询计划稳定
+                conn.execute('PRAGMA optimize')
+
+            return {'conversations': touched, 'archived': archived, 'purged': purged}
+        finally:
+            conn.close()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+聊天用户搜索服务
+基于 FTS5 trigram 索引（user_search_fts / user_remark_fts）做子串检索；
+关键词不足 3 个字符（trigram 无法命中索引）时先走 username NOCASE 索引取前缀命中，
+索引不可用时回退到 LIKE。
+"""
+from typing import Dict, Any, List, Optional
+
+# trigram 分词要求关键词至少 3 个字符才能走索引
+MIN_TRIGRAM_LEN = 3
+
+
+class UserSearchService:
+    """聊天用户搜索服务"""
+
+    # 进程内缓存：FTS 表是否存在（init_db 启动时创建，运行期不会变化）
+    _fts_available: Optional[bool] = None
+
+    @staticmethod
+    def fts_available(conn) -> bool:
+        """检查 FTS 搜索索引是否可用"""
+        if UserSearchService._fts_available is None:
+            rows = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name IN ('user_search_fts', 'user_remark_fts')"
+            ).fetchall()
+            UserSearchService._fts_available = (len(rows) == 2)
+        return UserSearchService._fts_available
+
+    @staticmethod
+    def _match_expr(q: str) -> str:
+        """关键词 -> FTS5 短语表达式（按字面子串匹配，转义双引号）"""
+        return '"' + q.replace('"', '""') + '"'
+
+    @staticmethod
+    def _use_index(conn, q: str) -> bool:
+        return len(q) >= MIN_TRIGRAM_LEN and UserSearchService.fts_available(conn)
+
+    @staticmethod
+    def search_users(conn, q: str, exclude_user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        创建聊天时的用户搜索
+
+        排序规则（与原实现一致）：精确命中 > 前缀命中 > 最近活跃 > 用户名
+
+        Args:
+            conn: 数据库连接
+            q: 关键词（可为空）
+            exclude_user_id: 排除的用户（当前用户自己）
+            limit: 返回数量
+
+        Returns:
+            用户列表 [{id, username, avatar, last_active}]
+        """
+        q = (q or '').strip()
+        if not q:
+            rows = conn.execute(
+                """
+                SELECT id, username, avatar, last_active
+                FROM users
+                WHERE id != ?
+                ORDER BY (last_active IS NULL) ASC, last_active DESC, username ASC LIMIT ?
+                """,
+                (exclude_user_id, limit)
+            ).fetchall()
+            return [dict(r) for r in rows]
+
+        if UserSearchService._use_index(conn, q):
+            # 先用 trigram 索引圈定候选集，再在小结果集上排序
+            return UserSearchService._ranked_users(
+                conn, q,
+                "id != ? AND id IN (SELECT rowid FROM user_search_fts WHERE user_search_fts MATCH ?)",
+                [exclude_user_id, UserSearchService._match_expr(q)],
+                limit
+            )
+
+        # 短关键词（trigram 无法命中索引）：
+        # 1) 前缀命中走 username NOCASE 索引的范围扫描；精确命中一定也是前缀命中
+        # 2) 前缀结果不足 limit 时，再补充“包含但非前缀”的结果（这部分排序只看活跃度）
+        # 两段拼接后的顺序与单条 ORDER BY 完全一致
+        lo, hi = q, q + '\U0010ffff'
+        rows = UserSearchService._ranked_users(
+            conn, q,
+            "id != ? AND username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE",
+            [exclude_user_id, lo, hi],
+            limit
+        )
+        if len(rows) < limit:
+            rows += UserSearchService._ranked_users(
+                conn, q,
+                "id != ? AND username LIKE ? "
+                "AND NOT (username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE)",
+                [exclude_user_id, f"%{q}%", lo, hi],
+                limit - len(rows)
+            )
+        return rows
+
+    @staticmethod
+    def _ranked_users(conn, q: str, where_sql: str, params: List[Any], limit: int) -> List[Dict[str, Any]]:
+        """按统一规则排序取前 limit 个用户"""
+        # 排序优化：精确命中优先，其次前缀命中；再按活跃度与用户名
+        # 说明：即使前端不做精确匹配，这里也尽量把最可能目标排在前面
+        rows = conn.execute(
+            f"""
+            SELECT id, username, avatar, last_active
+            FROM users
+            WHERE {where_sql}
+            ORDER BY (LOWER(username) = LOWER(?)) DESC, (LOWER(username) LIKE LOWER(?) ) DESC,
+                     (last_active IS NULL) ASC, last_active DESC, username ASC
+            LIMIT ?
+            """,
+            list(params) + [q, f"{q}%", limit]
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def search_conversation_users(conn, owner_user_id: int, q: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        已有私聊会话中的对方用户搜索（匹配用户名或我对TA的备注）
+
+        排序规则（与原实现一致）：会话最近更新优先，其次用户名
+
+        Args:
+            conn: 数据库连接
+            owner_user_id: 当前用户
+            q: 关键词（可为空）
+            limit: 返回数量
+
+        Returns:
+            用户列表 [{id, username, avatar, remark}]
+        """
+        q = (q or '').strip()
+        sql = """
+            SELECT DISTINCT
+                   pu.id,
+                   pu.username,
+                   pu.avatar,
+                   ur.remark,
+                   c.updated_at
+            FROM chat_conversations c
+            JOIN chat_members mb ON mb.conversation_id = c.id AND mb.user_id = ?
+            -- 取对方成员（direct会话：除自己外的那个人）
+            JOIN chat_members pmb ON pmb.conversation_id = c.id AND pmb.user_id != ?
+            JOIN users pu ON pu.id = pmb.user_id
+            -- 取当前用户对对方的备注
+            LEFT JOIN user_remarks ur ON ur.owner_user_id = ? AND ur.target_user_id = pu.id
+            WHERE c.c_type = 'direct'
+        """
+        params: List[Any] = [owner_user_id, owner_user_id, owner_user_id]
+
+        # 如果有关键词，搜索用户名或备注
+        if q:
+            if UserSearchService._use_index(conn, q):
+                match = UserSearchService._match_expr(q)
+                sql += """
+                  AND (
+                    pu.id IN (SELECT rowid FROM user_search_fts WHERE user_search_fts MATCH ?)
+                    OR ur.id IN (
+                        SELECT rowid FROM user_remark_fts
+                        WHERE user_remark_fts MATCH ? AND owner_user_id = ?
+                    )
+                  )
+                """
+                params.extend([match, match, owner_user_id])
+            else:
+                sql += " AND (pu.username LIKE ? OR ur.remark LIKE ?)"
+                params.extend([f"%{q}%", f"%{q}%"])
+
+        # 按最后更新时间排序，最近聊天的用户排在前面
+        sql += " ORDER BY c.updated_at DESC, pu.username ASC LIMIT ?"
+        params.append(limit)
+
+        rows = conn.execute(sql, params).fetchall()
+        return [
+            {
+                'id': r['id'],
+                'username': r['username'],
+                'avatar': r['avatar'],
+                'remark': r['remark'],  # 备注信息
+            }
+            for r in rows
+        ]
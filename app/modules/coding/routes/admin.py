@@ -3,6 +3,7 @@
 from flask import Blueprint, request, jsonify, session, current_app, render_template
 from typing import Dict, Any
 from app.core.utils.decorators import admin_required
+from app.core.utils import metrics
 from app.modules.coding.services.question_service import QuestionService
 from app.modules.coding.schemas.question_schemas import (
     QuestionCreateSchema,
@@ -344,25 +345,26 @@ def api_get_questions():
         rows = db.execute(f'''
             SELECT 
                 q.*,
-                s.name as subject_name,
-                COUNT(DISTINCT cs.id) as total_submissions,
-                COUNT(DISTINCT CASE WHEN cs.status = 'accepted' THEN cs.id END) as accepted_submissions
+                s.name as subject_name
             FROM coding_questions q
             LEFT JOIN coding_subjects s ON q.coding_subject_id = s.id
-            LEFT JOIN code_submissions cs ON q.id = cs.question_id
             WHERE {where_clause}
-            GROUP BY q.id
             ORDER BY q.id DESC
             LIMIT ? OFFSET ?
         ''', params + [per_page, offset]).fetchall()
         
+        # 当前页题目的提交数/通过数取自统计汇总表（按题目维度），不再联表扫描 code_submissions
+        page_ids = [row['id'] for row in rows]
+        submissions = metrics.totals_by_dim(db, 'coding.submissions', page_ids)
+        accepted = metrics.totals_by_dim(db, 'coding.accepted', page_ids)
+        
         questions = []
         for row in rows:
             # 将sqlite3.Row转换为字典
             row_dict = dict(row)
             
-            total_sub = row_dict.get('total_submissions', 0) or 0
-            accepted_sub = row_dict.get('accepted_submissions', 0) or 0
+            total_sub = submissions.get(str(row_dict['id']), 0)
+            accepted_sub = accepted.get(str(row_dict['id']), 0)
             acceptance_rate = (accepted_sub / total_sub) if total_sub > 0 else None
             
             questions.append({
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 """主页面路由"""
-from flask import Blueprint, render_template, request, session, redirect, send_from_directory, current_app
+from flask import Blueprint, render_template, request, session, redirect, current_app
 import json
-import os
+from app.core.utils import question_counts, question_payload
 from app.core.utils.database import get_db
+from app.core.utils.file_serving import send_upload
 
 main_pages_bp = Blueprint('main_pages', __name__)
 
@@ -27,8 +28,8 @@ def index():
     conn = get_db()
     
     try:
-        # 统计基础数据
-        quiz_count = conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        # 统计基础数据（题库计数表）
+        quiz_count = question_counts.total(conn)
         
         # 统计当前用户的收藏/错题
         if uid:
@@ -61,25 +62,19 @@ def index():
             subjects = []  # 未登录用户返回空列表
         
         # 获取所有题型（作为备用）
-        q_types = [row[0] for row in conn.execute("SELECT DISTINCT q_type FROM questions").fetchall()]
+        q_types = question_counts.q_types(conn)
         
         # 获取每个科目下的题型（添加权限过滤）
         subject_q_types = {}
         if uid and accessible_subject_ids:
             placeholders = ','.join(['?'] * len(accessible_subject_ids))
-            rows = conn.execute(f"""
-                SELECT s.name, GROUP_CONCAT(DISTINCT q.q_type)
-                FROM subjects s
-                LEFT JOIN questions q ON s.id = q.subject_id
-                WHERE s.id IN ({placeholders})
-                GROUP BY s.name
-                ORDER BY s.id
-            """, accessible_subject_ids).fetchall()
-            for row in rows:
-                if row[0] and row[1]:
-                    subject_q_types[row[0]] = sorted(list(set(row[1].split(','))))
-                elif row[0]:
-                    subject_q_types[row[0]] = []
+            types_by_id = question_counts.q_types_by_subject(conn, accessible_subject_ids)
+            for row in conn.execute(
+                f"SELECT id, name FROM subjects WHERE id IN ({placeholders}) ORDER BY id",
+                accessible_subject_ids
+            ).fetchall():
+                if row['name']:
+                    subject_q_types[row['name']] = types_by_id.get(row['id'], [])
     except Exception as e:
         current_app.logger.error(f"Error fetching index page data: {e}")
         quiz_count = 0
@@ -151,7 +146,7 @@ def search_page():
                 subjects = []
         else:
             subjects = []  # 未登录用户返回空列表
-        q_types = [row[0] for row in conn.execute("SELECT DISTINCT q_type FROM questions").fetchall()]
+        q_types = question_counts.q_types(conn)
     except:
         subjects = []
         q_types = []
@@ -173,7 +168,7 @@ def search_page():
 
     # 构建搜索SQL
     sql_base = """
-        SELECT q.*, s.name as subject,
+        SELECT q.id, s.name as subject,
                CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as is_fav,
                CASE WHEN m.id IS NOT NULL THEN 1 ELSE 0 END as is_mistake
         FROM questions q
@@ -227,40 +222,9 @@ def search_page():
 
     rows = conn.execute(sql, params).fetchall()
     
-    questions = []
-    for row in rows:
-        q = dict(row)
-        
-        # 提前处理答案和选项
-        correct_answer_key = str(q.get('answer', '')).strip()
-        q['full_answer'] = correct_answer_key  # 默认答案为标识符
-
-        if q.get('options') and isinstance(q.get('options'), str):
-            try:
-                options_list = json.loads(q['options'])
-                if isinstance(options_list, list):
-                    new_options = []
-                    options_map = {}
-                    for item_str in options_list:
-                        delimiter = '、' if '、' in item_str else '.'
-                        parts = item_str.split(delimiter, 1)
-                        if len(parts) == 2:
-                            key = parts[0].strip()
-                            value = parts[1].strip()
-                            new_options.append({'key': key, 'value': value})
-                            options_map[key] = value
-                    q['options'] = new_options
-
-                    # 尝试为所有选项构建完整答案
-                    if correct_answer_key in options_map:
-                        q['full_answer'] = f"{correct_answer_key}. {options_map[correct_answer_key]}"
-                else:
-                    q['options'] = []
-            except (json.JSONDecodeError, TypeError):
-                q['options'] = []
-        else:
-            q['options'] = []
-        questions.append(q)
+    # 选项、完整答案等取自题目载荷缓存
+    payloads = question_payload.get_payloads(conn, [row['id'] for row in rows])
+    questions = [dict(payloads[row['id']], **dict(row)) for row in rows if row['id'] in payloads]
 
     return render_template('main/search.html',
                          keyword=keyword,
@@ -325,12 +289,8 @@ def quiz_settings_page():
 
 @main_pages_bp.route('/uploads/<path:filename>')
 def serve_upload(filename):
-    """安全地提供上传的文件（支持音视频 Range 请求）"""
-    directory = os.path.join(current_app.root_path, '..', 'uploads')
-    resp = send_from_directory(directory, filename, conditional=True)
-    # 让浏览器/音频组件更愿意做断点/Range 拉取（部分移动端对流式更敏感）
-    resp.headers.setdefault('Accept-Ranges', 'bytes')
-    return resp
+    """安全地提供上传的文件（支持音视频 Range 请求、强缓存与 Nginx 卸载）"""
+    return send_upload(filename)
 
 
 @main_pages_bp.route('/contact_admin')
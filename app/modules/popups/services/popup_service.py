@@ -3,6 +3,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from app.core.utils.database import get_db
+from app.core.utils import metrics
 from app.modules.popups.schemas import PopupResponseSchema, PopupStatsSchema
 
 
@@ -118,17 +119,9 @@ class PopupService:
         if not popup:
             return None
         
-        # 统计显示次数
-        view_count = conn.execute(
-            'SELECT COUNT(*) FROM popup_views WHERE popup_id = ?',
-            (popup_id,)
-        ).fetchone()[0]
-        
-        # 统计关闭次数
-        dismissal_count = conn.execute(
-            'SELECT COUNT(*) FROM popup_dismissals WHERE popup_id = ?',
-            (popup_id,)
-        ).fetchone()[0]
+        # 显示/关闭次数取自统计汇总表（触发器维护），不扫描 popup_views
+        view_count = metrics.total(conn, 'popup.views', popup_id)
+        dismissal_count = metrics.total(conn, 'popup.dismissals', popup_id)
         
         # 计算关闭率
         dismissal_rate = dismissal_count / view_count if view_count > 0 else 0.0
@@ -150,14 +143,21 @@ class PopupService:
         """
         conn = get_db()
         
-        # 获取所有弹窗
+        # 获取所有弹窗；显示/关闭次数各用一次分组查询从统计汇总表读取
         popups = conn.execute('SELECT id FROM popups ORDER BY id DESC').fetchall()
+        views = metrics.totals_by_dim(conn, 'popup.views')
+        dismissals = metrics.totals_by_dim(conn, 'popup.dismissals')
         
         stats_list = []
         for popup in popups:
-            stats = PopupService.get_popup_stats(popup['id'])
-            if stats:
-                stats_list.append(stats)
+            view_count = views.get(str(popup['id']), 0)
+            dismissal_count = dismissals.get(str(popup['id']), 0)
+            stats_list.append({
+                'popup_id': popup['id'],
+                'total_views': view_count,
+                'total_dismissals': dismissal_count,
+                'dismissal_rate': round(dismissal_count / view_count if view_count > 0 else 0.0, 4)
+            })
         
         return stats_list
 
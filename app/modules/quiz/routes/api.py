@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 """刷题API路由"""
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, get_template_attribute
 from app.core.utils.database import get_db
+from app.core.utils import progress_store, question_counts
 from app.core.extensions import limiter
 
 quiz_api_bp = Blueprint('quiz_api', __name__)
@@ -37,12 +38,7 @@ def toggle_favorite():
 @limiter.exempt  # 答题记录接口不限流
 def record_result():
     """记录做题结果（添加刷题限制检查）"""
-    from app.core.utils.subject_permissions import (
-        check_quiz_limit, 
-        increment_user_quiz_count,
-        get_user_quiz_count,
-        get_quiz_limit_count
-    )
+    from app.modules.quiz.services.answer_record_service import AnswerRecordService, QuizLimitReached
     
     if not session.get('user_id'):
         return jsonify({'status': 'unauthorized', 'message': '请先登录'}), 401
@@ -55,55 +51,111 @@ def record_result():
     if not q_id or is_correct is None:
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
     
-    # 检查刷题限制
-    is_limited, limit_message = check_quiz_limit(uid)
-    if is_limited:
-        return jsonify({
-            'status': 'error',
-            'message': limit_message,
-            'code': 'QUIZ_LIMIT_REACHED',
-            'data': {
-                'current_count': get_user_quiz_count(uid),
-                'limit_count': get_quiz_limit_count(),
-                'contact_admin_url': '/contact_admin'
-            }
-        }), 403
+    conn = get_db()
+    try:
+        # is_admin 已由请求前钩子按数据库同步到 session
+        action = AnswerRecordService.record(conn, uid, q_id, bool(is_correct), bool(session.get('is_admin')))
+        return jsonify({"status": "success", "action": action})
+    except QuizLimitReached as e:
+        # 检查刷题限制
+        return jsonify(AnswerRecordService.limit_error_payload(e)), 403
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@quiz_api_bp.route('/record_results', methods=['POST'])
+@limiter.exempt  # 答题记录接口不限流
+def record_results():
+    """
+    批量记录做题结果（前端答题队列定时提交，页面卸载时通过 sendBeacon 提交）
+
+    请求体：[{question_id, is_correct, answered_at}]（或 {"answers": [...]}），answered_at 为毫秒时间戳，
+    单次最多 RECORD_BATCH_MAX 条
+    返回：与请求顺序一致的逐条结果 results，以及剩余刷题额度 limit_remaining（不限制时为 null）
+    """
+    from app.modules.quiz.services.answer_record_service import AnswerRecordService, RECORD_BATCH_MAX
+    
+    if not session.get('user_id'):
+        return jsonify({'status': 'unauthorized', 'message': '请先登录'}), 401
+    
+    # sendBeacon 发送的 Blob 也带 application/json，但不强制校验 Content-Type
+    data = request.get_json(force=True, silent=True)
+    if isinstance(data, dict):
+        data = data.get('answers')
+    if not isinstance(data, list):
+        return jsonify({'status': 'error', 'message': '参数格式错误'}), 400
+    if len(data) > RECORD_BATCH_MAX:
+        return jsonify({'status': 'error', 'message': f'单次最多提交 {RECORD_BATCH_MAX} 条答题记录'}), 400
+    
+    results = [None] * len(data)
+    items, positions = [], []
+    for index, raw in enumerate(data):
+        try:
+            q_id = int(raw.get('question_id'))
+            is_correct = raw.get('is_correct')
+            if q_id <= 0 or is_correct is None:
+                raise ValueError
+        except (AttributeError, TypeError, ValueError):
+            results[index] = {'status': 'error', 'code': 'INVALID', 'message': '参数不完整'}
+            continue
+        items.append({'question_id': q_id, 'is_correct': bool(is_correct), 'answered_at': raw.get('answered_at')})
+        positions.append(index)
     
     conn = get_db()
     try:
-        # 更新错题本（只记录错误题目）
-        if not is_correct:
-            conn.execute(
-                "INSERT INTO mistakes (user_id, question_id, wrong_count) VALUES (?, ?, 1) ON CONFLICT(user_id, question_id) DO UPDATE SET wrong_count = wrong_count + 1",
-                (uid, q_id)
-            )
-            action = "added_mistake"
-        else:
-            # 答对了，从错题本中移除
-            conn.execute("DELETE FROM mistakes WHERE user_id = ? AND question_id = ?", (uid, q_id))
-            action = "removed_mistake"
-        
-        # 记录答题历史（每次答题都记录，用于统计）
-        # 先删除旧记录，再插入新记录，确保每个用户对每道题只保留最新的一条记录
-        conn.execute(
-            'DELETE FROM user_answers WHERE user_id = ? AND question_id = ?',
-            (uid, q_id)
-        )
-        conn.execute(
-            """INSERT INTO user_answers 
-               (user_id, question_id, is_correct, created_at) 
-               VALUES (?, ?, ?, CURRENT_TIMESTAMP)""",
-            (uid, q_id, 1 if is_correct else 0)
+        # is_admin 已由请求前钩子按数据库同步到 session
+        recorded, remaining = AnswerRecordService.record_many(
+            conn, session.get('user_id'), items, bool(session.get('is_admin'))
         )
-        
-        # 增加刷题数（如果功能开启）
-        increment_user_quiz_count(uid)
-        
-        conn.commit()
-        return jsonify({"status": "success", "action": action})
     except Exception as e:
-        conn.rollback()
         return jsonify({"status": "error", "msg": str(e)}), 500
+    for index, result in zip(positions, recorded):
+        results[index] = result
+    return jsonify({'status': 'success', 'results': results, 'limit_remaining': remaining})
+
+
+@quiz_api_bp.route('/quiz/questions')
+@limiter.exempt  # 刷题页按需加载题目，不限流
+def api_quiz_questions():
+    """
+    刷题页按 ID 批量获取题目（首屏窗口之外的题目）
+
+    参数：ids（逗号分隔，最多 QUIZ_BATCH_SIZE 个）、mode、shuffle_options
+    返回：按请求顺序排列的 [{id, q_type, html}]，html 与页面首屏使用同一模板渲染；
+    锁定/无权访问/已删除的题目不返回
+    """
+    from app.core.utils.subject_permissions import get_user_accessible_subjects
+    from app.modules.quiz.services.question_delivery_service import (
+        QuestionDeliveryService, QUIZ_BATCH_SIZE
+    )
+
+    uid = session.get('user_id')
+    if not uid:
+        return jsonify({'status': 'unauthorized', 'message': '请先登录'}), 401
+
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '题目ID格式错误'}), 400
+    if len(ids) > QUIZ_BATCH_SIZE:
+        return jsonify({'status': 'error', 'message': f'单次最多获取 {QUIZ_BATCH_SIZE} 道题目'}), 400
+
+    mode = request.args.get('mode', 'quiz').lower()
+    shuffle_options = request.args.get('shuffle_options', '0') == '1'
+
+    conn = get_db()
+    questions = QuestionDeliveryService.load_questions(
+        conn, uid, ids, shuffle_options, get_user_accessible_subjects(uid)
+    )
+    question_box = get_template_attribute('quiz/partials/quiz/_question_box.html', 'question_box')
+    data = []
+    for qid in dict.fromkeys(ids):
+        q = questions.get(qid)
+        if q is None:
+            continue
+        # 编号由前端占位元素决定（id="q-{index}" / data-index 不随批量结果替换）
+        data.append({'id': qid, 'q_type': q.get('q_type'), 'html': str(question_box(q, 0, mode, True))})
+    return jsonify({'status': 'success', 'data': data})
 
 
 @quiz_api_bp.route('/questions/count')
@@ -120,38 +172,39 @@ def api_questions_count():
     
     conn = get_db()
     
+    if not uid:
+        # 未登录用户：返回0
+        return jsonify({'status':'success','count': 0})
+    
     # 获取用户可访问的科目ID列表（用于权限过滤）
-    accessible_subject_ids = None
-    if uid:
-        accessible_subject_ids = get_user_accessible_subjects(uid)
-        if not accessible_subject_ids:
-            return jsonify({'status':'success','count': 0})
+    accessible_subject_ids = get_user_accessible_subjects(uid)
+    if not accessible_subject_ids:
+        return jsonify({'status':'success','count': 0})
 
     # 兼容新的 source 参数，优先使用 source，其次 mode
     target = source if source in ('favorites', 'mistakes') else mode
     
+    if target not in ('favorites', 'mistakes'):
+        # 全部题目：按锁定状态/权限/科目名换算出科目ID，汇总 question_counts 中的少量行
+        placeholders = ','.join(['?'] * len(accessible_subject_ids))
+        sql = f"SELECT id FROM subjects WHERE id IN ({placeholders}) AND (is_locked=0 OR is_locked IS NULL)"
+        params = list(accessible_subject_ids)
+        if subject != 'all':
+            sql += " AND name = ?"
+            params.append(subject)
+        subject_ids = [row[0] for row in conn.execute(sql, params).fetchall()]
+        return jsonify({'status':'success','count': question_counts.total(conn, subject_ids, q_type)})
+    
     if target == 'favorites':
-        if not uid:
-            return jsonify({'status':'success','count': 0})
         base_sql = "FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id JOIN favorites f ON f.question_id = q.id AND f.user_id = ? WHERE (s.is_locked=0 OR s.is_locked IS NULL)"
-        params = [uid]
-    elif target == 'mistakes':
-        if not uid:
-            return jsonify({'status':'success','count': 0})
-        base_sql = "FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id JOIN mistakes m ON m.question_id = q.id AND m.user_id = ? WHERE (s.is_locked=0 OR s.is_locked IS NULL)"
-        params = [uid]
     else:
-        base_sql = "FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id WHERE (s.is_locked=0 OR s.is_locked IS NULL)"
-        params = []
+        base_sql = "FROM questions q LEFT JOIN subjects s ON q.subject_id = s.id JOIN mistakes m ON m.question_id = q.id AND m.user_id = ? WHERE (s.is_locked=0 OR s.is_locked IS NULL)"
+    params = [uid]
     
     # 添加权限过滤
-    if accessible_subject_ids is not None:
-        placeholders = ','.join(['?'] * len(accessible_subject_ids))
-        base_sql += f" AND q.subject_id IN ({placeholders})"
-        params.extend(accessible_subject_ids)
-    elif not uid:
-        # 未登录用户：返回0
-        return jsonify({'status':'success','count': 0})
+    placeholders = ','.join(['?'] * len(accessible_subject_ids))
+    base_sql += f" AND q.subject_id IN ({placeholders})"
+    params.extend(accessible_subject_ids)
     
     if subject != 'all':
         base_sql += " AND s.name = ?"
@@ -227,67 +280,51 @@ def progress_api():
     conn = get_db()
     
     if request.method == 'GET':
-        # 获取进度
+        # 获取进度（题目顺序单独保存，由页面渲染时按顺序输出，这里不返回）
         key = request.args.get('key', '').strip()
         if not key:
             return jsonify({'status': 'error', 'message': '缺少key参数'}), 400
         
         try:
-            row = conn.execute(
-                'SELECT data FROM user_progress WHERE user_id = ? AND p_key = ?',
-                (uid, key)
-            ).fetchone()
-            
-            if row:
-                import json
-                data = json.loads(row['data'])
-                return jsonify({'status': 'success', 'data': data})
-            else:
-                return jsonify({'status': 'success', 'data': None})
+            return jsonify({'status': 'success', 'data': progress_store.get(conn, uid, key)})
         except Exception as e:
             return jsonify({'status': 'error', 'message': str(e)}), 500
     
     elif request.method == 'POST':
-        # 保存进度
-        data = request.json
-        key = data.get('key', '').strip()
+        # 保存进度：patch 为增量（JSON Merge Patch，一条 UPSERT 合并），data 为整体覆盖（兼容旧页面）；
+        # 重新打乱后提交一次新顺序：seed + bank_version（种子顺序），或 order（显式顺序，base64 打包数组或ID列表，兼容旧页面）
+        data = request.get_json(silent=True) or {}
+        key = (data.get('key') or '').strip()
+        patch = data.get('patch')
         progress_data = data.get('data')
         
         if not key:
             return jsonify({'status': 'error', 'message': '缺少key参数'}), 400
+        if patch is not None and not isinstance(patch, dict):
+            return jsonify({'status': 'error', 'message': 'patch 必须是对象'}), 400
+        if patch is None and 'data' not in data:
+            return jsonify({'status': 'error', 'message': '缺少进度数据'}), 400
+        seed = data.get('seed')
+        if seed is not None:
+            bank_version = data.get('bank_version')
+            if not (isinstance(seed, int) and 0 <= seed <= 0xFFFFFFFF
+                    and isinstance(bank_version, int) and bank_version >= 0):
+                return jsonify({'status': 'error', 'message': 'seed 格式错误'}), 400
+        order = None
+        if data.get('order') is not None:
+            order = progress_store.parse_order(data.get('order'))
+            if order is None:
+                return jsonify({'status': 'error', 'message': 'order 格式错误'}), 400
         
         try:
-            import json
-            data_json = json.dumps(progress_data, ensure_ascii=False)
-            
-            # 先检查是否存在，存在则更新，不存在则插入
-            existing = conn.execute(
-                'SELECT id FROM user_progress WHERE user_id = ? AND p_key = ?',
-                (uid, key)
-            ).fetchone()
-            
-            if existing:
-                conn.execute(
-                    """UPDATE user_progress 
-                       SET data = ?, updated_at = CURRENT_TIMESTAMP 
-                       WHERE user_id = ? AND p_key = ?""",
-                    (data_json, uid, key)
-                )
+            if patch is not None:
+                progress_store.merge(conn, uid, key, patch)
             else:
-                # 检查是否有created_at字段
-                try:
-                    conn.execute(
-                        """INSERT INTO user_progress (user_id, p_key, data, updated_at, created_at) 
-                           VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)""",
-                        (uid, key, data_json)
-                    )
-                except:
-                    # 如果created_at字段不存在,则不包含它
-                    conn.execute(
-                        """INSERT INTO user_progress (user_id, p_key, data, updated_at) 
-                           VALUES (?, ?, ?, CURRENT_TIMESTAMP)""",
-                        (uid, key, data_json)
-                    )
+                progress_store.replace(conn, uid, key, progress_data)
+            if seed is not None:
+                progress_store.set_seed(conn, uid, key, seed, bank_version)
+            elif order:
+                progress_store.set_order(conn, uid, key, order)
             conn.commit()
             
             return jsonify({'status': 'success', 'message': '进度已保存'})
@@ -302,10 +339,7 @@ def progress_api():
             return jsonify({'status': 'error', 'message': '缺少key参数'}), 400
         
         try:
-            conn.execute(
-                'DELETE FROM user_progress WHERE user_id = ? AND p_key = ?',
-                (uid, key)
-            )
+            progress_store.delete(conn, uid, key)
             conn.commit()
             return jsonify({'status': 'success', 'message': '进度已删除'})
         except Exception as e:
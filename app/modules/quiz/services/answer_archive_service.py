@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+答题事件归档服务
+
+说明：
+- answer_events 只追加，热表只保留最近 ANSWER_EVENTS_HOT_MONTHS 个自然月（含当月）的事件
+- 更早的事件按批移入独立归档库（ANSWER_EVENTS_ARCHIVE_DB_PATH），按作答月份分表 answer_events_YYYYMM；
+  整月的历史可以单独导出或删除，无需扫描热表
+- 归档不影响 user_answers（最新作答投影由插入触发器维护，与事件是否还在热表无关）
+- 已删除用户的归档事件在每次运行时清理
+- 每批一个 BEGIN IMMEDIATE 短事务，批间休眠，避免长时间阻塞在线写入
+"""
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List
+
+ARCHIVE_SCHEMA = 'answer_archive'
+PARTITION_PREFIX = 'answer_events_'
+
+
+class AnswerEventArchiveService:
+    """答题事件归档服务"""
+
+    @staticmethod
+    def open_connection(db_path: str, archive_db_path: str) -> sqlite3.Connection:
+        """
+        打开独立连接并挂载归档库（后台任务/命令行使用，不依赖请求上下文）
+
+        Returns:
+            数据库连接（autocommit 模式，事务由调用方显式控制）
+        """
+        os.makedirs(os.path.dirname(archive_db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_db_path,))
+        return conn
+
+    @staticmethod
+    def partitions(conn) -> List[str]:
+        """归档库中的分表名（按月份升序）"""
+        rows = conn.execute(
+            f"SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type='table' AND name LIKE ? ORDER BY name",
+            (PARTITION_PREFIX + '%',)
+        ).fetchall()
+        return [r[0] for r in rows if r[0][len(PARTITION_PREFIX):].isdigit()]
+
+    @staticmethod
+    def _ensure_partition(conn, month: str) -> str:
+        table = f'{PARTITION_PREFIX}{month}'
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table} (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                is_correct INTEGER NOT NULL,
+                answered_at DATETIME NOT NULL
+            )
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_{table}_user ON {table}(user_id, answered_at)')
+        return table
+
+    @staticmethod
+    def _archive_batch(conn, cutoff: str, batch_size: int) -> int:
+        """归档一批事件，返回实际移动条数（单个短事务）"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                '''
+                SELECT id, user_id, question_id, is_correct, answered_at, strftime('%Y%m', answered_at) AS month
+                FROM answer_events
+                WHERE answered_at < ?
+                ORDER BY answered_at
+                LIMIT ?
+                ''',
+                (cutoff, batch_size)
+            ).fetchall()
+            if not rows:
+                conn.execute('COMMIT')
+                return 0
+
+            by_month: Dict[str, List[tuple]] = {}
+            for r in rows:
+                by_month.setdefault(r['month'] or '000000', []).append(
+                    (r['id'], r['user_id'], r['question_id'], r['is_correct'], r['answered_at'])
+                )
+            for month, values in by_month.items():
+                table = AnswerEventArchiveService._ensure_partition(conn, month)
+                conn.executemany(
+                    f'INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.{table} '
+                    '(id, user_id, question_id, is_correct, answered_at) VALUES (?, ?, ?, ?, ?)',
+                    values
+                )
+            ids = [r['id'] for r in rows]
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(f'DELETE FROM answer_events WHERE id IN ({placeholders})', ids)
+            conn.execute('COMMIT')
+            return len(rows)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def purge_deleted_users(conn) -> int:
+        """删除归档库中已删除用户的事件，返回删除条数"""
+        total = 0
+        for table in AnswerEventArchiveService.partitions(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cur = conn.execute(
+                    f'DELETE FROM {ARCHIVE_SCHEMA}.{table} '
+                    'WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = user_id)'
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            total += max(cur.rowcount, 0)
+        return total
+
+    @staticmethod
+    def run(db_path: str, archive_db_path: str, hot_months: int,
+            batch_size: int = 1000, pause: float = 0.0, should_stop=None) -> Dict[str, Any]:
+        """
+        执行一轮归档
+
+        Args:
+            db_path: 主库路径
+            archive_db_path: 归档库路径
+            hot_months: 热表保留的自然月数（含当月，>=1）
+            batch_size: 每批条数
+            pause: 批间休眠秒数
+            should_stop: 可选回调，返回 True 时中止（后台任务停止时）
+
+        Returns:
+            {'archived': 归档条数, 'purged': 清理的已删除用户事件数, 'partitions': 归档分表数}
+        """
+        conn = AnswerEventArchiveService.open_connection(db_path, archive_db_path)
+        try:
+            cutoff = conn.execute(
+                "SELECT datetime('now', 'start of month', ?)", (f'-{max(int(hot_months), 1) - 1} months',)
+            ).fetchone()[0]
+            archived = 0
+            while True:
+                if should_stop and should_stop():
+                    break
+                moved = AnswerEventArchiveService._archive_batch(conn, cutoff, batch_size)
+                archived += moved
+                if moved < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+            purged = AnswerEventArchiveService.purge_deleted_users(conn)
+            return {
+                'archived': archived,
+                'purged': purged,
+                'partitions': len(AnswerEventArchiveService.partitions(conn)),
+            }
+        finally:
+            conn.close()
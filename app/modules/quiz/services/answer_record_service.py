@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+答题结果记录（/api/record_result 热路径）
+
+每次作答在一个 BEGIN IMMEDIATE 短事务内完成，语句数固定：
+- 刷题限制：配置取自进程内缓存（get_quiz_limit_config）；计数 UPSERT 带条件
+  （total_answered < 限制数时才 +1），检查与递增合并为一条语句，并发请求也不会超出限制
+- 错题本：答错 UPSERT wrong_count，答对 DELETE
+- 答题记录：追加一条 answer_events（只追加，保留完整历史），由触发器维护 user_answers 中
+  每个用户每题的最新作答
+
+批量记录（/api/record_results，前端答题队列定时/页面卸载时提交）同样是一个事务：
+刷题限制只读取、累加一次，错题本按题目合并、答题事件按作答时间顺序 executemany。
+"""
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.utils.subject_permissions import get_quiz_limit_config
+
+
+# 单次批量提交的最大答题数
+RECORD_BATCH_MAX = 200
+
+_SQLITE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class QuizLimitReached(Exception):
+    """已达到刷题限制"""
+
+    def __init__(self, current_count: int, limit_count: int):
+        super().__init__(f"已达到刷题限制（{limit_count}题），请付费或联系管理员")
+        self.current_count = current_count
+        self.limit_count = limit_count
+
+
+class AnswerRecordService:
+    """答题结果记录"""
+
+    @staticmethod
+    def _count_answer(conn: sqlite3.Connection, uid: int, limit_count: int) -> None:
+        """刷题数 +1；已达到限制时抛出 QuizLimitReached（需在事务内调用）"""
+        if limit_count > 0:
+            cur = conn.execute(
+                '''
+                INSERT INTO user_quiz_stats (user_id, total_answered) VALUES (?, 1)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    total_answered = total_answered + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE total_answered < ?
+                ''',
+                (uid, limit_count)
+            )
+            if cur.rowcount > 0:
+                return
+        row = conn.execute('SELECT total_answered FROM user_quiz_stats WHERE user_id = ?', (uid,)).fetchone()
+        raise QuizLimitReached(row[0] if row else 0, limit_count)
+
+    @staticmethod
+    def record(conn: sqlite3.Connection, uid: int, question_id: int, is_correct: bool,
+               is_admin: bool = False) -> str:
+        """
+        记录一次答题结果（单个 BEGIN IMMEDIATE 事务，成功时提交）
+
+        Args:
+            conn: 数据库连接
+            uid: 用户ID
+            question_id: 题目ID
+            is_correct: 是否答对
+            is_admin: 是否管理员（管理员不受刷题限制、不计数）
+
+        Returns:
+            'added_mistake' 或 'removed_mistake'
+
+        Raises:
+            QuizLimitReached: 已达到刷题限制（事务已回滚）
+            sqlite3.Error: 写入失败（事务已回滚）
+        """
+        limit_enabled, limit_count = get_quiz_limit_config()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if limit_enabled and not is_admin:
+                AnswerRecordService._count_answer(conn, uid, limit_count)
+
+            if is_correct:
+                # 答对了，从错题本中移除
+                conn.execute('DELETE FROM mistakes WHERE user_id = ? AND question_id = ?', (uid, question_id))
+                action = 'removed_mistake'
+            else:
+                # 更新错题本（只记录错误题目）
+                conn.execute(
+                    '''
+                    INSERT INTO mistakes (user_id, question_id, wrong_count) VALUES (?, ?, 1)
+                    ON CONFLICT(user_id, question_id) DO UPDATE SET wrong_count = wrong_count + 1
+                    ''',
+                    (uid, question_id)
+                )
+                action = 'added_mistake'
+
+            # 追加答题事件（触发器同步更新 user_answers 中该题的最新作答）
+            conn.execute(
+                'INSERT INTO answer_events (user_id, question_id, is_correct) VALUES (?, ?, ?)',
+                (uid, question_id, 1 if is_correct else 0)
+            )
+            conn.execute('COMMIT')
+            return action
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def parse_answered_at(value: Any, now: datetime) -> str:
+        """
+        客户端作答时间 -> SQLite 时间文本（UTC）
+
+        支持毫秒时间戳（Date.now()）与 ISO 8601 文本；无法解析时使用服务器时间，晚于服务器时间的按服务器时间记录
+        """
+        answered = None
+        try:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                answered = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+            elif isinstance(value, str) and value:
+                answered = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                if answered.tzinfo is None:
+                    answered = answered.replace(tzinfo=timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            answered = None
+        if answered is None or answered > now:
+            answered = now
+        return answered.astimezone(timezone.utc).strftime(_SQLITE_TIME_FORMAT)
+
+    @staticmethod
+    def record_many(conn: sqlite3.Connection, uid: int, items: List[Dict[str, Any]],
+                    is_admin: bool = False) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        批量记录答题结果（单个 BEGIN IMMEDIATE 事务）
+
+        按作答时间先后处理：同一题多次作答时错题本与逐条记录的结果一致，每次作答都追加答题事件；
+        早于已有答题记录的离线作答不改变错题本；开启刷题限制时只接受剩余额度内的前若干条
+
+        Args:
+            conn: 数据库连接
+            uid: 用户ID
+            items: [{'question_id': int, 'is_correct': bool, 'answered_at': 毫秒时间戳/ISO 文本（可选）}]
+            is_admin: 是否管理员（管理员不受刷题限制、不计数）
+
+        Returns:
+            (与 items 一一对应的结果列表, 剩余刷题额度（不限制时为 None）)
+            结果项：{'question_id', 'status': 'success', 'action'} 或
+                   {'question_id', 'status': 'error', 'code', 'message'}
+
+        Raises:
+            sqlite3.Error: 写入失败（事务已回滚）
+        """
+        limit_enabled, limit_count = get_quiz_limit_config()
+        limited = limit_enabled and not is_admin
+        now = datetime.now(timezone.utc)
+        results: List[Dict[str, Any]] = [None] * len(items)
+        question_ids = sorted({item['question_id'] for item in items})
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 题目ID -> 已有答题记录的时间（早于该时间的离线作答只记入历史并计数，不改变错题本与最新作答）
+            latest: Dict[int, str] = {}
+            for start in range(0, len(question_ids), 500):
+                chunk = question_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                latest.update((row[0], row[1] or '') for row in conn.execute(
+                    f'''
+                    SELECT q.id, ua.created_at FROM questions q
+                    LEFT JOIN user_answers ua ON ua.user_id = ? AND ua.question_id = q.id
+                    WHERE q.id IN ({placeholders})
+                    ''',
+                    [uid, *chunk]
+                ).fetchall())
+
+            allowed = None
+            if limited:
+                row = conn.execute('SELECT total_answered FROM user_quiz_stats WHERE user_id = ?', (uid,)).fetchone()
+                current_count = row[0] if row else 0
+                allowed = max(limit_count - current_count, 0)
+
+            # 按作答时间排序（时间相同保持提交顺序）
+            ordered = sorted(
+                ((AnswerRecordService.parse_answered_at(item.get('answered_at'), now), index, item)
+                 for index, item in enumerate(items)),
+                key=lambda entry: (entry[0], entry[1])
+            )
+            accepted = 0
+            events: List[Tuple[int, int, int, str]] = []
+            # 题目ID -> [本批是否有答对, 最后一次答对之后的答错次数]
+            merged: Dict[int, List[Any]] = {}
+            for answered_at, index, item in ordered:
+                qid = item['question_id']
+                if qid not in latest:
+                    results[index] = {'question_id': qid, 'status': 'error', 'code': 'NOT_FOUND', 'message': '题目不存在'}
+                    continue
+                if allowed is not None and accepted >= allowed:
+                    results[index] = {
+                        'question_id': qid, 'status': 'error', 'code': 'QUIZ_LIMIT_REACHED',
+                        'message': f"已达到刷题限制（{limit_count}题），请付费或联系管理员"
+                    }
+                    continue
+                accepted += 1
+                events.append((uid, qid, 1 if item['is_correct'] else 0, answered_at))
+                results[index] = {
+                    'question_id': qid, 'status': 'success',
+                    'action': 'removed_mistake' if item['is_correct'] else 'added_mistake'
+                }
+                if answered_at < latest[qid]:
+                    continue
+                state = merged.setdefault(qid, [False, 0])
+                if item['is_correct']:
+                    state[0] = True
+                    state[1] = 0
+                else:
+                    state[1] += 1
+
+            if merged:
+                # 错题本：本批答对过的题先移除，再累加最后一次答对之后的答错次数
+                conn.executemany(
+                    'DELETE FROM mistakes WHERE user_id = ? AND question_id = ?',
+                    [(uid, qid) for qid, state in merged.items() if state[0]]
+                )
+                conn.executemany(
+                    '''
+                    INSERT INTO mistakes (user_id, question_id, wrong_count) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, question_id) DO UPDATE SET wrong_count = wrong_count + excluded.wrong_count
+                    ''',
+                    [(uid, qid, state[1]) for qid, state in merged.items() if state[1]]
+                )
+            # 追加答题事件（按作答时间顺序；触发器只让更晚的作答覆盖 user_answers）
+            conn.executemany(
+                'INSERT INTO answer_events (user_id, question_id, is_correct, answered_at) VALUES (?, ?, ?, ?)',
+                events
+            )
+            if limited and accepted:
+                conn.execute(
+                    '''
+                    INSERT INTO user_quiz_stats (user_id, total_answered) VALUES (?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        total_answered = total_answered + excluded.total_answered,
+                        updated_at = CURRENT_TIMESTAMP
+                    ''',
+                    (uid, accepted)
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        return results, (allowed - accepted if allowed is not None else None)
+
+    @staticmethod
+    def limit_error_payload(exc: QuizLimitReached) -> Dict[str, Any]:
+        """刷题限制错误响应体（与原 check_quiz_limit 分支一致）"""
+        return {
+            'status': 'error',
+            'message': str(exc),
+            'code': 'QUIZ_LIMIT_REACHED',
+            'data': {
+                'current_count': exc.current_count,
+                'limit_count': exc.limit_count,
+                'contact_admin_url': '/contact_admin'
+            }
+        }
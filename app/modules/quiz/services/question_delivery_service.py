@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+刷题页题目分批下发
+
+/quiz 页面只查询有序的题目 ID 列表（附带题型与题干前缀供题目列表使用），
+并完整渲染前 QUIZ_WINDOW_SIZE 道题；其余题目渲染为占位，由前端在切到附近时
+按 ID 调用 /api/quiz/questions 批量获取。题目内容取自题目载荷缓存（question_payload），
+这里只补充用户相关字段并按需打乱选项。
+
+- 题目顺序：与原先一次性加载时的查询保持相同的连接与过滤条件；打乱模式下沿用 user_progress_orders 中保存的顺序（种子顺序按需重算）
+- 权限：批量接口按与页面相同的规则过滤（锁定科目、用户被限制的科目），无权访问的 ID 直接忽略
+- 考试模式题量有限且交卷需要读取全部作答，仍一次性完整渲染
+"""
+import random
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core.utils import progress_store, question_payload, seeded_order
+
+# 首屏完整渲染的题目数
+QUIZ_WINDOW_SIZE = 20
+# 前端每批请求的题目数（也是批量接口单次允许的 ID 数上限）
+QUIZ_BATCH_SIZE = 50
+# 题目列表（侧边栏）显示的题干前缀长度
+TITLE_PREVIEW_LENGTH = 40
+
+
+def progress_key(uid: int, mode: str, subject: str, q_type: str, target: str,
+                 shuffle_questions: bool, shuffle_options: bool) -> str:
+    """进度 key（与前端 progressKey() 保持一致）"""
+    data_scope = target if target in ('favorites', 'mistakes') else 'all'
+    key_parts = [
+        f"quiz_progress_{uid}",
+        mode,
+        subject,
+        q_type,
+        data_scope,
+        f"q{1 if shuffle_questions else 0}",
+        f"o{1 if shuffle_options else 0}"
+    ]
+    return "_".join(key_parts)
+
+
+def _subject_filter(sql: str, params: List[Any], accessible_subject_ids: Optional[List[int]]) -> str:
+    if accessible_subject_ids is not None:
+        placeholders = ','.join(['?'] * len(accessible_subject_ids))
+        sql += f" AND q.subject_id IN ({placeholders})"
+        params.extend(accessible_subject_ids)
+    return sql
+
+
+class QuestionDeliveryService:
+    """刷题页题目分批下发"""
+
+    @staticmethod
+    def prepare_question(payload: Dict[str, Any], extra: Dict[str, Any], uid: int,
+                         shuffle_options: bool) -> Dict[str, Any]:
+        """
+        题目载荷 + 用户相关字段 -> 模板数据（按需打乱选项）
+
+        Args:
+            payload: 题目载荷（question_payload.get_payloads 返回的共享对象，不会被修改）
+            extra: 用户相关字段（subject、is_fav、is_mistake 等）
+            uid: 用户ID（未登录为 -1）
+            shuffle_options: 是否打乱选项
+        """
+        q = dict(payload)
+        q.update(extra)
+
+        # 打乱选项顺序（使用确定性随机，确保同一用户同一题目的选项顺序一致）
+        if shuffle_options and q['options'] and q.get('q_type') in ('选择题', '多选题'):
+            q['options'] = [dict(opt) for opt in q['options']]
+
+            # 1. 保存原始正确答案的文本
+            orig_answer_keys = str(q.get('answer') or '')
+            correct_texts = []
+            options_map = {opt['key']: opt['value'] for opt in q['options']}
+            for key in orig_answer_keys:
+                if key in options_map:
+                    correct_texts.append(options_map[key])
+
+            # 2. 使用确定性随机打乱选项
+            # 种子 = 用户ID + 题目ID，确保同一用户同一题目的选项顺序永远一致
+            shuffle_seed = (uid if uid != -1 else 0) * 1000000 + q['id']
+            rng = random.Random(shuffle_seed)
+            rng.shuffle(q['options'])
+
+            # 3. 根据打乱后的顺序，重新分配 A,B,C,D 并找到新答案
+            abcd = 'ABCD'
+            new_answer_keys = []
+            for i, option in enumerate(q['options']):
+                if i < len(abcd):
+                    option['key'] = abcd[i]  # 重新分配key
+                    if option['value'] in correct_texts:
+                        new_answer_keys.append(option['key'])
+
+            # 4. 更新答案
+            q['answer'] = ''.join(sorted(new_answer_keys))
+        return q
+
+    @staticmethod
+    def list_refs(conn, uid: int, target: str, subject: str, q_type: str,
+                  accessible_subject_ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+        """
+        刷题/背题/收藏/错题模式下的题目列表（只取 ID、题型与题干前缀）
+
+        连接与过滤条件与原先的整行查询一致，因此未打乱时的题目顺序不变
+
+        Returns:
+            [{'id', 'q_type', 'title'}, ...]
+        """
+        columns = f'q.id, q.q_type, SUBSTR(q.content, 1, {TITLE_PREVIEW_LENGTH}) AS title'
+        if target == 'favorites':
+            # 收藏模式（过滤掉锁定科目和被限制科目的题目）
+            sql = f"""
+                SELECT {columns}
+                FROM favorites f
+                JOIN questions q ON f.question_id = q.id
+                LEFT JOIN subjects s ON q.subject_id = s.id
+                WHERE f.user_id = ? AND (s.is_locked=0 OR s.is_locked IS NULL)
+            """
+            params: List[Any] = [uid]
+        elif target == 'mistakes':
+            # 错题模式（过滤掉锁定科目和被限制科目的题目）
+            sql = f"""
+                SELECT {columns}
+                FROM mistakes m
+                JOIN questions q ON m.question_id = q.id
+                LEFT JOIN subjects s ON q.subject_id = s.id
+                WHERE m.user_id = ? AND (s.is_locked=0 OR s.is_locked IS NULL)
+            """
+            params = [uid]
+        else:
+            # 普通刷题/背题模式（过滤掉锁定科目和被限制科目的题目）
+            sql = f"""
+                SELECT {columns}
+                FROM questions q
+                LEFT JOIN subjects s ON q.subject_id = s.id
+                WHERE (s.is_locked=0 OR s.is_locked IS NULL)
+            """
+            params = []
+            if accessible_subject_ids is None and uid == -1:
+                # 未登录用户：返回空结果
+                sql += " AND 1=0"
+
+        sql = _subject_filter(sql, params, accessible_subject_ids)
+        if subject != 'all':
+            sql += " AND s.name = ?"
+            params.append(subject)
+        if q_type != 'all':
+            sql += " AND q.q_type = ?"
+            params.append(q_type)
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    @staticmethod
+    def list_exam_questions(conn, uid: int, exam_id: int, shuffle_options: bool) -> List[Dict[str, Any]]:
+        """考试模式：按 order_index 返回全部考试题目（完整数据）"""
+        sql = """
+            SELECT q.id, s.name as subject, eq.user_answer, eq.score_val,
+                   CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as is_fav,
+                   CASE WHEN m.id IS NOT NULL THEN 1 ELSE 0 END as is_mistake
+            FROM exam_questions eq
+            JOIN questions q ON eq.question_id = q.id
+            LEFT JOIN subjects s ON q.subject_id = s.id
+            LEFT JOIN favorites f ON q.id = f.question_id AND f.user_id = ?
+            LEFT JOIN mistakes m ON q.id = m.question_id AND m.user_id = ?
+            WHERE eq.exam_id = ?
+            ORDER BY eq.order_index
+        """
+        rows = conn.execute(sql, (uid, uid, exam_id)).fetchall()
+        payloads = question_payload.get_payloads(conn, [row['id'] for row in rows])
+        return [
+            QuestionDeliveryService.prepare_question(payloads[row['id']], dict(row), uid, shuffle_options)
+            for row in rows if row['id'] in payloads
+        ]
+
+    @staticmethod
+    def load_questions(conn, uid: int, ids: Iterable[int], shuffle_options: bool,
+                       accessible_subject_ids: Optional[List[int]]) -> Dict[int, Dict[str, Any]]:
+        """
+        按 ID 批量读取题目完整数据（已处理为模板数据）
+
+        Args:
+            conn: 数据库连接
+            uid: 用户ID
+            ids: 题目ID列表
+            shuffle_options: 是否打乱选项
+            accessible_subject_ids: 可访问的科目ID（None 表示不限制）
+
+        Returns:
+            {题目ID: 题目数据}；锁定/无权访问/不存在的题目不包含在内
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        placeholders = ','.join(['?'] * len(ids))
+        sql = f"""
+            SELECT q.id, s.name as subject,
+                   CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as is_fav,
+                   CASE WHEN m.id IS NOT NULL THEN 1 ELSE 0 END as is_mistake
+            FROM questions q
+            LEFT JOIN subjects s ON q.subject_id = s.id
+            LEFT JOIN favorites f ON q.id = f.question_id AND f.user_id = ?
+            LEFT JOIN mistakes m ON q.id = m.question_id AND m.user_id = ?
+            WHERE q.id IN ({placeholders}) AND (s.is_locked=0 OR s.is_locked IS NULL)
+        """
+        params: List[Any] = [uid, uid, *ids]
+        sql = _subject_filter(sql, params, accessible_subject_ids)
+        rows = conn.execute(sql, params).fetchall()
+        payloads = question_payload.get_payloads(conn, [row['id'] for row in rows])
+        return {
+            row['id']: QuestionDeliveryService.prepare_question(payloads[row['id']], dict(row), uid, shuffle_options)
+            for row in rows if row['id'] in payloads
+        }
+
+    @staticmethod
+    def apply_saved_order(conn, uid: int, p_key: str, refs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        打乱模式：按 user_progress_orders 中保存的顺序排列；没有保存的顺序时选定新的种子并写回
+
+        种子顺序按需重算（见 seeded_order）；显式顺序（旧版进度）中新增的题目追加在末尾，已不在列表中的 ID 忽略
+        """
+        try:
+            saved = progress_store.get_order(conn, uid, p_key)
+        except Exception:
+            saved = None
+
+        if saved and 'seed' in saved:
+            return seeded_order.arrange(saved['seed'], saved['bank_version'], refs, lambda ref: ref['id'])
+
+        if saved:
+            # 如果有已保存的显式顺序，则按此顺序排序
+            ref_map = {ref['id']: ref for ref in refs}
+            ordered = []
+            for qid in saved['ids']:
+                if qid in ref_map:
+                    ordered.append(ref_map.pop(qid))
+            # 追加剩余的题目（如果有新增题目）
+            ordered.extend(ref_map.values())
+            return ordered
+
+        # 否则，选定新的种子并保存（只写两个整数，不改动进度数据）
+        seed = seeded_order.new_seed()
+        version = seeded_order.bank_version(conn)
+        if uid != -1:
+            progress_store.set_seed(conn, uid, p_key, seed, version)
+            conn.commit()
+        return seeded_order.arrange(seed, version, refs, lambda ref: ref['id'])
+
+    @staticmethod
+    def build_window(conn, uid: int, refs: List[Dict[str, Any]], shuffle_options: bool,
+                     accessible_subject_ids: Optional[List[int]],
+                     window_size: int = QUIZ_WINDOW_SIZE) -> List[Dict[str, Any]]:
+        """
+        有序题目列表 -> 页面题目列表：前 window_size 道为完整数据，其余标记 pending（前端按需加载）
+        """
+        head = QuestionDeliveryService.load_questions(
+            conn, uid, [ref['id'] for ref in refs[:window_size]], shuffle_options, accessible_subject_ids
+        )
+        questions = []
+        for index, ref in enumerate(refs):
+            q = head.get(ref['id']) if index < window_size else None
+            if q is None:
+                q = dict(ref, pending=True)
+            else:
+                q['title'] = ref['title']
+            questions.append(q)
+        return questions
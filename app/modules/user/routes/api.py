@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 """用户API路由"""
-from flask import Blueprint, request, jsonify, session, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, session, current_app
 from werkzeug.security import check_password_hash, generate_password_hash
 from app.core.utils.database import get_db
-from datetime import datetime, timedelta
+from app.core.utils import blob_store, question_counts
+from app.core.utils import user_stats as learning_stats
+from app.core.utils.file_serving import send_upload
 import os
-import uuid
 
 user_api_bp = Blueprint('user_api', __name__)
 
@@ -18,41 +19,6 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def calculate_streak_days(conn, user_id):
-    """计算连续学习天数"""
-    try:
-        # 获取最近的答题日期
-        rows = conn.execute(
-            '''SELECT DISTINCT DATE(created_at) as date
-               FROM user_answers
-               WHERE user_id = ?
-               ORDER BY date DESC
-               LIMIT 100''',
-            (user_id,)
-        ).fetchall()
-        
-        if not rows:
-            return 0
-        
-        dates = [datetime.strptime(r['date'], '%Y-%m-%d').date() for r in rows]
-        today = datetime.now().date()
-        
-        # 如果最近一次答题不是今天或昨天，连续天数为0
-        if dates[0] < today - timedelta(days=1):
-            return 0
-        
-        streak = 1
-        for i in range(1, len(dates)):
-            if dates[i-1] - dates[i] == timedelta(days=1):
-                streak += 1
-            else:
-                break
-        
-        return streak
-    except:
-        return 0
-
-
 @user_api_bp.route('/user/stats')
 def user_stats():
     """获取用户统计数据"""
@@ -70,52 +36,26 @@ def user_stats():
         ).fetchone()
         
         # 统计数据
-        total_questions = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
-        
-        favorites_count = conn.execute(
-            'SELECT COUNT(*) FROM favorites WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        mistakes_count = conn.execute(
-            'SELECT COUNT(*) FROM mistakes WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        # 答题统计
-        answered_count = conn.execute(
-            'SELECT COUNT(DISTINCT question_id) FROM user_answers WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        correct_count = conn.execute(
-            'SELECT COUNT(DISTINCT question_id) FROM user_answers WHERE user_id = ? AND is_correct = 1',
-            (uid,)
-        ).fetchone()[0]
+        total_questions = question_counts.total(conn)
         
-        # 考试统计
-        exam_count = conn.execute(
-            'SELECT COUNT(*) FROM exams WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        finished_exam_count = conn.execute(
-            'SELECT COUNT(*) FROM exams WHERE user_id = ? AND status = "finished"',
-            (uid,)
-        ).fetchone()[0]
+        # 收藏/错题/答题/考试计数（触发器维护的 user_stats，一次主键读取）
+        stats = learning_stats.summary(conn, uid)
+        answered_count = stats['answered']
+        correct_count = stats['correct']
         
         return jsonify({
             'status': 'success',
             'data': {
                 'user': dict(user) if user else None,
                 'total_questions': total_questions,
-                'favorites_count': favorites_count,
-                'mistakes_count': mistakes_count,
+                'favorites_count': stats['favorites'],
+                'mistakes_count': stats['mistakes'],
                 'answered_count': answered_count,
                 'correct_count': correct_count,
                 'accuracy': round(correct_count / answered_count * 100, 1) if answered_count > 0 else 0,
-                'exam_count': exam_count,
-                'finished_exam_count': finished_exam_count
+                'exam_count': stats['exams'],
+                # 考试交卷后状态为 submitted
+                'finished_exam_count': stats['submitted_exams']
             }
         })
     except Exception as e:
@@ -202,32 +142,17 @@ def api_profile():
         # 将Row对象转换为字典
         user = dict(user_row)
         
-        # 统计数据
-        favorites_count = conn.execute(
-            'SELECT COUNT(*) FROM favorites WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        mistakes_count = conn.execute(
-            'SELECT COUNT(*) FROM mistakes WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        # 答题统计
-        total_answered = conn.execute(
-            'SELECT COUNT(*) FROM user_answers WHERE user_id = ?',
-            (uid,)
-        ).fetchone()[0]
-        
-        correct_answered = conn.execute(
-            'SELECT COUNT(*) FROM user_answers WHERE user_id = ? AND is_correct = 1',
-            (uid,)
-        ).fetchone()[0]
+        # 统计数据（触发器维护的 user_stats）
+        stats = learning_stats.summary(conn, uid)
+        favorites_count = stats['favorites']
+        mistakes_count = stats['mistakes']
+        total_answered = stats['answered']
+        correct_answered = stats['correct']
         
         accuracy = round(correct_answered / total_answered * 100, 1) if total_answered > 0 else 0
         
-        # 计算连续学习天数
-        streak_days = calculate_streak_days(conn, uid)
+        # 连续学习天数（学习日历汇总，按用户时区的日期计算）
+        streak_days = learning_stats.activity(conn, uid)['current_streak']
         
         return jsonify({
             'status': 'success',
@@ -308,25 +233,39 @@ def stats_daily():
     conn = get_db()
     
     try:
-        # 获取最近N天的答题记录
-        rows = conn.execute(
-            '''SELECT DATE(created_at) as date, 
-                      COUNT(*) as total,
-                      SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) as correct
-               FROM user_answers 
-               WHERE user_id = ? AND created_at >= DATE('now', ?)
-               GROUP BY DATE(created_at)
-               ORDER BY date''',
-            (uid, f'-{days} days')
-        ).fetchall()
-        
-        data = [{'date': r['date'], 'total': r['total'], 'correct': r['correct']} for r in rows]
+        # 最近N天每天的作答次数（按日汇总行）
+        data = learning_stats.daily(conn, uid, days)
         
         return jsonify({'status': 'success', 'data': data})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@user_api_bp.route('/stats/calendar')
+def stats_calendar():
+    """获取学习日历（某一年每天的作答次数）与连续学习天数"""
+    if not session.get('user_id'):
+        return jsonify({'status': 'unauthorized', 'message': '请先登录'}), 401
+    
+    uid = session.get('user_id')
+    year = request.args.get('year', type=int) or learning_stats.local_today().year
+    if year < 1970 or year > 9998:
+        return jsonify({'status': 'error', 'message': '年份无效'}), 400
+    conn = get_db()
+    
+    try:
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'year': year,
+                'days': learning_stats.calendar(conn, uid, year),
+                **learning_stats.activity(conn, uid)
+            }
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @user_api_bp.route('/stats/by_subject')
 def stats_by_subject():
     """按科目统计答题情况"""
@@ -337,18 +276,7 @@ def stats_by_subject():
     conn = get_db()
     
     try:
-        rows = conn.execute(
-            '''SELECT s.name as subject,
-                      COUNT(*) as total,
-                      SUM(CASE WHEN ua.is_correct = 1 THEN 1 ELSE 0 END) as correct
-               FROM user_answers ua
-               JOIN questions q ON ua.question_id = q.id
-               LEFT JOIN subjects s ON q.subject_id = s.id
-               WHERE ua.user_id = ?
-               GROUP BY s.name
-               ORDER BY total DESC''',
-            (uid,)
-        ).fetchall()
+        rows = learning_stats.by_subject(conn, uid)
         
         data = [{'subject': r['subject'] or '未分类', 'total': r['total'], 'correct': r['correct']} for r in rows]
         
@@ -367,17 +295,7 @@ def stats_by_type():
     conn = get_db()
     
     try:
-        rows = conn.execute(
-            '''SELECT q.q_type,
-                      COUNT(*) as total,
-                      SUM(CASE WHEN ua.is_correct = 1 THEN 1 ELSE 0 END) as correct
-               FROM user_answers ua
-               JOIN questions q ON ua.question_id = q.id
-               WHERE ua.user_id = ?
-               GROUP BY q.q_type
-               ORDER BY total DESC''',
-            (uid,)
-        ).fetchall()
+        rows = learning_stats.by_type(conn, uid)
         
         data = [{'q_type': r['q_type'] or '未知', 'total': r['total'], 'correct': r['correct']} for r in rows]
         
@@ -409,37 +327,30 @@ def upload_avatar():
         return jsonify({'status': 'error', 'message': '不支持的文件类型，请上传图片文件（png, jpg, jpeg, gif, webp）'}), 400
     
     try:
-        # 生成唯一文件名
         ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"avatar_{uid}_{uuid.uuid4().hex[:8]}.{ext}"
-        
-        # 确保上传目录存在
         upload_folder = current_app.config['UPLOAD_FOLDER']
-        avatars_folder = os.path.join(upload_folder, 'avatars')
-        os.makedirs(avatars_folder, exist_ok=True)
-        
-        # 保存文件
-        filepath = os.path.join(avatars_folder, filename)
-        file.save(filepath)
-        
-        # 更新数据库
-        avatar_url = f'/uploads/avatars/{filename}'
         conn = get_db()
         
-        # 删除旧头像文件（如果存在）
+        # 保存文件（内容寻址：相同图片只存一份）
+        blob = blob_store.save_upload(conn, upload_folder, file, ext)
+        avatar_url = blob['url']
+        
+        # 释放旧头像：blob 只减引用计数（可能被其他用户共享），由 GC 回收；
+        # 旧版按 uuid 命名的文件仍直接删除
         old_avatar = conn.execute(
             'SELECT avatar FROM users WHERE id = ?',
             (uid,)
         ).fetchone()
         
         if old_avatar and old_avatar['avatar']:
-            old_path = old_avatar['avatar'].replace('/uploads/', '')
-            old_file = os.path.join(upload_folder, old_path)
-            if os.path.exists(old_file):
-                try:
-                    os.remove(old_file)
-                except:
-                    pass
+            if not blob_store.decref(conn, old_avatar['avatar']):
+                old_path = old_avatar['avatar'].replace('/uploads/', '')
+                old_file = os.path.join(upload_folder, old_path)
+                if os.path.exists(old_file):
+                    try:
+                        os.remove(old_file)
+                    except:
+                        pass
         
         # 保存新头像路径
         conn.execute(
@@ -460,7 +371,6 @@ def upload_avatar():
 @user_api_bp.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """访问上传的文件"""
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    return send_from_directory(upload_folder, filename)
+    return send_upload(filename)
 
 
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Excel 题库导入基准测试
+
+生成一个 N 行（默认 50000）的导入模板工作簿，导入到临时数据库，输出耗时与内存峰值。
+
+用法：
+    python scripts/bench_excel_import.py [--rows 50000] [--chunk-size 1000] [--trace-memory]
+
+说明：--trace-memory 使用 tracemalloc 统计 Python 内存峰值，会使导入明显变慢，耗时仅供参考
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.utils.database import _create_tables
+from app.modules.admin.services.question_import_service import QuestionImportService, SHEET_NAME
+
+HEADER = ['subject', 'q_type', 'content', 'option_A', 'option_B', 'option_C', 'option_D',
+          'answer', 'explanation', 'blank_1', 'blank_2']
+
+
+def build_workbook(path: str, rows: int) -> None:
+    """以 write_only 模式生成测试工作簿（每 1000 行夹带一行错误数据）"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_NAME)
+    ws.append(HEADER)
+    for i in range(rows):
+        subject = f'基准科目{i % 20}'
+        kind = i % 4
+        if i % 1000 == 999:
+            ws.append([subject, '未知题型', f'错误题目 {i}'])
+        elif kind == 0:
+            ws.append([subject, '选择题', f'选择题 {i}', '选项一', '选项二', '选项三', '选项四', 'B', '解析'])
+        elif kind == 1:
+            ws.append([subject, '判断题', f'判断题 {i}', '', '', '', '', '正确', ''])
+        elif kind == 2:
+            ws.append([subject, '填空题', f'填空题 {i} __ __', '', '', '', '', '', '', '答案一', '答案二'])
+        else:
+            ws.append([subject, '问答题', f'问答题 {i}', '', '', '', '', f'参考答案 {i}', ''])
+    wb.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Excel 题库导入基准测试')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--trace-memory', action='store_true', help='统计 Python 内存峰值（较慢）')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xlsx_path = os.path.join(tmp, 'bench.xlsx')
+        db_path = os.path.join(tmp, 'bench.db')
+
+        t0 = time.perf_counter()
+        build_workbook(xlsx_path, args.rows)
+        print(f'生成工作簿: {args.rows} 行, {os.path.getsize(xlsx_path) / 1024 / 1024:.1f} MB, '
+              f'{time.perf_counter() - t0:.2f}s')
+
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        _create_tables(conn)
+        # 线上库的 questions 表带有 created_by/updated_at 列，这里补齐
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(questions)')}
+        for column, ddl in (('created_by', 'INTEGER'), ('updated_at', 'DATETIME')):
+            if column not in existing:
+                conn.execute(f'ALTER TABLE questions ADD COLUMN {column} {ddl}')
+        conn.commit()
+
+        if args.trace_memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        with open(xlsx_path, 'rb') as f:
+            result = QuestionImportService.import_excel(conn, f, user_id=None, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - t0
+        peak = None
+        if args.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        count = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+        conn.close()
+
+        report = result['error_report']
+        print(f'导入完成: {result["imported_count"]} 道题（库中 {count} 道），'
+              f'错误 {report.total} 行 {report.by_code}')
+        print(f'耗时: {elapsed:.2f}s（{args.rows / elapsed:.0f} 行/秒）')
+        if peak is not None:
+            print(f'Python 内存峰值: {peak / 1024 / 1024:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+题库 Excel / 用户 CSV 导出基准测试
+
+向临时数据库写入 N 道题与 N 个用户（默认 100000），依次导出 Excel 与 CSV，
+按数据量分档输出耗时与内存峰值，用于确认导出是线性耗时、内存有界的。
+
+用法：
+    python scripts/bench_export.py [--rows 100000] [--steps 4] [--trace-memory]
+
+说明：--trace-memory 使用 tracemalloc 统计 Python 内存峰值，会使导出明显变慢，耗时仅供参考
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.utils.database import _create_tables
+from app.modules.admin.services.question_export_service import QuestionExportService
+from app.modules.admin.services.user_export_service import UserExportService
+
+
+def seed(conn: sqlite3.Connection, start: int, end: int) -> None:
+    """写入 id 在 [start, end) 的题目与用户"""
+    conn.executemany(
+        'INSERT INTO questions (id, subject_id, content, q_type, options, answer, explanation) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (
+            (i, i % 20 + 1, f'基准题目 {i} ' + '内容' * 20,
+             '填空题' if i % 4 == 0 else '选择题',
+             None if i % 4 == 0 else '["A. 选项一", "B. 选项二", "C. 选项三", "D. 选项四"]',
+             '答案一;;答案二' if i % 4 == 0 else 'B',
+             '解析' * 10)
+            for i in range(start + 1, end + 1)
+        )
+    )
+    conn.executemany(
+        'INSERT INTO users (id, username, password_hash, is_admin) VALUES (?, ?, ?, 0)',
+        ((i, f'bench_user_{i}', 'x') for i in range(start + 1, end + 1))
+    )
+    conn.commit()
+
+
+def measure(func, trace_memory: bool):
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='题库 Excel / 用户 CSV 导出基准测试')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--steps', type=int, default=4, help='按数据量分几档测量')
+    parser.add_argument('--trace-memory', action='store_true', help='统计 Python 内存峰值（较慢）')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.row_factory = sqlite3.Row
+        _create_tables(conn)
+        conn.executemany('INSERT INTO subjects (id, name) VALUES (?, ?)',
+                         ((i, f'基准科目{i}') for i in range(1, 21)))
+        conn.commit()
+
+        seeded = 0
+        for step in range(1, args.steps + 1):
+            target = args.rows * step // args.steps
+            seed(conn, seeded, target)
+            seeded = target
+
+            xlsx_path = os.path.join(tmp, 'export.xlsx')
+            count, excel_time, excel_peak = measure(
+                lambda: QuestionExportService.write_excel(conn, None, 'all', xlsx_path), args.trace_memory)
+
+            csv_path = os.path.join(tmp, 'users.csv')
+
+            def export_csv():
+                with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+                    for chunk in UserExportService.iter_csv(conn):
+                        f.write(chunk)
+
+            _, csv_time, csv_peak = measure(export_csv, args.trace_memory)
+
+            line = (f'{target:>8} 行 | Excel {excel_time:6.2f}s（{count / excel_time:,.0f} 行/秒, '
+                    f'{os.path.getsize(xlsx_path) / 1024 / 1024:.1f} MB） | '
+                    f'CSV {csv_time:6.2f}s（{target / csv_time:,.0f} 行/秒）')
+            if args.trace_memory:
+                line += f' | 内存峰值 Excel {excel_peak / 1024 / 1024:.1f} MB, CSV {csv_peak / 1024 / 1024:.1f} MB'
+            print(line)
+
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+答题结果记录（/api/record_result）写入基准测试
+
+在临时数据库上分别运行原实现的语句序列（legacy）与 AnswerRecordService.record（current），
+输出每秒记录的答题数。每个工作线程使用独立的应用上下文与数据库连接，模拟多个请求并发写入。
+
+用法：
+    python scripts/bench_record_result.py [--answers 5000] [--threads 1 4] [--users 50] [--no-limit] [--no-sync]
+
+说明：默认开启刷题限制（限制数足够大，不会触发），这是原实现读取配置最多的情况；
+每次答题都要提交一次事务，磁盘同步延迟通常占大头，--no-sync 可单独比较语句开销
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS = 2000
+
+
+def legacy_record(conn, uid, question_id, is_correct):
+    """原实现的语句序列：check_quiz_limit、错题本、DELETE + INSERT 答题记录、increment_user_quiz_count"""
+    def config_value(key):
+        return conn.execute('SELECT config_value FROM system_config WHERE config_key = ?', (key,)).fetchone()
+
+    def limited_user():
+        enabled = config_value('quiz_limit_enabled')
+        if not enabled or enabled['config_value'] != '1':
+            return False
+        user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (uid,)).fetchone()
+        return not (user and user['is_admin'])
+
+    # check_quiz_limit
+    if limited_user():
+        stats = conn.execute('SELECT total_answered FROM user_quiz_stats WHERE user_id = ?', (uid,)).fetchone()
+        limit_count = int(config_value('quiz_limit_count')['config_value'])
+        if (stats['total_answered'] if stats else 0) >= limit_count:
+            return
+    if not is_correct:
+        conn.execute(
+            'INSERT INTO mistakes (user_id, question_id, wrong_count) VALUES (?, ?, 1) '
+            'ON CONFLICT(user_id, question_id) DO UPDATE SET wrong_count = wrong_count + 1',
+            (uid, question_id)
+        )
+    else:
+        conn.execute('DELETE FROM mistakes WHERE user_id = ? AND question_id = ?', (uid, question_id))
+    conn.execute('DELETE FROM user_answers WHERE user_id = ? AND question_id = ?', (uid, question_id))
+    conn.execute(
+        'INSERT INTO user_answers (user_id, question_id, is_correct, created_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+        (uid, question_id, 1 if is_correct else 0)
+    )
+    # increment_user_quiz_count（原实现在函数内提交）
+    if limited_user():
+        if conn.execute('SELECT id FROM user_quiz_stats WHERE user_id = ?', (uid,)).fetchone():
+            conn.execute(
+                'UPDATE user_quiz_stats SET total_answered = total_answered + 1, updated_at = CURRENT_TIMESTAMP '
+                'WHERE user_id = ?', (uid,)
+            )
+        else:
+            conn.execute('INSERT INTO user_quiz_stats (user_id, total_answered) VALUES (?, 1)', (uid,))
+        conn.commit()
+    conn.commit()
+
+
+def current_record(conn, uid, question_id, is_correct):
+    from app.modules.quiz.services.answer_record_service import AnswerRecordService
+    AnswerRecordService.record(conn, uid, question_id, is_correct)
+
+
+def seed(conn, users, limit_enabled):
+    conn.executemany('INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                     ((i, f'bench{i}', 'x') for i in range(1, users + 1)))
+    conn.execute("INSERT INTO subjects (id, name) VALUES (1, '基准科目')")
+    conn.executemany('INSERT INTO questions (id, subject_id, content, q_type, answer) VALUES (?, 1, ?, ?, ?)',
+                     ((i, f'题目{i}', '判断题', '正确') for i in range(1, QUESTIONS + 1)))
+    conn.executemany('INSERT OR REPLACE INTO system_config (config_key, config_value) VALUES (?, ?)',
+                     (('quiz_limit_enabled', '1' if limit_enabled else '0'), ('quiz_limit_count', '100000000')))
+    conn.commit()
+
+
+def run(app, record, answers, threads, users, no_sync):
+    from app.core.utils.database import get_db
+
+    per_thread = answers // threads
+    errors = []
+
+    def worker(index):
+        rnd = random.Random(index)
+        with app.app_context():
+            conn = get_db()
+            if no_sync:
+                conn.execute('PRAGMA synchronous = OFF')
+            try:
+                for _ in range(per_thread):
+                    record(conn, rnd.randint(1, users), rnd.randint(1, QUESTIONS), rnd.random() < 0.7)
+            except Exception as e:  # 锁等待超时等
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='答题结果记录写入基准测试')
+    parser.add_argument('--answers', type=int, default=5000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--no-limit', action='store_true', help='关闭刷题限制')
+    parser.add_argument('--no-sync', action='store_true', help='关闭同步写盘（排除磁盘延迟，只比较语句开销）')
+    args = parser.parse_args()
+
+    from flask import Flask
+    from app.core.utils.database import get_db, init_db
+    from app.core.utils.subject_permissions import invalidate_quiz_limit_config
+
+    # 只需要应用上下文（get_db / 配置缓存），不创建完整应用（避免启动后台任务）
+    app = Flask(__name__)
+    for threads in args.threads:
+        for name, record in (('legacy', legacy_record), ('current', current_record)):
+            with tempfile.TemporaryDirectory() as tmp:
+                app.config['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+                with app.app_context():
+                    init_db()
+                    seed(get_db(), args.users, not args.no_limit)
+                invalidate_quiz_limit_config()
+                rate, errors = run(app, record, args.answers, threads, args.users, args.no_sync)
+            line = f'{name:>8} | 线程 {threads:>2} | {rate:8,.0f} 次/秒'
+            if errors:
+                line += f' | 失败 {len(errors)} 个线程: {errors[0]}'
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+学习统计时区偏移切换检查
+
+在临时数据库上按旧偏移写入答题事件并模拟归档（从热表删除较早的事件，每日作答次数不扣减），
+再切换 STATS_UTC_OFFSET_HOURS 重新初始化数据库，检查：
+- 每日作答次数的总和仍等于全部作答次数（已归档的不丢失，热表事件不重复计入）
+- 随后执行 `flask stats rebuild` 不改变 user_daily_stats / user_activity
+
+场景：偏移 0 -> 8 -> 0，以及旧版本按 UTC 日期分桶（触发器没有日期修饰符）-> 8
+
+用法：
+    python scripts/check_stats_offset.py
+"""
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (user_id, UTC 作答时间, 是否已归档)
+EVENTS = [
+    (101, '2026-10-09 22:00:00', True),
+    (101, '2026-10-10 01:00:00', True),
+    (101, '2026-10-10 20:00:00', False),
+    (101, '2026-10-11 03:00:00', False),
+    (101, '2026-10-12 18:00:00', False),
+    (102, '2026-10-10 23:30:00', False),
+    (102, '2026-10-11 16:30:00', False),
+]
+
+# 旧版本的每日作答次数触发器（按 UTC 日期分桶）
+LEGACY_EVENTS_TRIGGER = '''
+    CREATE TRIGGER trg_user_stats_events_ai AFTER INSERT ON answer_events BEGIN
+        INSERT INTO user_daily_stats (user_id, day, answered, correct)
+        VALUES (new.user_id, DATE(new.answered_at), 1, (IFNULL(new.is_correct, 0) = 1))
+        ON CONFLICT(user_id, day) DO UPDATE SET answered = answered + 1, correct = correct + excluded.correct;
+    END
+'''
+
+
+def snapshot(conn):
+    daily = conn.execute(
+        'SELECT user_id, day, answered, correct FROM user_daily_stats ORDER BY user_id, day'
+    ).fetchall()
+    activity = conn.execute(
+        'SELECT user_id, first_day, last_day, current_streak, longest_streak, active_days '
+        'FROM user_activity ORDER BY user_id'
+    ).fetchall()
+    return [tuple(r) for r in daily], [tuple(r) for r in activity]
+
+
+def check_switch(app, runner, offset, label):
+    """切换偏移后初始化，再执行 stats rebuild；返回失败信息列表"""
+    from app.core.utils.database import get_db, init_db
+
+    failures = []
+    app.config['STATS_UTC_OFFSET_HOURS'] = offset
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.commit()
+        after_switch = snapshot(conn)
+    result = runner.invoke(args=['stats', 'rebuild'])
+    if result.exit_code != 0:
+        failures.append(f'{label}: stats rebuild 失败: {result.output}')
+    with app.app_context():
+        after_rebuild = snapshot(get_db())
+
+    answered = {}
+    for user_id, _, count, _ in after_switch[0]:
+        answered[user_id] = answered.get(user_id, 0) + count
+    expected = {}
+    for user_id, _, _ in EVENTS:
+        expected[user_id] = expected.get(user_id, 0) + 1
+    if answered != expected:
+        failures.append(f'{label}: 每日作答次数合计 {answered}，应为 {expected}')
+    if after_switch != after_rebuild:
+        failures.append(f'{label}: stats rebuild 改变了统计\n  切换后: {after_switch}\n  重建后: {after_rebuild}')
+    print(f'{label}: {after_switch[0]}')
+    return failures
+
+
+def run_scenario(name, legacy_trigger, offsets):
+    from flask import Flask
+    from app.core.cli import register_cli
+    from app.core.utils.database import get_db, init_db
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['DATABASE_PATH'] = os.path.join(tmp, 'check.db')
+        app.config['STATS_UTC_OFFSET_HOURS'] = 0
+        register_cli(app)
+        runner = app.test_cli_runner()
+        with app.app_context():
+            init_db()
+            conn = get_db()
+            if legacy_trigger:
+                conn.execute('DROP TRIGGER trg_user_stats_events_ai')
+                conn.execute(LEGACY_EVENTS_TRIGGER)
+            conn.executemany('INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                             [(uid, f'check{uid}', 'x') for uid in (101, 102)])
+            conn.execute("INSERT INTO questions (id, content, q_type, answer) VALUES (1, '检查题目', '判断题', '正确')")
+            conn.executemany(
+                'INSERT INTO answer_events (user_id, question_id, is_correct, answered_at) VALUES (?, 1, 1, ?)',
+                [(uid, answered_at) for uid, answered_at, _ in EVENTS]
+            )
+            # 模拟归档：事件移出热表，每日作答次数保留
+            conn.executemany('DELETE FROM answer_events WHERE user_id = ? AND answered_at = ?',
+                             [(uid, answered_at) for uid, answered_at, archived in EVENTS if archived])
+            conn.commit()
+        for offset in offsets:
+            failures += check_switch(app, runner, offset, f'{name} -> {offset:+d}')
+    return failures
+
+
+def main():
+    failures = run_scenario('偏移 +0', False, [8, 0])
+    failures += run_scenario('UTC 分桶（旧触发器）', True, [8])
+    for failure in failures:
+        print(f'[FAIL] {failure}')
+    if failures:
+        sys.exit(1)
+    print('[OK] 时区偏移切换检查通过')
+
+
+if __name__ == '__main__':
+    main()